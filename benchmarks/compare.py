@@ -0,0 +1,46 @@
+"""
+Compares two reports of benchmarks.suite workload by workload.
+
+    python -m benchmarks.compare before.json after.json
+"""
+import argparse
+import json
+
+
+def compare(before, after):
+    """
+    Returns one row per workload found in both reports, with the throughput and p99 ratios of after to before.
+    """
+    old = {(row["target"], row["size"], row["workload"]): row for row in before["results"]}
+    rows = []
+    for row in after["results"]:
+        previous = old.get((row["target"], row["size"], row["workload"]))
+        if previous is None or not previous["ops_per_second"] or not previous["p99_ms"]:
+            continue
+        rows.append({
+            "target": row["target"],
+            "size": row["size"],
+            "workload": row["workload"],
+            "throughput": round(row["ops_per_second"] / previous["ops_per_second"], 3),
+            "p99": round(row["p99_ms"] / previous["p99_ms"], 3),
+        })
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("before")
+    parser.add_argument("after")
+    args = parser.parse_args()
+
+    with open(args.before) as file:
+        before = json.load(file)
+    with open(args.after) as file:
+        after = json.load(file)
+    print(f"{'target':<14}{'size':>8}  {'workload':<14}{'throughput':>12}{'p99':>10}")
+    for row in compare(before, after):
+        print(f"{row['target']:<14}{row['size']:>8}  {row['workload']:<14}{row['throughput']:>11.2f}x{row['p99']:>9.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,7 @@
 from faker import Faker
 from src.main_core import Core
 
-def test_insert(n):
+def generate_users(n=20):
     fake = Faker()
 
     data = []
@@ -20,7 +20,6 @@ def test_insert(n):
         data.append(record)
     return data
 
-db = Core("D:/OOP/NoSQL Database project/db")
-
-for obj in test_insert(20):
-    db.insert("users", obj)
\ No newline at end of file
+if __name__ == "__main__":
+    db = Core("D:/OOP/NoSQL Database project/db")
+    db.insert_many("users", generate_users(20))
\ No newline at end of file
@@ -0,0 +1,211 @@
+"""
+Reproducible benchmarks of Core, the indexed Core and the web server.
+
+    python -m benchmarks.suite --sizes 1000 10000 --ops 200 --output results.json
+    python -m benchmarks.suite --http --concurrency 16 --sizes 1000
+    python -m benchmarks.compare before.json after.json
+
+Every workload runs on a fresh database filled with the same Faker records (seeded), and reports throughput,
+p50/p99 latency of a single operation and the peak memory Python allocated during that workload (traced with
+tracemalloc, which slows the operations down; --no-memory turns it off). The HTTP workloads send their requests
+from --concurrency threads at once, their memory includes the in-process server, whose threads take about 10 MB. The report is JSON, so runs can be diffed.
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import random
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from faker import Faker
+from werkzeug.serving import make_server
+from src.DBWebServer import DBWebServer
+from src.core_with_binary_tree import Core as IndexedCore
+from benchmarks.data import generate_users
+from src.main_core import Core
+
+CORES = {"core": Core, "indexed_core": IndexedCore}
+TABLE = "users"
+
+
+def dataset(size, seed):
+    Faker.seed(seed)
+    return generate_users(size)
+
+
+def percentile(latencies, fraction):
+    ordered = sorted(latencies)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] if ordered else 0.0
+
+
+def timed(operation):
+    start = time.perf_counter()
+    operation()
+    return time.perf_counter() - start
+
+
+def measure(operations, concurrency=1, trace_memory=True):
+    """
+    Runs every operation (a callable) once, from `concurrency` threads at once, and returns the wall time,
+    the latency of every call and the peak of the memory allocated meanwhile in bytes (None if it is not traced).
+    """
+    if trace_memory:
+        tracemalloc.start()  # Only what this workload allocates is traced, so workloads can be compared
+    try:
+        started = time.perf_counter()
+        if concurrency > 1:
+            with ThreadPoolExecutor(max_workers=concurrency) as pool:
+                latencies = list(pool.map(timed, operations))
+        else:
+            latencies = [timed(operation) for operation in operations]
+        seconds = time.perf_counter() - started
+        peak = tracemalloc.get_traced_memory()[1] if trace_memory else None
+    finally:
+        if trace_memory:
+            tracemalloc.stop()
+    return seconds, latencies, peak
+
+
+def report(target, size, workload, seconds, latencies, peak, concurrency=1):
+    return {
+        "target": target,
+        "size": size,
+        "workload": workload,
+        "concurrency": concurrency,
+        "ops": len(latencies),
+        "seconds": round(seconds, 6),
+        "ops_per_second": round(len(latencies) / seconds, 1) if seconds else None,
+        "p50_ms": round(percentile(latencies, 0.5) * 1000, 4),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 4),
+        "peak_memory_kb": peak // 1024 if peak is not None else None,
+    }
+
+
+def core_workloads(db, records, ops, rng):
+    """
+    Yields (workload, operations) in the order they have to run, every workload builds on the table the previous left.
+    """
+    size = len(records)
+    yield "bulk_insert", [lambda: db.insert_many(TABLE, [dict(record) for record in records])]
+    new = [dict(record) for record in records[:ops]]
+    yield "insert", [lambda obj=obj: db.insert(TABLE, obj) for obj in new]
+    yield "point_select", [lambda id=id: db.select(TABLE, f'"id" == {id}') for id in rng.sample(range(1, size + 1), min(ops, size))]
+    yield "scan", [lambda: db.select(TABLE, '"age" != 0') for _ in range(max(1, ops // 50))]  # != is never answered by an index
+    yield "update", [lambda id=id: db.update(TABLE, f'"id" == {id}', {"age": 99}) for id in rng.sample(range(1, size + 1), min(ops, size))]
+    yield "delete", [lambda id=id: db.delete(TABLE, f'"id" == {id}') for id in rng.sample(range(1, size + 1), min(ops, size))]
+    yield "flush", [lambda: db.flush(TABLE)]
+
+
+def http_workloads(url, records, ops, rng):
+    size = len(records)
+
+    def post(path, payload):
+        request = urllib.request.Request(url + path, json.dumps(payload).encode(), {"Content-Type": "application/json"})
+        with urllib.request.urlopen(request) as response:
+            result = json.loads(response.read())
+        if result.get("status") != "success":
+            raise RuntimeError(result.get("message"))
+
+    def get(condition):
+        query = urllib.parse.urlencode({"table": TABLE, "condition": condition})
+        with urllib.request.urlopen(f"{url}/select?{query}") as response:
+            return json.loads(response.read())
+
+    yield "bulk_insert", [lambda: post("/insert_batch", {"table": TABLE, "objects": records})]
+    yield "insert", [lambda obj=obj: post("/insert", {"table": TABLE, "object": obj}) for obj in records[:ops]]
+    yield "point_select", [lambda id=id: get(f'"id" == {id}') for id in rng.sample(range(1, size + 1), min(ops, size))]
+    yield "scan", [lambda: get('"age" != 0') for _ in range(max(1, ops // 50))]
+    yield "update", [lambda id=id: post("/update", {"table": TABLE, "condition": f'"id" == {id}', "updates": {"age": 99}})
+                     for id in rng.sample(range(1, size + 1), min(ops, size))]
+    yield "delete", [lambda id=id: post("/delete", {"table": TABLE, "condition": f'"id" == {id}'})
+                     for id in rng.sample(range(1, size + 1), min(ops, size))]
+
+
+def run_core(name, size, ops, seed, trace_memory=True):
+    records = dataset(size, seed)
+    rng = random.Random(seed)
+    results = []
+    with tempfile.TemporaryDirectory() as db_dir:
+        db = CORES[name](db_dir, compaction_interval=None)
+        try:
+            for workload, operations in core_workloads(db, records, ops, rng):
+                results.append(report(name, size, workload, *measure(operations, trace_memory=trace_memory)))
+        finally:
+            db.close()
+    return results
+
+
+def run_http(size, ops, seed, concurrency=1, trace_memory=True):
+    records = dataset(size, seed)
+    rng = random.Random(seed)
+    results = []
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)  # One access log line per request otherwise
+    with tempfile.TemporaryDirectory() as db_dir:
+        server = DBWebServer(db_dir, core=Core(db_dir, compaction_interval=None))
+        http_server = make_server('127.0.0.1', 0, server.app, threaded=True)
+        thread = threading.Thread(target=http_server.serve_forever, daemon=True)
+        thread.start()
+        try:
+            for workload, operations in http_workloads(f"http://127.0.0.1:{http_server.server_port}", records, ops, rng):
+                measured = measure(operations, concurrency, trace_memory)
+                results.append(report("http", size, workload, *measured, concurrency=concurrency))
+        finally:
+            http_server.shutdown()
+            server.close()
+            server.core.close()
+    return results
+
+
+def run(sizes, ops, seed, targets, http=False, concurrency=1, trace_memory=True):
+    results = []
+    for size in sizes:
+        for name in targets:
+            results.extend(run_core(name, size, ops, seed, trace_memory))
+        if http:
+            results.extend(run_http(size, ops, seed, concurrency, trace_memory))
+    return {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "seed": seed,
+            "ops": ops,
+            "memory_traced": trace_memory,
+            "time": time.strftime('%Y-%m-%dT%H:%M:%S'),
+        },
+        "results": results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs='+', default=[1000, 10000], help="Records in the table")
+    parser.add_argument("--ops", type=int, default=200, help="Operations per workload")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--targets", nargs='+', choices=sorted(CORES), default=sorted(CORES))
+    parser.add_argument("--http", action='store_true', help="Also run the workloads against DBWebServer")
+    parser.add_argument("--concurrency", type=int, default=1, help="Threads sending the HTTP requests at once")
+    parser.add_argument("--no-memory", action='store_true', help="Do not trace memory, it slows the operations down")
+    parser.add_argument("--output", help="Write the JSON report to this file instead of stdout")
+    args = parser.parse_args()
+
+    results = run(args.sizes, args.ops, args.seed, args.targets, args.http, args.concurrency, not args.no_memory)
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent=4)
+    else:
+        print(json.dumps(results, indent=4))
+
+
+if __name__ == "__main__":
+    main()
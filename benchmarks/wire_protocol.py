@@ -0,0 +1,88 @@
+"""
+Throughput of point lookups over the binary wire protocol against the Flask endpoints of DBWebServer.
+
+    python -m benchmarks.wire_protocol --records 100 --requests 5000
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from werkzeug.serving import make_server
+from main import NoSQLDatabase
+from src.DBWebServer import DBWebServer
+from src.wire_client import WireClientPool
+from src.wire_server import WireServer
+
+
+def _http(port, requests, concurrency):
+    def lookup(i):
+        query = urllib.parse.urlencode({"table": "users", "condition": f'"id" == {i}'})
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}/select?{query}") as response:
+            return json.loads(response.read())["data"]
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        results = list(pool.map(lookup, requests))
+    return time.perf_counter() - started, results
+
+
+async def _wire(port, requests, connections, depth):
+    async with WireClientPool(port=port, size=connections) as pool:
+        started = time.perf_counter()
+        results = []
+        for start in range(0, len(requests), depth):
+            results.extend(await pool.execute_many([f'select users where "id" == {i}' for i in requests[start:start + depth]]))
+        return time.perf_counter() - started, results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--records", type=int, default=100, help="Small, so the lookups cost less than the protocol")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=8, help="HTTP client threads and wire connections")
+    parser.add_argument("--depth", type=int, default=256, help="Requests in flight over the wire")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as db_dir:
+        db = NoSQLDatabase(db_dir)
+        db.insert_many("users", [{"name": f"user {i}", "age": i % 60 + 18} for i in range(args.records)])
+        requests = [i % args.records + 1 for i in range(0, args.requests * 7919, 7919)]
+
+        web = DBWebServer(db_dir, core=db.core)
+        http_server = make_server('127.0.0.1', 0, web.app, threaded=True)
+        threading.Thread(target=http_server.serve_forever, daemon=True).start()
+        http_time, http_results = _http(http_server.server_port, requests, args.concurrency)
+        http_server.shutdown()
+        web.close()
+
+        async def run_wire():
+            server = WireServer(db, port=0)
+            await server.start()
+            try:
+                return await _wire(server.port, requests, args.concurrency, args.depth)
+            finally:
+                await server.close()
+        wire_time, wire_results = asyncio.run(run_wire())
+        db.core.close()
+
+    assert http_results == wire_results
+    print(json.dumps({
+        "requests": args.requests,
+        "http_requests_per_second": round(args.requests / http_time),
+        "wire_requests_per_second": round(args.requests / wire_time),
+        "speedup": round(http_time / wire_time, 2),
+    }, indent=4))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,8 @@
 from src.main_core import Core
 from src.query_language import QueryExecutor
 from src.DBWebServer import DBWebServer
+from src.async_server import AsyncDBServer
+from src.wire_server import WireServer
 
 class NoSQLDatabase:
     """
@@ -11,35 +13,66 @@ class NoSQLDatabase:
 
     Attributes:
         db_dir (str): The directory where the database files will be stored.
+        cache_bytes (int): Memory budget of the table cache, None disables it.
+        cache_flush_interval (float): How often the cache writes changes back to disk, None to only write back on flush and close.
+        wal (bool): Log every change to a write-ahead log first, so acknowledged writes survive a crash.
+        result_cache_records (int): How many records the cached select results may hold, None disables the result cache.
 
     Methods:
         insert(object): Inserts a new object into the database.
+        insert_many(objects): Inserts a batch of objects into the database with a single write.
         select(query): Retrieves documents from the database based on a query.
+        iter_select(query): Lazily iterates over the documents matching a query.
+        select_page(query): Retrieves one page of documents and the cursor of the next page.
         update(query, update): Updates documents in the database based on a query and an update.
         delete(query): Deletes documents from the database based on a query.
+        explain(query): Returns the plan the database would use to answer a query.
+        close(): Writes back everything that is only in memory and stops the background threads.
     """
-    def __init__(self, db_dir):
-        self.core = Core(db_dir)
+    def __init__(self, db_dir, cache_bytes=None, cache_flush_interval=None, wal=False, result_cache_records=None):
+        self.core = Core(db_dir, cache_bytes=cache_bytes, cache_flush_interval=cache_flush_interval, wal=wal,
+                         result_cache_records=result_cache_records)
 
     def insert(self, table_name, obj):
         self.core.insert(table_name, obj)
 
+    def insert_many(self, table_name, objs):
+        self.core.insert_many(table_name, objs)
+
     def update(self, table_name, updates, condition):
         self.core.update(table_name, condition, updates)
 
     def select(self, table_name, condition):
         return self.core.select(table_name, condition)
 
+    def iter_select(self, table_name, condition, limit=None, offset=0, cursor=None):
+        return self.core.iter_select(table_name, condition, limit, offset, cursor)
+
+    def select_page(self, table_name, condition, limit=100, offset=0, cursor=None):
+        return self.core.select_page(table_name, condition, limit, offset, cursor)
+
     def delete(self, table_name, condition):
         self.core.delete(table_name, condition)
 
+    def explain(self, table_name, condition):
+        return self.core.explain(table_name, condition)
+
     def flush(self, table_name):
         self.core.flush(table_name)
 
+    def close(self):
+        self.core.close()
+
     def start_server(self):
-        server = DBWebServer(self.core.db_path)
+        server = DBWebServer(self.core.db_path, core=self.core)
         server.app.run(host=server.host, port=server.port)
 
+    def start_async_server(self, port=5001):
+        AsyncDBServer(self.core.db_path, port=port, core=self.core).run()
+
+    def start_wire_server(self, port=5002):
+        WireServer(self, port=port).run()
+
 
 if __name__ == "__main__":
     db = NoSQLDatabase('D:/OOP/NoSQL Database project/db')
@@ -50,7 +83,7 @@ if __name__ == "__main__":
 
     # Testing 'select' method - approved
     print(executor.execute('select users where "name" == "Oleksandr Kolko"'))
-    #print(executor.execute('select users1 where "degree" == "true"'))
+    #print(executor.execute('select users1 where "degree" == true'))
     #print(executor.execute('select users where "email" == "johndoe23@example.com"'))
     #print(executor.execute('select users1 where "id" == 644'))
 
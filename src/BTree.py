@@ -1,65 +1,248 @@
-class Node:
-    def __init__(self, key, borders: dict):
-        self.key = key
-        self.borders = borders
-        self.left = None
-        self.right = None
-
-class BTS:
+import json
+import os
+from bisect import bisect_left, bisect_right
+
+DEFAULT_ORDER = 64  # Maximum number of keys in one node
+
+
+def _sort_key(value):
+    """
+    Wraps a key so that values of different types (numbers, strings, null) can live in the same tree.
+    """
+    if value is None:
+        return (0, 0)
+    if isinstance(value, (bool, int, float)):
+        return (1, value)
+    if isinstance(value, str):
+        return (2, value)
+    return (3, json.dumps(value, sort_keys=True))
+
+
+def _original_key(key):
+    if key[0] == 0:
+        return None
+    if key[0] == 3:
+        return json.loads(key[1])
+    return key[1]
+
+
+class _Leaf:
+    __slots__ = ('keys', 'values', 'next')
+    leaf = True
+
     def __init__(self):
-        self.root = None
-
-    def find(self, node, value):
-        current = node
-        while current is not None:
-            if value == current.key:
-                return current, True
-            elif value < current.key:
-                if current.left is None:
-                    return current, False
-                current = current.left
-            else:
-                if current.right is None:
-                    return current, False
-                current = current.right
-        return None, False
-
-    def append(self, obj):
-        if self.root is None:
-            self.root = obj
-            return
-        node, fl_find = self.find(self.root, obj.key)
-        if fl_find:
-            node.borders +=(obj.borders)
-        elif not fl_find and node:
-            if obj.key < node.key:
-                node.left = obj
-            else:
-                node.right = obj
-
-    def search(self, value):
-        current = self.root
-        while current is not None:
-            if value == current.key:
-                return current.borders
-            elif value < current.key:
-                current = current.left
-            else:
-                current = current.right
+        self.keys = []
+        self.values = []  # values[i] is the list of borders stored under keys[i]
+        self.next = None
+
+
+class _Internal:
+    __slots__ = ('keys', 'children')
+    leaf = False
+
+    def __init__(self):
+        self.keys = []
+        self.children = []
+
+
+class BPlusTree:
+    """
+    A B+ tree that maps a key to the list of borders of the records holding that key.
+    Nodes have a high fan-out and leaves are linked, so lookups stay O(log n) whatever order the keys arrive in
+    and range scans only walk the leaves. The tree can be saved next to the table and loaded back without a rebuild.
+    args:
+    order (int): The maximum number of keys in one node
+    """
+    def __init__(self, order=DEFAULT_ORDER):
+        self.order = order
+        self.root = _Leaf()
+        self.size = 0
+        self.meta = {}
+
+    def __len__(self):
+        return self.size
+
+    def insert(self, key, value):
+        split = self._insert(self.root, _sort_key(key), value)
+        if split:
+            separator, right = split
+            root = _Internal()
+            root.keys = [separator]
+            root.children = [self.root, right]
+            self.root = root
+
+    def remove(self, key, value):
+        """
+        Removes one border from the key, the key itself is dropped once it has no borders left.
+        Nodes are not merged after a removal, an emptied leaf simply stays in the chain until the tree is rebuilt.
+        """
+        key = _sort_key(key)
+        leaf = self._find_leaf(key)
+        i = bisect_left(leaf.keys, key)
+        if i == len(leaf.keys) or leaf.keys[i] != key or value not in leaf.values[i]:
+            return False
+        leaf.values[i].remove(value)
+        if not leaf.values[i]:
+            del leaf.keys[i]
+            del leaf.values[i]
+            self.size -= 1
+        return True
+
+    def search(self, key):
+        key = _sort_key(key)
+        leaf = self._find_leaf(key)
+        i = bisect_left(leaf.keys, key)
+        if i < len(leaf.keys) and leaf.keys[i] == key:
+            return leaf.values[i]
         return None
 
+    def range(self, low=None, high=None, include_low=True, include_high=True):
+        """
+        Yields (key, borders) for every key between low and high in ascending order. None means unbounded.
+        A range with a single bound stays within the type of that bound, so `> 30` never yields strings.
+        """
+        if low is None and high is None:
+            low_key, high_key = None, None
+        elif low is None:
+            high_key = _sort_key(high)
+            low_key, include_low = (high_key[0],), True  # The smallest key of the same type
+        elif high is None:
+            low_key = _sort_key(low)
+            high_key, include_high = (low_key[0] + 1,), False  # The smallest key of the next type
+        else:
+            low_key, high_key = _sort_key(low), _sort_key(high)
+
+        if low_key is None:
+            leaf = self._leftmost_leaf()
+            i = 0
+        else:
+            leaf = self._find_leaf(low_key)
+            i = bisect_left(leaf.keys, low_key) if include_low else bisect_right(leaf.keys, low_key)
+
+        while leaf is not None:
+            while i < len(leaf.keys):
+                key = leaf.keys[i]
+                if high_key is not None and (key > high_key or (key == high_key and not include_high)):
+                    return
+                yield _original_key(key), leaf.values[i]
+                i += 1
+            leaf = leaf.next
+            i = 0
+
+    def items(self):
+        return self.range()
+
     def show(self):
-        if self.root is None:
-            return
-        result = []
-        stack = []
-        current = self.root
-        while stack or current:
-            while current is not None:
-                stack.append(current)
-                current = current.left
-            current = stack.pop()
-            result.append((current.key, current.borders))
-            current = current.right
-        for key, borders in result:
-            print(key, borders)
\ No newline at end of file
+        for key, borders in self.items():
+            print(key, borders)
+
+    def save(self, path, meta=None):
+        data = {
+            "order": self.order,
+            "meta": meta or {},
+            "items": [[key, borders] for key, borders in self.items()],
+        }
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w') as file:
+            json.dump(data, file)
+        os.replace(tmp_path, path)
+        self.meta = data["meta"]
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'r') as file:
+            data = json.load(file)
+        items = [(key, [tuple(border) for border in borders]) for key, borders in data["items"]]
+        tree = cls.bulk_load(items, order=data["order"])
+        tree.meta = data["meta"]
+        return tree
+
+    @classmethod
+    def bulk_load(cls, items, order=DEFAULT_ORDER):
+        """
+        Builds the tree bottom-up from (key, borders) pairs that are already sorted by key.
+        """
+        tree = cls(order)
+        leaves = []
+        for key, borders in items:
+            if not leaves or len(leaves[-1].keys) >= order:
+                leaf = _Leaf()
+                if leaves:
+                    leaves[-1].next = leaf
+                leaves.append(leaf)
+            leaves[-1].keys.append(_sort_key(key))
+            leaves[-1].values.append(list(borders))
+            tree.size += 1
+        if not leaves:
+            return tree
+
+        level = [(leaf.keys[0], leaf) for leaf in leaves]
+        while len(level) > 1:
+            parents = []
+            for start in range(0, len(level), order + 1):
+                group = level[start:start + order + 1]
+                node = _Internal()
+                node.keys = [first_key for first_key, _ in group[1:]]
+                node.children = [child for _, child in group]
+                parents.append((group[0][0], node))
+            level = parents
+        tree.root = level[0][1]
+        return tree
+
+    def _find_leaf(self, key):
+        node = self.root
+        while not node.leaf:
+            node = node.children[bisect_right(node.keys, key)]
+        return node
+
+    def _leftmost_leaf(self):
+        node = self.root
+        while not node.leaf:
+            node = node.children[0]
+        return node
+
+    def _insert(self, node, key, value):
+        if node.leaf:
+            i = bisect_left(node.keys, key)
+            if i < len(node.keys) and node.keys[i] == key:
+                node.values[i].append(value)
+                return None
+            node.keys.insert(i, key)
+            node.values.insert(i, [value])
+            self.size += 1
+            if len(node.keys) > self.order:
+                return self._split_leaf(node)
+            return None
+
+        i = bisect_right(node.keys, key)
+        split = self._insert(node.children[i], key, value)
+        if split:
+            separator, right = split
+            node.keys.insert(i, separator)
+            node.children.insert(i + 1, right)
+            if len(node.keys) > self.order:
+                return self._split_internal(node)
+        return None
+
+    @staticmethod
+    def _split_leaf(node):
+        middle = len(node.keys) // 2
+        right = _Leaf()
+        right.keys = node.keys[middle:]
+        right.values = node.values[middle:]
+        right.next = node.next
+        node.keys = node.keys[:middle]
+        node.values = node.values[:middle]
+        node.next = right
+        return right.keys[0], right
+
+    @staticmethod
+    def _split_internal(node):
+        middle = len(node.keys) // 2
+        separator = node.keys[middle]
+        right = _Internal()
+        right.keys = node.keys[middle + 1:]
+        right.children = node.children[middle + 1:]
+        node.keys = node.keys[:middle]
+        node.children = node.children[:middle + 1]
+        return separator, right
@@ -1,7 +1,12 @@
+import json
 import logging
-from flask import Flask, request, jsonify, render_template_string
+import os
+from flask import Flask, Response, request, jsonify, stream_with_context
+from markupsafe import escape
+from src.constants import SERVER_LOG_SAMPLE_RATE
 from src.main_core import Core
-from logging.handlers import RotatingFileHandler
+from src.metrics import metrics
+from src.request_log import RequestLog
 
 class DBWebServer:
     """
@@ -11,24 +16,29 @@ class DBWebServer:
     db_path (str): The path to the directory where the database will be stored.
     host (str): The host address for the web server. Default is '127.0.0.1'.
     port (int): The port number for the web server. Default is 5000.
+    cache_bytes (int): Memory budget of the table cache of the core, None disables the cache.
+    core (Core): An existing core to serve, instead of creating a new one for db_path.
+    log_file (str): The path to the request log. Default is server_logs/db_web_server.log in db_path.
+    log_sample_rate (float): Share of the successful requests that are logged, errors are always logged.
+    result_cache_records (int): How many records the select result cache of the core may hold, None disables it.
     """
-    def __init__(self, db_path, host='127.0.0.1', port=5000):
-        self.core = Core(db_path=db_path)
+    def __init__(self, db_path, host='127.0.0.1', port=5000, cache_bytes=None, core=None, log_file=None,
+                 log_sample_rate=SERVER_LOG_SAMPLE_RATE, result_cache_records=None):
+        self.core = core if core is not None else Core(db_path=db_path, cache_bytes=cache_bytes,
+                                                       result_cache_records=result_cache_records)
         self.app = Flask(__name__)
         self.host = host
         self.port = port
+        self.log_file = log_file or os.path.join(db_path, 'server_logs', 'db_web_server.log')
+        self.log_sample_rate = log_sample_rate
         self._setup_logging()
         self._setup_routes()
 
     def _setup_logging(self):
-            log_file = 'D:/OOP/NoSQL Database project/server_logs/db_web_server.log'
-            handler = RotatingFileHandler(log_file, maxBytes=10000, backupCount=1)
-            handler.setLevel(logging.INFO)
-            formatter = logging.Formatter('%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]')
-            handler.setFormatter(formatter)
-            self.app.logger.addHandler(handler)
-            self.app.logger.setLevel(logging.INFO)
-            self.app.logger.info("Logging is set up.")
+        # Not registered with logging.getLogger: the handlers of one server must not see the requests of another
+        self.logger = logging.Logger(f"{__name__}.requests")
+        self.log = RequestLog(self.logger, self.log_file, sample_rate=self.log_sample_rate)
+        self.logger.info("Logging is set up.")
 
     def _setup_routes(self):
         @self.app.route('/')
@@ -42,35 +52,77 @@ class DBWebServer:
             obj = data.get('object')
             try:
                 self.core.insert(table, obj)
-                self.app.logger.info(f"Inserted into table {table}: {obj}")
+                self.log.success("Inserted into table %s", table, table=table, object=obj)
                 return jsonify({"status": "success"})
             except Exception as e:
-                self.app.logger.error(f"Error inserting into table {table}: {e}")
+                self.log.error("Error inserting into table %s: %s", table, e, table=table, object=obj)
+                return jsonify({"status": "error", "message": str(e)})
+
+        @self.app.route('/insert_batch', methods=['POST'])
+        def insert_batch():
+            data = request.get_json()
+            table = data.get('table')
+            objects = data.get('objects')
+            try:
+                self.core.insert_many(table, objects)
+                self.log.success("Inserted %s objects into table %s", len(objects), table, table=table, count=len(objects))
+                return jsonify({"status": "success", "count": len(objects)})
+            except Exception as e:
+                self.log.error("Error inserting batch into table %s: %s", table, e, table=table)
                 return jsonify({"status": "error", "message": str(e)})
 
         @self.app.route('/select', methods=['GET'])
         def select():
             table = request.args.get('table')
             condition = request.args.get('condition')
+            limit = request.args.get('limit', type=int)
+            if condition is None:
+                return self._missing_condition()
             try:
-                result = self.core.select(table, condition)
-                self.app.logger.info(f"Selected from table {table} with condition {condition}: success")
-                return jsonify({"status": "success", "data": result})
+                if limit is None:
+                    result = self.core.select(table, condition)
+                    self.log.success("Selected from table %s", table, table=table, condition=condition, count=len(result))
+                    return jsonify({"status": "success", "data": result})
+
+                result, cursor = self.core.select_page(table, condition, limit, request.args.get('offset', 0, type=int),
+                                                       request.args.get('cursor'))
+                self.log.success("Selected a page from table %s", table, table=table, condition=condition, count=len(result))
+                return jsonify({"status": "success", "data": result, "cursor": cursor})
             except Exception as e:
-                self.app.logger.error(f"Error selecting from table {table} with condition {condition}: {e}")
+                self.log.error("Error selecting from table %s: %s", table, e, table=table, condition=condition)
                 return jsonify({"status": "error", "message": str(e)})
 
+        @self.app.route('/select_stream', methods=['GET'])
+        def select_stream():
+            table = request.args.get('table')
+            condition = request.args.get('condition')
+            if condition is None:
+                return self._missing_condition()
+            try:
+                rows = self._iter_select(table, condition)
+                self.log.success("Streaming from table %s", table, table=table, condition=condition)
+            except Exception as e:
+                self.log.error("Error selecting from table %s: %s", table, e, table=table, condition=condition)
+                return jsonify({"status": "error", "message": str(e)})
+
+            def generate():
+                for row in rows:
+                    yield json.dumps(row) + '\n'
+            return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
         @self.app.route('/select_html', methods=['GET'])
         def select_html():
             table = request.args.get('table')
             condition = request.args.get('condition')
+            if condition is None:
+                return "<h1>Error: Missing condition</h1>", 400
             try:
-                result = self.core.select(table, condition)
-                self.app.logger.info(f"Selected from table {table} with condition {condition}: success")
-                return render_template_string(self._generate_html(result))
+                rows = self._iter_select(table, condition)
+                self.log.success("Selected from table %s", table, table=table, condition=condition)
+                return Response(stream_with_context(self._generate_html(rows)), mimetype='text/html')
             except Exception as e:
-                self.app.logger.error(f"Error selecting from table {table} with condition {condition}: {e}")
-                return render_template_string(f"<h1>Error: {str(e)}</h1>")
+                self.log.error("Error selecting from table %s: %s", table, e, table=table, condition=condition)
+                return f"<h1>Error: {escape(str(e))}</h1>"
 
         @self.app.route('/update', methods=['POST'])
         def update():
@@ -80,10 +132,10 @@ class DBWebServer:
             updates = data.get('updates')
             try:
                 self.core.update(table, condition, updates)
-                self.app.logger.info(f"Updated table {table} with condition {condition} and updates {updates}: success")
+                self.log.success("Updated table %s", table, table=table, condition=condition, updates=updates)
                 return jsonify({"status": "success"})
             except Exception as e:
-                self.app.logger.error(f"Error updating table {table} with condition {condition} and updates {updates}: {e}")
+                self.log.error("Error updating table %s: %s", table, e, table=table, condition=condition, updates=updates)
                 return jsonify({"status": "error", "message": str(e)})
 
         @self.app.route('/delete', methods=['POST'])
@@ -93,14 +145,46 @@ class DBWebServer:
             condition = data.get('condition')
             try:
                 self.core.delete(table, condition)
-                self.app.logger.info(f"Deleted from table {table} with condition {condition}: success")
+                self.log.success("Deleted from table %s", table, table=table, condition=condition)
                 return jsonify({"status": "success"})
             except Exception as e:
-                self.app.logger.error(f"Error deleting from table {table} with condition {condition}: {e}")
+                self.log.error("Error deleting from table %s: %s", table, e, table=table, condition=condition)
                 return jsonify({"status": "error", "message": str(e)})
 
-    def _generate_html(self, data):
-        html = """
+        @self.app.route('/metrics', methods=['GET'])
+        def get_metrics():
+            if request.args.get('format') == 'json':
+                return jsonify(metrics.snapshot())
+            return Response(metrics.to_prometheus(), mimetype='text/plain; version=0.0.4')
+
+        @self.app.route('/profile', methods=['POST'])
+        def profile():
+            """
+            {"enabled": true} starts profiling the database calls, {"enabled": false} stops it and returns the report.
+            """
+            if (request.get_json(silent=True) or {}).get('enabled'):
+                metrics.start_profiling()
+                return jsonify({"status": "success"})
+            return jsonify({"status": "success", "report": metrics.stop_profiling()})
+
+    def _missing_condition(self):
+        """
+        Rejects a select without a condition, instead of failing on it deep in the parser.
+        """
+        return jsonify({"status": "error", "message": "Missing condition, pass the records to select as the condition argument"}), 400
+
+    def _iter_select(self, table, condition):
+        """
+        Returns the lazy result of a select, paged by the limit, offset and cursor arguments of the request.
+        """
+        return self.core.iter_select(table, condition, request.args.get('limit', type=int),
+                                     request.args.get('offset', 0, type=int), request.args.get('cursor'))
+
+    def _generate_html(self, rows):
+        """
+        Yields the result page in chunks, so the rows are rendered as they are read.
+        """
+        yield """
         <!DOCTYPE html>
         <html>
         <head>
@@ -109,26 +193,30 @@ class DBWebServer:
         <body>
             <h1>Results</h1>
             <table border="1">
-                <tr>
-                    {headers}
-                </tr>
-                {rows}
+        """
+
+        headers = None
+        for row in rows:
+            if headers is None:
+                headers = list(row.keys())
+                yield "<tr>" + "".join([f"<th>{escape(key)}</th>" for key in headers]) + "</tr>"
+            yield "<tr>" + "".join([f"<td>{escape(row.get(key))}</td>" for key in headers]) + "</tr>"
+
+        yield """
             </table>
         </body>
         </html>
         """
 
-        if not data:
-            return html.format(headers="", rows="")
-
-        headers = "".join([f"<th>{key}</th>" for key in data[0].keys()])
-        rows = "".join(["<tr>" + "".join([f"<td>{value}</td>" for value in row.values()]) + "</tr>" for row in data])
-
-        return html.format(headers=headers, rows=rows)
-
     def run(self):
         self.app.run(debug=True, host=self.host, port=self.port)
 
+    def close(self):
+        """
+        Writes out the request log. The core is left open, it may be shared with other servers.
+        """
+        self.log.close()
+
 if __name__ == "__main__":
     db_server = DBWebServer('D:/OOP/NoSQL Database project/db')
     db_server.run()
@@ -0,0 +1,114 @@
+import asyncio
+import json
+from urllib.parse import urlencode
+
+
+class AsyncDBClient:
+    """
+    Asyncio client of AsyncDBServer (and of the JSON API of DBWebServer). Connections are kept alive and reused:
+    a request takes an idle connection from the pool or opens a new one while fewer than `max_connections` are open,
+    otherwise it waits for one to be returned.
+    A request that fails with {"status": "error"} raises ValueError with the message of the server.
+    Only a select is retried when a reused connection turns out to be closed, a write may already have been applied.
+    args:
+    host (str): The host of the server
+    port (int): The port of the server
+    max_connections (int): How many connections the client opens at most
+    """
+    def __init__(self, host='127.0.0.1', port=5001, max_connections=10) -> None:
+        self.host = host
+        self.port = port
+        self.max_connections = max_connections
+        self._idle = []
+        self._slots = asyncio.Semaphore(max_connections)
+
+    async def insert(self, table_name, obj):
+        await self._request('POST', '/insert', {"table": table_name, "object": obj})
+
+    async def insert_many(self, table_name, objs):
+        return (await self._request('POST', '/insert_batch', {"table": table_name, "objects": objs}))["count"]
+
+    async def select(self, table_name, condition):
+        return (await self._request('GET', '/select?' + urlencode({"table": table_name, "condition": condition})))["data"]
+
+    async def select_page(self, table_name, condition, limit=100, offset=0, cursor=None):
+        args = {"table": table_name, "condition": condition, "limit": limit, "offset": offset}
+        if cursor is not None:
+            args["cursor"] = cursor
+        response = await self._request('GET', '/select?' + urlencode(args))
+        return response["data"], response["cursor"]
+
+    async def update(self, table_name, condition, updates):
+        await self._request('POST', '/update', {"table": table_name, "condition": condition, "updates": updates})
+
+    async def delete(self, table_name, condition):
+        await self._request('POST', '/delete', {"table": table_name, "condition": condition})
+
+    async def close(self):
+        idle, self._idle = self._idle, []
+        for _, writer in idle:
+            writer.close()
+        for _, writer in idle:
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def _request(self, method, target, payload=None):
+        async with self._slots:
+            connection = self._idle_connection()
+            retry = connection is not None and method == 'GET'
+            while True:
+                if connection is None:
+                    connection = await asyncio.open_connection(self.host, self.port)
+                try:
+                    response, keep_alive = await self._exchange(*connection, method, target, payload)
+                    break
+                except (ConnectionError, asyncio.IncompleteReadError):
+                    connection[1].close()
+                    connection = None
+                    if not retry:
+                        raise
+                    retry = False  # The server closed the idle connection meanwhile, retry once on a new one
+            if keep_alive:
+                self._idle.append(connection)
+            else:
+                connection[1].close()
+
+        if response.get("status") != "success":
+            raise ValueError(response.get("message"))
+        return response
+
+    def _idle_connection(self):
+        """
+        Returns an idle connection the server has not closed yet, or None if there is none.
+        """
+        while self._idle:
+            reader, writer = self._idle.pop()
+            if not reader.at_eof() and not writer.is_closing():
+                return reader, writer
+            writer.close()
+        return None
+
+    async def _exchange(self, reader, writer, method, target, payload):
+        body = json.dumps(payload).encode() if payload is not None else b''
+        writer.write((f"{method} {target} HTTP/1.1\r\n"
+                      f"Host: {self.host}:{self.port}\r\n"
+                      f"Content-Type: application/json\r\n"
+                      f"Content-Length: {len(body)}\r\n\r\n").encode() + body)
+        await writer.drain()
+
+        head = (await reader.readuntil(b'\r\n\r\n')).decode('latin-1').split('\r\n')
+        headers = {}
+        for line in head[1:]:
+            if line:
+                name, _, value = line.partition(':')
+                headers[name.strip().lower()] = value.strip()
+        response = json.loads(await reader.readexactly(int(headers.get('content-length', 0))))
+        return response, headers.get('connection', '').lower() != 'close'
@@ -0,0 +1,48 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from src.constants import ASYNC_WORKERS
+
+
+class AsyncCore:
+    """
+    Asyncio facade of a Core. Every call runs the blocking Core method on a bounded pool of threads,
+    so the event loop keeps serving other connections while a request waits for the disk.
+    The Core does its own locking, reads of the same table run in parallel and writes wait for each other.
+    args:
+    core (Core): The core the calls are forwarded to
+    workers (int): Size of the thread pool, the number of Core calls that can run at once
+    """
+    def __init__(self, core, workers=ASYNC_WORKERS) -> None:
+        self.core = core
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='core')
+
+    async def insert(self, table_name, obj):
+        return await self._run(self.core.insert, table_name, obj)
+
+    async def insert_many(self, table_name, objs):
+        return await self._run(self.core.insert_many, table_name, objs)
+
+    async def select(self, table_name, condition):
+        return await self._run(self.core.select, table_name, condition)
+
+    async def select_page(self, table_name, condition, limit=100, offset=0, cursor=None):
+        return await self._run(self.core.select_page, table_name, condition, limit, offset, cursor)
+
+    async def update(self, table_name, condition, updates):
+        return await self._run(self.core.update, table_name, condition, updates)
+
+    async def delete(self, table_name, condition):
+        return await self._run(self.core.delete, table_name, condition)
+
+    async def explain(self, table_name, condition):
+        return await self._run(self.core.explain, table_name, condition)
+
+    async def flush(self, table_name):
+        return await self._run(self.core.flush, table_name)
+
+    def close(self):
+        self.executor.shutdown()
+
+    async def _run(self, method, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, partial(method, *args))
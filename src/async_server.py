@@ -0,0 +1,225 @@
+import asyncio
+import json
+import logging
+from urllib.parse import parse_qsl, urlsplit
+from src.async_core import AsyncCore
+from src.constants import ASYNC_WORKERS, MAX_REQUEST_BYTES
+from src.main_core import Core
+
+logger = logging.getLogger(__name__)
+
+_REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed", 413: "Payload Too Large"}
+
+
+class HttpError(Exception):
+    def __init__(self, status, message) -> None:
+        super().__init__(message)
+        self.status = status
+
+
+class AsyncDBServer:
+    """
+    Serves the same /insert, /insert_batch, /select, /update and /delete operations as DBWebServer with the same
+    JSON bodies, but on a single asyncio event loop instead of a thread per request. A connection costs a
+    coroutine and its buffers, so tens of thousands of idle keep-alive connections fit into one process;
+    the Core calls run on the bounded thread pool of an AsyncCore.
+
+    Args:
+    db_path (str): The path to the directory where the database will be stored.
+    host (str): The host address for the server. Default is '127.0.0.1'.
+    port (int): The port number for the server, 0 picks a free one. Default is 5001.
+    cache_bytes (int): Memory budget of the table cache of the core, None disables the cache.
+    core (Core): An existing core to serve, instead of creating a new one for db_path.
+    workers (int): Number of Core calls that can run at once.
+    """
+    def __init__(self, db_path, host='127.0.0.1', port=5001, cache_bytes=None, core=None, workers=ASYNC_WORKERS):
+        self.core = core if core is not None else Core(db_path=db_path, cache_bytes=cache_bytes)
+        self.db = AsyncCore(self.core, workers)
+        self.host = host
+        self.port = port
+        self.server = None
+        self.routes = {
+            ('GET', '/'): self._index,
+            ('POST', '/insert'): self._insert,
+            ('POST', '/insert_batch'): self._insert_batch,
+            ('GET', '/select'): self._select,
+            ('POST', '/update'): self._update,
+            ('POST', '/delete'): self._delete,
+        }
+
+    async def start(self):
+        self.server = await asyncio.start_server(self._serve_connection, self.host, self.port, backlog=4096)
+        self.port = self.server.sockets[0].getsockname()[1]
+        logger.info("Serving on %s:%s", self.host, self.port)
+        return self.server
+
+    async def serve_forever(self):
+        if self.server is None:
+            await self.start()
+        async with self.server:
+            await self.server.serve_forever()
+
+    async def close(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+            self.server = None
+        self.db.close()
+
+    def run(self):
+        asyncio.run(self.serve_forever())
+
+    async def _serve_connection(self, reader, writer):
+        """
+        Answers the requests of one keep-alive connection in order until the client closes it.
+        """
+        try:
+            while True:
+                try:
+                    request = await self._read_request(reader)
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    break
+                except HttpError as e:
+                    writer.write(self._response(e.status, {"status": "error", "message": str(e)}, keep_alive=False))
+                    await writer.drain()
+                    break
+                if request is None:
+                    break
+                method, target, headers, body = request
+                status, payload = await self._dispatch(method, target, body)
+                keep_alive = headers.get('connection', '').lower() != 'close'
+                writer.write(self._response(status, payload, keep_alive))
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def _read_request(reader):
+        try:
+            head = await reader.readuntil(b'\r\n\r\n')
+        except asyncio.IncompleteReadError as e:
+            if not e.partial:
+                return None  # The client closed an idle connection
+            raise
+        except asyncio.LimitOverrunError:
+            raise HttpError(413, "Request headers are too large")
+
+        lines = head.decode('latin-1').split('\r\n')
+        try:
+            method, target, _ = lines[0].split(' ', 2)
+        except ValueError:
+            raise HttpError(400, "Malformed request line")
+        headers = {}
+        for line in lines[1:]:
+            if line:
+                name, _, value = line.partition(':')
+                headers[name.strip().lower()] = value.strip()
+
+        try:
+            length = int(headers.get('content-length', 0) or 0)
+        except ValueError:
+            raise HttpError(400, "Invalid Content-Length")
+        if length < 0:
+            raise HttpError(400, "Invalid Content-Length")
+        if length > MAX_REQUEST_BYTES:
+            raise HttpError(413, "Request body is too large")
+        body = await reader.readexactly(length) if length else b''
+        return method, target, headers, body
+
+    async def _dispatch(self, method, target, body):
+        url = urlsplit(target)
+        handler = self.routes.get((method, url.path))
+        if handler is None:
+            if any(path == url.path for _, path in self.routes):
+                return 405, {"status": "error", "message": f"Method {method} is not allowed"}
+            return 404, {"status": "error", "message": f"No route {url.path}"}
+        try:
+            data = json.loads(body) if body else {}
+        except ValueError:
+            return 400, {"status": "error", "message": "The body is not valid JSON"}
+        if not isinstance(data, dict):
+            return 400, {"status": "error", "message": "The body must be a JSON object"}
+        return 200, await handler(data, dict(parse_qsl(url.query)))
+
+    async def _index(self, data, args):
+        return {"status": "success", "message": "Welcome to the NoSQL Database Server!"}
+
+    async def _insert(self, data, args):
+        table = data.get('table')
+        obj = data.get('object')
+        try:
+            await self.db.insert(table, obj)
+            logger.info("Inserted into table %s: %s", table, obj)
+            return {"status": "success"}
+        except Exception as e:
+            logger.error("Error inserting into table %s: %s", table, e)
+            return {"status": "error", "message": str(e)}
+
+    async def _insert_batch(self, data, args):
+        table = data.get('table')
+        objects = data.get('objects')
+        try:
+            await self.db.insert_many(table, objects)
+            logger.info("Inserted %s objects into table %s", len(objects), table)
+            return {"status": "success", "count": len(objects)}
+        except Exception as e:
+            logger.error("Error inserting batch into table %s: %s", table, e)
+            return {"status": "error", "message": str(e)}
+
+    async def _select(self, data, args):
+        table = args.get('table')
+        condition = args.get('condition')
+        try:
+            if args.get('limit') is None:
+                result = await self.db.select(table, condition)
+                logger.info("Selected from table %s with condition %s: success", table, condition)
+                return {"status": "success", "data": result}
+
+            result, cursor = await self.db.select_page(table, condition, int(args['limit']), int(args.get('offset', 0)),
+                                                       args.get('cursor'))
+            logger.info("Selected a page from table %s with condition %s: success", table, condition)
+            return {"status": "success", "data": result, "cursor": cursor}
+        except Exception as e:
+            logger.error("Error selecting from table %s with condition %s: %s", table, condition, e)
+            return {"status": "error", "message": str(e)}
+
+    async def _update(self, data, args):
+        table = data.get('table')
+        condition = data.get('condition')
+        updates = data.get('updates')
+        try:
+            await self.db.update(table, condition, updates)
+            logger.info("Updated table %s with condition %s and updates %s: success", table, condition, updates)
+            return {"status": "success"}
+        except Exception as e:
+            logger.error("Error updating table %s with condition %s and updates %s: %s", table, condition, updates, e)
+            return {"status": "error", "message": str(e)}
+
+    async def _delete(self, data, args):
+        table = data.get('table')
+        condition = data.get('condition')
+        try:
+            await self.db.delete(table, condition)
+            logger.info("Deleted from table %s with condition %s: success", table, condition)
+            return {"status": "success"}
+        except Exception as e:
+            logger.error("Error deleting from table %s with condition %s: %s", table, condition, e)
+            return {"status": "error", "message": str(e)}
+
+    @staticmethod
+    def _response(status, payload, keep_alive=True):
+        body = json.dumps(payload).encode()
+        head = (f"HTTP/1.1 {status} {_REASONS[status]}\r\n"
+                f"Content-Type: application/json\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n")
+        return head.encode() + body
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    AsyncDBServer('D:/OOP/NoSQL Database project/db').run()
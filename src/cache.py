@@ -0,0 +1,156 @@
+import json
+from collections import OrderedDict
+from copy import deepcopy
+from threading import Event, RLock, Thread
+from src.metrics import metrics
+
+
+class _CachedTable:
+    __slots__ = ('records', 'sizes', 'dirty', 'size')
+
+    def __init__(self):
+        self.records = {}  # The latest version of every record, keyed by id, in insertion order
+        self.sizes = {}
+        self.dirty = []  # Records that are only in memory and still have to be appended to the storage
+        self.size = 0
+
+
+class TableCache:
+    """
+    Keeps parsed tables in memory, so repeated reads of a hot table skip the disk and json parsing.
+    Tables are evicted least recently used first once the cache holds more than `max_bytes`
+    (measured as the size of the records in JSON). Writes to a cached table are only applied in memory
+    and marked dirty, they are written back to the storage on flush, on eviction or every `flush_interval` seconds.
+    args:
+    storage (Storage): The storage engine the tables are read from and written back to
+    max_bytes (int): The memory budget of the cache
+    flush_interval (float): How often dirty tables are written back in the background, None to only write back on flush
+    """
+    def __init__(self, storage, max_bytes, flush_interval=None) -> None:
+        self.storage = storage
+        self.max_bytes = max_bytes
+        self.tables = OrderedDict()
+        self.size = 0
+        self.oversized = set()  # Tables found not to fit, they are not parsed again until they are written to
+        self.hits = 0
+        self.misses = 0
+        self.lock = RLock()
+        self._stop = Event()
+        self._thread = None
+
+        if flush_interval:
+            self._thread = Thread(target=self._write_back_periodically, args=(flush_interval,), daemon=True)
+            self._thread.start()
+
+    def contains(self, table_name):
+        with self.lock:
+            return table_name in self.tables
+
+    def records(self, table_name):
+        """
+        Returns the records of the table, loading it into the cache on a miss.
+        Returns None if the table alone does not fit into the cache, the caller reads the storage then.
+        """
+        with self.lock:
+            entry = self.tables.get(table_name)
+            if entry is not None:
+                self.hits += 1
+                metrics.count("cache.hits")
+                self.tables.move_to_end(table_name)
+                return list(entry.records.values())
+
+            self.misses += 1
+            metrics.count("cache.misses")
+            if table_name in self.oversized:
+                return None
+            entry = _CachedTable()
+            for (start, end), obj in self.storage.scan(table_name):
+                self._put(entry, obj, end - start + 1)
+                if entry.size > self.max_bytes:
+                    self.oversized.add(table_name)
+                    return None
+            self.tables[table_name] = entry
+            self.size += entry.size
+            self._evict(keep=table_name)
+            return list(entry.records.values())
+
+    def append(self, table_name, objs):
+        """
+        Applies new records (or new versions of records) to a cached table. Returns False if the table is not
+        cached, then the caller writes them to the storage itself.
+        """
+        with self.lock:
+            entry = self.tables.get(table_name)
+            if entry is None:
+                self.oversized.discard(table_name)  # The new versions may be smaller
+                return False
+
+            self.size -= entry.size
+            objs = deepcopy(objs)  # The caller may keep changing its own dicts, nested ones included
+            for obj in objs:
+                self._put(entry, obj, len(json.dumps(obj)) + 1)
+            entry.dirty.extend(objs)
+            self.size += entry.size
+            self.tables.move_to_end(table_name)
+            self._evict()
+            return True
+
+    def remove(self, table_name, ids):
+        """
+        Drops deleted records from a cached table, the deletion itself is already persisted by the storage.
+        """
+        with self.lock:
+            entry = self.tables.get(table_name)
+            if entry is None:
+                self.oversized.discard(table_name)
+                return
+            for id in ids:
+                if id in entry.records:
+                    del entry.records[id]
+                    size = entry.sizes.pop(id)
+                    entry.size -= size
+                    self.size -= size
+            ids = set(ids)
+            entry.dirty = [obj for obj in entry.dirty if obj.get('id') not in ids]  # Writing them back would undo the delete
+
+    def write_back(self, table_name):
+        with self.lock:
+            entry = self.tables.get(table_name)
+            if entry is not None and entry.dirty:
+                self.storage.append_many(table_name, entry.dirty)
+                entry.dirty = []
+
+    def flush(self):
+        with self.lock:
+            for table_name in list(self.tables):
+                self.write_back(table_name)
+
+    def close(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.flush()
+
+    def stats(self):
+        with self.lock:
+            return {"tables": len(self.tables), "bytes": self.size, "hits": self.hits, "misses": self.misses}
+
+    @staticmethod
+    def _put(entry, obj, size):
+        key = obj.get('id', ('', len(entry.records)))  # Records without an id can not be superseded
+        entry.size += size - entry.sizes.get(key, 0)
+        entry.records[key] = obj
+        entry.sizes[key] = size
+
+    def _evict(self, keep=None):
+        for table_name in list(self.tables):
+            if self.size <= self.max_bytes:
+                break
+            if table_name == keep:
+                continue
+            self.write_back(table_name)
+            self.size -= self.tables.pop(table_name).size
+
+    def _write_back_periodically(self, interval):
+        while not self._stop.wait(interval):
+            self.flush()
@@ -0,0 +1,66 @@
+import logging
+import time
+from threading import Event, Thread
+from src.constants import COMPACTION_INTERVAL, COMPACTION_GARBAGE_RATIO, COMPACTION_RATE
+from src.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class Compactor:
+    """
+    Compacts tables in a background thread, so no request has to absorb a rewrite of a whole table.
+    Every `interval` seconds the tables whose sealed segments hold at least `garbage_ratio` deleted or superseded
+    records are compacted, copying at most `rate` bytes per second. If the storage compresses segments,
+    the sealed segments that are still raw are compressed afterwards at the same rate.
+    args:
+    storage (Storage): The storage engine whose tables are compacted
+    interval (float): How often the tables are checked, None to only compact when run_once is called
+    lock (callable): lock(table_name) returns the lock held while a compaction switches the table to the new segments
+    on_moved (callable): Called with the table name and the moved locations while that lock is held
+    write_back (callable): Called with the table name before it is compacted, to write out the records that are
+        only held in memory: compaction forgets the tombstones of the records it does not find in the storage
+    """
+    def __init__(self, storage, interval=COMPACTION_INTERVAL, garbage_ratio=COMPACTION_GARBAGE_RATIO,
+                 rate=COMPACTION_RATE, lock=None, on_moved=None, write_back=None) -> None:
+        self.storage = storage
+        self.garbage_ratio = garbage_ratio
+        self.rate = rate
+        self.lock = lock
+        self.on_moved = on_moved
+        self.write_back = write_back
+        self.compactions = 0
+        self.compressions = 0
+        self._stop = Event()
+        self._thread = None
+
+        if interval:
+            self._thread = Thread(target=self._compact_periodically, args=(interval,), daemon=True)
+            self._thread.start()
+
+    def run_once(self):
+        for table_name in self.storage.tables():
+            garbage = self.storage.garbage(table_name)
+            if garbage and garbage >= self.garbage_ratio:
+                if self.write_back is not None:
+                    self.write_back(table_name)
+                with metrics.timer("compaction.seconds"):
+                    self.storage.compact(table_name, self.rate, self.lock(table_name) if self.lock else None, self.on_moved)
+                self.compactions += 1
+            start = time.perf_counter()
+            compressed = self.storage.compress(table_name, self.rate, self.lock(table_name) if self.lock else None)
+            if compressed:  # Most runs find nothing to compress, they would only skew the durations
+                metrics.observe("compression.seconds", time.perf_counter() - start)
+                self.compressions += compressed
+
+    def close(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _compact_periodically(self, interval):
+        while not self._stop.wait(interval):
+            try:
+                self.run_once()
+            except Exception:  # The next run tries again, the thread must not die with the first failure
+                logger.exception("Background compaction failed")
@@ -0,0 +1,132 @@
+import lzma
+import mmap
+import os
+import struct
+import zlib
+from array import array
+from bisect import bisect_right
+from collections import OrderedDict
+from threading import Lock
+from src.metrics import metrics
+
+# magic, codec name, offset of the block index
+_FOOTER = struct.Struct('>4s8sQ')
+_MAGIC = b'NSZ1'
+
+CODECS = {
+    'zlib': (lambda data: zlib.compress(data, 6), zlib.decompress),
+    'lzma': (lzma.compress, lzma.decompress),
+}
+
+
+class BlockCache:
+    """
+    Keeps the most recently decompressed blocks, so a run of reads from the same block decompresses it once.
+    args:
+    max_blocks (int): How many blocks are kept
+    """
+    def __init__(self, max_blocks) -> None:
+        self.max_blocks = max_blocks
+        self.blocks = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = Lock()
+
+    def get(self, key, load):
+        with self.lock:
+            block = self.blocks.get(key)
+            if block is not None:
+                self.hits += 1
+                metrics.count("block_cache.hits")
+                self.blocks.move_to_end(key)
+                return block
+            self.misses += 1
+            metrics.count("block_cache.misses")
+        block = load()  # Decompressed outside the lock, readers of other blocks do not wait for it
+        with self.lock:
+            self.blocks[key] = block
+            while len(self.blocks) > self.max_blocks:
+                self.blocks.popitem(last=False)
+        return block
+
+    def forget(self, path):
+        with self.lock:
+            for key in [key for key in self.blocks if key[0] == path]:
+                del self.blocks[key]
+
+
+class CompressedSegment:
+    """
+    A sealed segment stored as independently compressed blocks, followed by the block index and a footer.
+    Blocks end on record boundaries, so reading a record decompresses exactly one block. Slicing works like
+    on the map of an uncompressed segment: positions are positions in the uncompressed content.
+    args:
+    path (str): The path to the segment file
+    cache (BlockCache): Where decompressed blocks are kept, None keeps only the last one
+    """
+    def __init__(self, path, cache=None) -> None:
+        self.path = path
+        self.cache = cache
+        with open(path, 'rb') as file:
+            self.data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        footer_start = len(self.data) - _FOOTER.size
+        magic, codec, index_start = _FOOTER.unpack(self.data[footer_start:])
+        if magic != _MAGIC:
+            raise ValueError(f"{path} is not a compressed segment")
+        pairs = array('q')
+        pairs.frombytes(self.data[index_start:footer_start])
+        self.codec = codec.rstrip(b'\0').decode()
+        self._decompress = CODECS[self.codec][1]
+        self.raw_ends, self.ends = pairs[0::2], pairs[1::2]
+        self._last = (None, None)
+
+    def __len__(self):
+        return self.raw_ends[-1] if self.raw_ends else 0
+
+    def __getitem__(self, key):
+        start, stop, _ = key.indices(len(self))
+        i = bisect_right(self.raw_ends, start)
+        chunks = []
+        while start < stop:
+            block_start = self.raw_ends[i - 1] if i else 0
+            chunks.append(self.block(i)[start - block_start:stop - block_start])
+            start = self.raw_ends[i]
+            i += 1
+        return chunks[0] if len(chunks) == 1 else b''.join(chunks)
+
+    def block(self, i):
+        if self.cache is not None:
+            return self.cache.get((self.path, i), lambda: self._read_block(i))
+        if self._last[0] != i:
+            self._last = (i, self._read_block(i))
+        return self._last[1]
+
+    def read_all(self):
+        return b''.join(self._read_block(i) for i in range(len(self.ends)))
+
+    def _read_block(self, i):
+        return self._decompress(self.data[self.ends[i - 1] if i else 0:self.ends[i]])
+
+
+def write_compressed(path, data, ends, codec, block_size, pace=None):
+    """
+    Writes the records of `data` (ending at `ends`) as a compressed segment. Blocks are cut at the first record
+    end past `block_size`. pace(raw bytes written) is called after every block, e.g. to limit the rate.
+    """
+    compress = CODECS[codec][0]
+    index = array('q')
+    with open(path, 'wb') as file:
+        start = 0
+        for i, end in enumerate(ends):
+            if end - start >= block_size or i == len(ends) - 1:
+                file.write(compress(bytes(data[start:end])))
+                index.append(end)
+                index.append(file.tell())
+                if pace is not None:
+                    pace(end)
+                start = end
+        index_start = file.tell()
+        index.tofile(file)
+        file.write(_FOOTER.pack(_MAGIC, codec.encode(), index_start))
+        file.flush()
+        os.fsync(file.fileno())
@@ -1,4 +1,30 @@
 
 MAX_FILE_SIZE = 10000000  # Maximum file size in bytes (1 MB)
+RECORD_FORMAT = 'binary' # Format of the records of new tables, 'binary' or 'json'
+SEGMENT_COMPRESSION = None # Codec of sealed segments, 'zlib' or 'lzma', None stores them raw
+COMPRESSION_BLOCK_SIZE = 64 * 1024 # Uncompressed bytes per compressed block, a point read decompresses one block
+BLOCK_CACHE_BLOCKS = 64 # Decompressed blocks kept in memory
 
-FLUSH_THRESHOLD = 5 # Set N for how many deletes before a flush
\ No newline at end of file
+SEQUENCE_BLOCK_SIZE = 1000 # How many ids a table sequence reserves on disk at once
+
+SCAN_COST = 1.0 # Planner cost of parsing one record during a full scan
+FETCH_COST = 1.5 # Planner cost of reading one record found through an index
+INDEX_BUILD_COST = 2.0 # Planner cost per record of building an index
+
+WAL_CHECKPOINT_BYTES = 4 * 1024 * 1024 # Size of the write-ahead log after which it is checkpointed into the table files
+
+COMPACTION_INTERVAL = 10.0 # How often (in seconds) the background compaction looks for tables to compact
+COMPACTION_GARBAGE_RATIO = 0.3 # Share of deleted and superseded records in the sealed segments that triggers a compaction
+COMPACTION_RATE = 8 * 1024 * 1024 # Bytes per second a background compaction may copy
+
+PARALLEL_SCAN_MIN_RECORDS = 50000 # Tables with fewer records are scanned in the calling process
+PARALLEL_SCAN_TASKS_PER_WORKER = 4 # Partitions per worker process, so a slow partition does not hold up the whole scan
+
+ASYNC_WORKERS = 32 # Threads that run the blocking Core calls of the asyncio server
+MAX_REQUEST_BYTES = 64 * 1024 * 1024 # Largest request body the asyncio server accepts
+
+SERVER_LOG_MAX_BYTES = 10 * 1024 * 1024 # Size of the request log of the web server after which it is rotated
+SERVER_LOG_BACKUPS = 5 # Rotated request logs that are kept
+SERVER_LOG_SAMPLE_RATE = 0.01 # Share of the successful requests the web server logs, errors are always logged
+
+METRICS_SAMPLE_RATE = 0.0 # Share of the Core calls whose latency is recorded, 0 turns the sampling off
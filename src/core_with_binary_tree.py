@@ -1,271 +1,385 @@
-import json
 import os
+from itertools import islice
 from threading import Lock
-from src.constants import MAX_FILE_SIZE, FLUSH_THRESHOLD
-from src.BTree import Node, BTS
-from tests.test_time import _timer
+from src.BTree import BPlusTree
+from src.compaction import Compactor
+from src.constants import COMPACTION_INTERVAL
+from src.locks import TableLocks
+from src.metrics import instrumented, metrics
+from src.planner import QueryPlanner, TableStats
+from src.query_language import Comparison, In, And, Or, parse_condition, field_getter, MISSING, encode_cursor, decode_cursor
+from src.sequence import Sequence
+from src.storage import LogStorage
 
 
 class Index:
-    def __init__(self, table_name, field):
+    """
+    Secondary index of one field of a table. Maps a field value to the locations of the records holding it
+    and is kept up to date in place on every insert, update and delete.
+    """
+    def __init__(self, table_name, field, tree=None):
         self.table_name = table_name
         self.field = field
-        self.index = {}
+        self.index = tree if tree is not None else BPlusTree()
+        self._get = field_getter(field)
 
     def add(self, key, offset):
-        if key not in self.index:
-            self.index[key] = []
-        self.index[key].append(offset)
+        self.index.insert(key, offset)
 
     def remove(self, key, offset):
-        if key in self.index:
-            self.index[key].remove(offset)
-            if not self.index[key]:
-                del self.index[key]
+        self.index.remove(key, offset)
 
     def get(self, key):
-        return self.index.get(key, [])
+        return self.index.search(key) or []
+
+    def lookup(self, op, value):
+        """
+        Returns the offsets of the records whose field compares to the value with op (==, <, <=, > or >=).
+        """
+        if op == '==':
+            return self.get(value)
+        if op in ('<', '<='):
+            found = self.index.range(high=value, include_high=op == '<=')
+        else:
+            found = self.index.range(low=value, include_low=op == '>=')
+        return [offset for _, offsets in found for offset in offsets]
+
+    def add_record(self, obj, offset):
+        value = self._get(obj)
+        if value is not MISSING:
+            self.add(value, offset)
+
+    def remove_record(self, obj, offset):
+        value = self._get(obj)
+        if value is not MISSING:
+            self.remove(value, offset)
+
+    def relocate(self, moved):
+        """
+        Points the index to the new locations of the records a compaction moved.
+        """
+        for _, offsets in self.index.items():
+            offsets[:] = [moved.get(offset, offset) for offset in offsets]
+
+    def save(self, path, fingerprint):
+        self.index.save(path, {'fingerprint': fingerprint})
+
+    @classmethod
+    def load(cls, table_name, field, path):
+        return cls(table_name, field, BPlusTree.load(path))
 
 
 class Core:
-    def __init__(self, db_path) -> None:
+    def __init__(self, db_path, storage=None, compaction_interval=COMPACTION_INTERVAL) -> None:
         self.db_path = db_path
-        self.data_files = {}
-        self.indexes = {}
+        self.storage = storage if storage is not None else LogStorage(db_path)
         self.garden = {}
-        self.delete_markers = {}
-        self.delete_counter = 0
-        self.lock = Lock()
+        self.sequences = {}
+        self.stats = {}
+        self.planner = QueryPlanner()
+        self.locks = TableLocks()  # Selects share the lock of a table, writes to different tables do not wait for each other
+        self.index_lock = Lock()  # Keeps two selects from building the same index at once
+        self.garden_lock = Lock()  # Guards the garden itself, held only while it is read or changed, never during a build
 
         if not os.path.exists(db_path):
             os.makedirs(db_path)
+        # The index files are tracked here, so planning a query does not ask the disk which ones exist
+        self.index_files = {os.path.join(db_path, name) for name in os.listdir(db_path) if name.endswith('.idx')}
+
+        self.compactor = Compactor(self.storage, compaction_interval, lock=self.locks.write, on_moved=self._relocate)
 
     def _get_data_files(self):
         return os.listdir(self.db_path)
 
-    @staticmethod
-    def _parse_condition(condition):
-        key, value = condition.split('==')
-        key = key.strip().strip('"')
-        value = value.strip().strip('"')
-        return key, value
-
-    @_timer
-    def insert(self, table_name, obj):  # Приблизно за 1/4 секунди інсертиться
-        with self.lock:
-            file_path = self._get_table_path(table_name)
-
-            if table_name not in self.data_files:
-                self.data_files[table_name] = file_path
-
-            if os.path.exists(file_path):
-                with open(file_path, 'r') as file:
-                    file_content = file.read()
-                    if file_content == '':
-                        data = {f"{table_name}": [obj]}
-                        obj['id'] = 1  # Set the id of the first user to 1              
-                    else:
-                        file.seek(0)  # Move the cursor back to the start of the file
-                        data = json.load(file)
-                        if table_name not in data:
-                            data[table_name] = []
-                        if not data[f'{table_name}']:
-                            obj['id'] = 1  # Set the id of the first user to 1
-                        else:
-                            max_id = max(
-                                user.get('id', 0) for user in data[f'{table_name}'])  # Find the current maximum id
-                            obj['id'] = max_id + 1  # Set the id of the new user to the current maximum id + 1
-                        data[f'{table_name}'].append(obj)
-
-            self._write_table(table_name, data)
+    @instrumented("insert")
+    def insert(self, table_name, obj):
+        with self.locks.write(table_name):
+            obj['id'] = self._sequence(table_name).next_id()
+            offset = self.storage.append(table_name, obj)
+            for index in self._table_indexes(table_name):
+                index.add_record(obj, offset)
+            if table_name in self.stats:
+                self.stats[table_name].add(obj)
+
+    @instrumented("insert_many")
+    def insert_many(self, table_name, objs):
+        with self.locks.write(table_name):
+            ids = self._sequence(table_name).reserve(len(objs))  # One contiguous id range for the whole batch
+            for obj, id in zip(objs, ids):
+                obj['id'] = id
+            offsets = self.storage.append_many(table_name, objs)
+            for index in self._table_indexes(table_name):
+                for obj, offset in zip(objs, offsets):
+                    index.add_record(obj, offset)
+            if table_name in self.stats:
+                for obj in objs:
+                    self.stats[table_name].add(obj)
 
     def get_bytes(self, table_name):
-        file_path = self._get_table_path(table_name)
-        pars = []
-        correct_pars = []
-        bytes_count = 0
-        condition = 0
-        with open(file_path, 'rb') as file:
-            for line in file:
-                pos = 0
-                while pos < len(line):
-                    if chr(line[pos]) == '{':
-                        pars.append(['{', bytes_count + pos])
-                    elif chr(line[pos]) == '}':
-                        pars.append(['}', bytes_count + pos])
-                    pos += 1
-                bytes_count += len(line)
-        for el in pars[1:-1]:
-            if el[0] == '{' and condition == 0:
-                start = el[1]
-                condition += 1
-            elif el[0] == '}' and condition == 1:
-                end = el[1]
-                cords = (start, end)
-                correct_pars.append(cords)
-                condition -= 1
-            elif el[0] == '{':
-                condition += 1
-            elif el[0] == '}':
-                condition -= 1
-        return correct_pars
-
-    def create_BTS(self, parametr, table_name):
-        file_path = self._get_table_path(table_name)
-        tree = BTS()
-        bytes = self.get_bytes(table_name)
-        with open(file_path, 'r') as file:
-            for byte in bytes:
-                start = byte[0]
-                end = byte[1]
-                file.seek(start)
-                data = file.read(end - start)
-                for line in data.split('\n'):
-                    if parametr in line:
-                        if line[-1] == ',':
-                            line = line[:-1]
-                        value = line.split(':')[1]
-                        try:
-                            value = int(value)
-                        except ValueError:
-                            value = value.strip().strip('"')
-                        tree.append(Node(value, [byte]))
-                    else:
-                        continue
-        return tree
-
-    @_timer
+        return self.storage.locations(table_name)
+
+    def create_index(self, parametr, table_name):
+        index = Index(table_name, parametr)
+        stats = TableStats() if table_name not in self.stats else None  # Collected by the same pass if still missing
+        for offset, obj in self.storage.scan(table_name):
+            index.add_record(obj, offset)
+            if stats is not None:
+                stats.add(obj)
+        if stats is not None:
+            self.stats.setdefault(table_name, stats)
+        return index
+
+    @instrumented("update")
     def update(self, table_name, condition, updates):
-        with self.lock:
-            file_path = self._get_table_path(table_name)
-            data = self._read_table(table_name)
-            parsed_condition = self._parse_condition(condition)
-            key, value = parsed_condition
-
-            if os.path.exists(file_path):
-                search_results = self.select(table_name, condition)
+        if 'id' in updates:
+            raise ValueError("The id of a record can not be updated")  # The new version would not supersede the old one
+        with self.locks.write(table_name):
+            if self.storage.exists(table_name):
+                found = self._find(table_name, condition)
 
-                if not search_results:
+                if not found:
                     raise ValueError(f"No matching records found in table {table_name} for condition {condition}")
-
-                for obj in data[table_name]:
-                    if obj in search_results:
-                        for key, value in updates.items():
-                            obj[key] = value
-                self.garden[key] = self.create_BTS(key, table_name)
-                self._write_table(table_name, data)
+                if any(type(obj.get('id')) is not int for _, obj in found):
+                    raise ValueError(f"Records without an id in table {table_name} can not be updated")
+
+                new_objs = [dict(obj, **updates) for _, obj in found]
+                new_offsets = self.storage.append_many(table_name, new_objs)  # The new versions supersede the old ones
+                for index in self._table_indexes(table_name):
+                    for (offset, obj), new_offset, new_obj in zip(found, new_offsets, new_objs):
+                        index.remove_record(obj, offset)
+                        index.add_record(new_obj, new_offset)
+                if table_name in self.stats:
+                    for (_, obj), new_obj in zip(found, new_objs):
+                        self.stats[table_name].remove(obj)
+                        self.stats[table_name].add(new_obj)
             else:
                 raise ValueError(f"Table {table_name} does not exist")
 
-    @_timer
+    @instrumented("select")
     def select(self, table_name, condition):
-        file_path = self._get_table_path(table_name)
-
-        if os.path.exists(file_path):
-            results = []
-            parsed_condition = self._parse_condition(condition)
-            key, value = parsed_condition
-            if key not in self.garden:
-                self.garden[key] = self.create_BTS(key, table_name)
-
-            try:
-                value = int(value)  # Try to convert value to an integer (searching for id)
-            except ValueError:
-                pass
-
-            coordinats = self.garden[key].search(value)
-            with open(file_path, 'r') as file:
-                try:
-                    for borders in coordinats:
-                        start = borders[0]
-                        end = borders[1]
-                        file.seek(start)
-                        data = file.read(end - start)
-                        data = data.strip()
-                        if data[-1] == ',':
-                            data = data[:-1]
-                        results.append(json.loads(data))
-                except TypeError:
-                    raise ValueError(f"No matching records found in table {table_name} for condition {condition}")
-
-
-            if not results:
-                raise ValueError(f"No matching records found in table {table_name} for condition {condition}")
-
-            return results
-        else:
-            raise ValueError(f"Table {table_name} does not exist")
+        results = list(self.iter_select(table_name, condition))
+
+        if not results:
+            raise ValueError(f"No matching records found in table {table_name} for condition {condition}")
+
+        return results
+
+    def iter_select(self, table_name, condition, limit=None, offset=0, cursor=None):
+        """
+        Returns a lazy iterator over the matching records in id order.
+        `cursor` resumes after the last record of a previous page, `offset` and `limit` are applied after it.
+        The records to return are picked under the read lock, writes made while the iterator is consumed do not show up.
+        """
+        if limit is not None and limit < 1:
+            raise ValueError(f"Invalid limit: {limit}, a page holds at least one record")
+        if offset < 0:
+            raise ValueError(f"Invalid offset: {offset}, it can not be negative")
+        with self.locks.read(table_name):
+            if self.storage.exists(table_name):
+                after = decode_cursor(cursor)
+                results = (obj for _, obj in self._find_iter(table_name, condition)
+                           if after is None or (obj.get('id') or 0) > after)
+                return islice(results, offset, None if limit is None else offset + limit)
+            else:
+                raise ValueError(f"Table {table_name} does not exist")
 
-    @_timer
+    def select_page(self, table_name, condition, limit=100, offset=0, cursor=None):
+        """
+        Returns one page of results and the cursor of the next page (None on the last page).
+        """
+        if limit < 1:
+            raise ValueError(f"Invalid limit: {limit}, a page holds at least one record")
+        results = list(self.iter_select(table_name, condition, limit + 1, offset, cursor))
+        if len(results) <= limit:
+            return results, None
+        return results[:limit], encode_cursor(results[limit - 1].get('id'))
+
+    @instrumented("delete")
     def delete(self, table_name, condition):
-        with self.lock:
-            all_data = self._read_table(table_name)
-            parsed_condition = self._parse_condition(condition)
-            key, value = parsed_condition
-            data_to_delete = self.select(table_name, condition)
+        with self.locks.write(table_name):
+            if not self.storage.exists(table_name):
+                raise ValueError(f"Table {table_name} does not exist")
+            data_to_delete = self._find(table_name, condition)
 
             if data_to_delete:
-                if table_name not in self.delete_markers:
-                    self.delete_markers[table_name] = set()
-
-                for obj in data_to_delete:
-                    id = obj.get('id')
-
-                    if id in self.delete_markers[table_name]:
-                        print(f"Object with id {id} is already marked for deletion")
-
-                    self.delete_markers[table_name].add(id)
-                    self.delete_counter += 1
-
-                    if self.delete_counter >= FLUSH_THRESHOLD:
-                        remaining_data = list(filter(lambda obj: obj.get('id') not in self.delete_markers[table_name], all_data[table_name]))
-                        self._rewrite_table(table_name, remaining_data)
-                        self.delete_counter = 0
-                        self.delete_markers[table_name].clear()
-                        self.garden[key] = self.create_BTS(key, table_name)
+                for offset, obj in data_to_delete:
+                    for index in self._table_indexes(table_name):
+                        index.remove_record(obj, offset)
+                    if table_name in self.stats:
+                        self.stats[table_name].remove(obj)
+                self.storage.delete(table_name, [obj.get('id') for _, obj in data_to_delete])  # Dropped for good by compaction
             else:
                 raise ValueError(f"Data to delete not found in table {table_name}")
 
-    def _is_obj_deleted(self, obj):
-        return obj.get('id') in self.delete_markers.get('users', set())
-
-    def flush(self, table_name):  # ???
-        self._rewrite_table(table_name)
-
-    def _get_table_path(self, table_name):
-        base_path = os.path.join(self.db_path, f"{table_name}.json")
-        if os.path.exists(base_path) and os.path.getsize(base_path) > MAX_FILE_SIZE:  # If the file is too large (over 1 MB), create a new file
-            i = 1
-            while True:
-                new_path = os.path.join(self.db_path, f"{table_name}_{i}.json")
-                if not os.path.exists(new_path) or os.path.getsize(new_path) <= MAX_FILE_SIZE:
-                    return new_path
-                i += 1
-        return base_path
-
-    def _read_table(self, table_name):
-        file_path = self._get_table_path(table_name)
-        with open(file_path, 'r') as file:
-            return json.load(file)
-
-    def _write_table(self, table_name, data):
-        file_path = self._get_table_path(table_name)
-
-        with open(file_path, 'w') as file:
-            json.dump(data, file, indent=4)
-
-    def _rewrite_table(self, table_name, new_data):
-        file_path = self._get_table_path(table_name)
-
-        if os.path.exists(file_path):
-            with open(file_path, 'r') as file:
-                data = json.load(file)
-                data[table_name] = new_data  # Update the data with the new data
-
-            with open(file_path, 'w') as file:
-                json.dump(data, file, indent=4)
-        else:
-            raise ValueError(f"Table {table_name} does not exist")
+    @instrumented("flush", timed=True)
+    def flush(self, table_name):
+        """
+        Compacts the table right away instead of waiting for the background compaction.
+        """
+        with self.locks.write(table_name):
+            if self.storage.exists(table_name):
+                self.storage.compact(table_name, on_moved=self._relocate, seal=True)
+
+    def close(self):
+        self.compactor.close()
+        for sequence in list(self.sequences.values()):
+            sequence.close()
+        self.save_indexes()  # Saved with the current fingerprint, so the next start loads them instead of rebuilding
+
+    def _relocate(self, table_name, moved):
+        for index in self._table_indexes(table_name):
+            index.relocate(moved)
+
+    def explain(self, table_name, condition):
+        """
+        Returns the plan that would be used to find the records matching the condition, without running it.
+        """
+        with self.locks.read(table_name):
+            if not self.storage.exists(table_name):
+                raise ValueError(f"Table {table_name} does not exist")
+            condition = parse_condition(condition)
+            plan = self._plan(table_name, condition, record=False)
+            return dict({"table": table_name, "condition": str(condition)}, **plan.to_dict())
+
+    def _plan(self, table_name, condition, record=True):
+        indexed_fields = {index.field for index in self._table_indexes(table_name)}
+        indexed_fields |= {field for field in self._stats(table_name).fields if self._index_path(table_name, field) in self.index_files}
+        return self.planner.plan(table_name, self._stats(table_name), condition, indexed_fields, record=record)
+
+    def _stats(self, table_name):
+        if table_name not in self.stats:
+            self.stats[table_name] = TableStats.from_records(obj for _, obj in self.storage.scan(table_name))
+        return self.stats[table_name]
+
+    def _find(self, table_name, condition):
+        return list(self._find_iter(table_name, condition))
+
+    def _find_iter(self, table_name, condition):
+        """
+        Yields (offset, record) for every live record matching the condition, in id order.
+        The planner decides whether the indexes are used (and built if needed) or the whole table is scanned.
+        """
+        condition = parse_condition(condition)
+        if table_name not in self.stats:  # The first query of a table scans it anyway and collects the statistics on the way
+            self.planner.record(table_name, condition)
+            metrics.count("query.full_scans")
+            return self._collect_stats(table_name, self._fingerprint(table_name), self.storage.scan(table_name), condition)
+        plan = self._plan(table_name, condition)
+
+        if plan.kind == 'scan':
+            metrics.count("query.full_scans")
+            return ((offset, obj) for offset, obj in self.storage.scan(table_name) if condition.matches(obj))
+
+        metrics.count("query.index_lookups")
+        deleted = self.storage.deleted(table_name)  # An index is not guaranteed to have dropped every deleted record
+        results = []
+        for offset in dict.fromkeys(self._index_offsets(table_name, condition, plan.fields)):  # An OR can reach the same record twice
+            obj = self.storage.read_at(table_name, offset)
+            if obj.get('id') not in deleted and condition.matches(obj):  # Checks the rest of the condition, e.g. the other half of an AND
+                results.append((offset, obj))
+        results.sort(key=lambda found: found[1].get('id') or 0)  # The same order as a scan
+        return iter(results)
+
+    def _collect_stats(self, table_name, fingerprint, scan, condition):
+        """
+        Yields the records of the scan matching the condition and keeps the statistics of all of them, if the scan
+        is read to the end and the table has not changed since it started.
+        """
+        stats = TableStats()
+        for offset, obj in scan:
+            stats.add(obj)
+            if condition.matches(obj):
+                yield offset, obj
+        with self.locks.read(table_name):  # Keeps writes out until they see the statistics
+            if table_name not in self.stats and self._fingerprint(table_name) == fingerprint:
+                self.stats[table_name] = stats
+
+    def _index_offsets(self, table_name, condition, fields):
+        """
+        Returns the offsets of a superset of the matching records found through the indexes of `fields`,
+        or None if the condition can not be answered by those indexes.
+        """
+        if isinstance(condition, Comparison) and condition.op != '!=' and condition.field in fields:
+            return self._get_index(table_name, condition.field).lookup(condition.op, condition.value)
+        if isinstance(condition, In) and condition.field in fields:
+            index = self._get_index(table_name, condition.field)
+            return [offset for value in condition.values for offset in index.get(value)]
+        if isinstance(condition, And):
+            for child in condition.children:
+                offsets = self._index_offsets(table_name, child, fields)
+                if offsets is not None:
+                    return offsets
+            return None
+        if isinstance(condition, Or):
+            offsets = []
+            for child in condition.children:
+                child_offsets = self._index_offsets(table_name, child, fields)
+                if child_offsets is None:
+                    return None
+                offsets.extend(child_offsets)
+            return offsets
+        return None
+
+    def add_index(self, table_name, field):
+        """
+        Builds (or loads) the index of the field right away instead of waiting for the planner to ask for it.
+        """
+        with self.locks.read(table_name):
+            self._get_index(table_name, field)
+
+    def _get_index(self, table_name, field):
+        """
+        Returns the index of the field, loading it from the index file or building it if there is no valid one.
+        """
+        with self.index_lock:
+            with self.garden_lock:
+                index = self.garden.get((table_name, field))
+            if index is None:
+                index = self._load_index(table_name, field)
+                with self.garden_lock:  # Writers of other tables read the garden while the index is built
+                    self.garden[(table_name, field)] = index
+            return index
+
+    def _load_index(self, table_name, field):
+        index = None
+        index_path = self._index_path(table_name, field)
+        if os.path.exists(index_path):
+            index = Index.load(table_name, field, index_path)
+            if index.index.meta.get('fingerprint') != self._fingerprint(table_name):  # The table changed since the index was saved
+                index = None
+        if index is None:
+            index = self.create_index(field, table_name)
+            index.save(index_path, self._fingerprint(table_name))
+            self.index_files.add(index_path)
+        return index
+
+    def _table_indexes(self, table_name):
+        with self.garden_lock:
+            return [index for (table, _), index in self.garden.items() if table == table_name]
+
+    def save_indexes(self):
+        """
+        Saves every index, so the next start can load them instead of rescanning the tables.
+        """
+        with self.garden_lock:
+            indexes = list(self.garden.items())
+        for (table_name, field), index in indexes:
+            with self.locks.read(table_name):
+                index.save(self._index_path(table_name, field), self._fingerprint(table_name))
+                self.index_files.add(self._index_path(table_name, field))
+
+    def _index_path(self, table_name, field):
+        return os.path.join(self.db_path, f"{table_name}.{field}.idx")
+
+    def _fingerprint(self, table_name):
+        return self.storage.fingerprint(table_name)
+
+    def _sequence(self, table_name):
+        if table_name not in self.sequences:
+            self.sequences[table_name] = Sequence(
+                os.path.join(self.db_path, f"{table_name}.seq"),
+                initial=lambda: max((obj.get('id', 0) for obj in self.storage.read(table_name)), default=0))
+        return self.sequences[table_name]
 
 if __name__ == "__main__":
     db = Core("D:/OOP/NoSQL Database project/db")
@@ -0,0 +1,80 @@
+from contextlib import contextmanager
+from threading import Condition, Lock, get_ident
+
+
+class RWLock:
+    """
+    A reader/writer lock: any number of readers or a single writer. Waiting writers are served before new readers,
+    so a steady stream of selects can not starve the writes. Both sides may take the lock again, and the writer may
+    also read, e.g. when an update runs a select; a reader can not upgrade to a writer.
+    """
+    def __init__(self) -> None:
+        self._condition = Condition(Lock())
+        self._readers = {}  # How often every reading thread holds the lock
+        self._writer = None  # Thread id of the writer
+        self._depth = 0  # How often the writer holds the lock
+        self._waiting_writers = 0
+
+    @contextmanager
+    def read(self):
+        me = get_ident()
+        if self._writer == me:
+            yield  # The writer already excludes everyone else
+            return
+        with self._condition:
+            if me not in self._readers:  # A nested read must not wait for a writer that waits for this thread
+                while self._writer is not None or self._waiting_writers:
+                    self._condition.wait()
+            self._readers[me] = self._readers.get(me, 0) + 1
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._readers[me] -= 1
+                if not self._readers[me]:
+                    del self._readers[me]
+                    if not self._readers:
+                        self._condition.notify_all()
+
+    @contextmanager
+    def write(self):
+        me = get_ident()
+        with self._condition:
+            if self._writer != me:
+                self._waiting_writers += 1
+                try:
+                    while self._writer is not None or self._readers:
+                        self._condition.wait()
+                finally:
+                    self._waiting_writers -= 1
+                self._writer = me
+            self._depth += 1
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._depth -= 1
+                if not self._depth:
+                    self._writer = None
+                    self._condition.notify_all()
+
+
+class TableLocks:
+    """
+    One RWLock per table, so readers of a table share it and writers of different tables do not wait for each other.
+    """
+    def __init__(self) -> None:
+        self._locks = {}
+        self._lock = Lock()
+
+    def get(self, table_name):
+        with self._lock:
+            if table_name not in self._locks:
+                self._locks[table_name] = RWLock()
+            return self._locks[table_name]
+
+    def read(self, table_name):
+        return self.get(table_name).read()
+
+    def write(self, table_name):
+        return self.get(table_name).write()
@@ -1,176 +1,277 @@
-import json
 import os
-from src.constants import MAX_FILE_SIZE, FLUSH_THRESHOLD
-from tests.test_time import _timer
+from contextlib import nullcontext
+from copy import deepcopy
+from itertools import islice
+from src.cache import TableCache
+from src.compaction import Compactor
+from src.constants import COMPACTION_INTERVAL
+from src.locks import TableLocks
+from src.metrics import instrumented, metrics
+from src.parallel_scan import ParallelScanner
+from src.planner import QueryPlanner, TableStats
+from src.query_language import parse_condition, encode_cursor, decode_cursor
+from src.result_cache import ResultCache
+from src.sequence import Sequence
+from src.storage import LogStorage
+from src.wal import WriteAheadLog
 
 class Core:
     """
     This class is responsible for the core functionality of the database. It is responsible for inserting, updating, selecting and deleting data from the database
     args:
     db_path (str): The path to the directory where the database will be stored
+    storage (Storage): The storage engine that keeps the table files. Defaults to an append-only LogStorage
+    cache_bytes (int): Memory budget of the in-memory table cache, None (the default) disables the cache
+    cache_flush_interval (float): How often the cache writes dirty tables back, None to only write back on flush
+    wal (bool): Log every change to a write-ahead log first, so no acknowledged write is lost in a crash
+    compaction_interval (float): How often the background compaction checks the tables, None to only compact on flush
+    scan_workers (int): Worker processes for full-table scans of large tables, None (the default) scans in this process.
+    Used when the cache is off, a cached table is filtered in memory.
+    result_cache_records (int): How many records the cached select results may hold, None (the default) disables the result cache
     """
-    def __init__(self, db_path) -> None:
+    def __init__(self, db_path, storage=None, cache_bytes=None, cache_flush_interval=None, wal=False,
+                 compaction_interval=COMPACTION_INTERVAL, scan_workers=None, result_cache_records=None) -> None:
         self.db_path = db_path
-        self.data_files = {}
-        self.delete_markers = {}
-        self.delete_counter = 0
+        self.storage = storage if storage is not None else LogStorage(db_path)
+        self.cache = TableCache(self.storage, cache_bytes, cache_flush_interval) if cache_bytes else None
+        self.results = ResultCache(result_cache_records) if result_cache_records else None
+        self.sequences = {}
+        self.stats = {}  # Statistics shown by explain, dropped on every write to the table
+        self.planner = QueryPlanner()
+        self.locks = TableLocks()  # Selects share the lock of a table, writes to different tables do not wait for each other
+        self.scanner = ParallelScanner(self.storage, scan_workers, lock=self.locks.read) if scan_workers and cache_bytes is None else None
+        self.wal = None
 
         if not os.path.exists(db_path):
             os.makedirs(db_path)
 
+        if wal:
+            self.wal = WriteAheadLog(os.path.join(db_path, "wal.log"))
+            self._recover()
+        self.compactor = Compactor(self.storage, compaction_interval, lock=self.locks.write,
+                                   write_back=self.cache.write_back if self.cache is not None else None)
+
     def _get_data_files(self):
         return os.listdir(self.db_path)
     
-    @staticmethod
-    def _parse_condition(condition):
-        key, value = condition.split('==')
-        key = key.strip().strip('"')
-        value = value.strip().strip('"')
-        return key, value
-
-    @_timer
+    @instrumented("insert")
     def insert(self, table_name, obj):
-        file_path = self._get_table_path(table_name)
-
-        if table_name not in self.data_files:
-            self.data_files[table_name] = file_path
-
-        if os.path.exists(file_path):
-            with open(file_path, 'r') as file:
-                file_content = file.read()
-                if file_content == '':
-                    data = {f"{table_name}": [obj]}
-                    obj['id'] = 1  # Set the id of the first user to 1              
-                else:
-                    file.seek(0)  # Move the cursor back to the start of the file
-                    data = json.load(file)
-                    if table_name not in data:
-                        data[table_name] = []
-                    if not data[f'{table_name}']:
-                        obj['id'] = 1  # Set the id of the first user to 1
-                    else:
-                        max_id = max(user.get('id', 0) for user in data[f'{table_name}'])  # Find the current maximum id
-                        obj['id'] = max_id + 1  # Set the id of the new user to the current maximum id + 1
-                    data[f'{table_name}'].append(obj)
-
-        self._write_table(table_name, data)
-
-    @_timer
+        with self.locks.write(table_name):
+            obj['id'] = self._sequence(table_name).next_id()
+            ticket = self._append(table_name, [obj])
+        self._wait_durable(ticket)
+
+    @instrumented("insert_many")
+    def insert_many(self, table_name, objs):
+        with self.locks.write(table_name):
+            ids = self._sequence(table_name).reserve(len(objs))  # One contiguous id range for the whole batch
+            for obj, id in zip(objs, ids):
+                obj['id'] = id
+            ticket = self._append(table_name, objs)
+        self._wait_durable(ticket)
+
+    @instrumented("update")
     def update(self, table_name, condition, updates):
-        file_path = self._get_table_path(table_name)
-        data = self._read_table(table_name)
+        if 'id' in updates:
+            raise ValueError("The id of a record can not be updated")  # The new version would not supersede the old one
+        with self.locks.write(table_name):
+            if self._exists(table_name):
+                search_results = self.select(table_name, condition)
 
-        if os.path.exists(file_path):
-            search_results = self.select(table_name, condition)
+                if not search_results:
+                    raise ValueError(f"No matching records found in table {table_name} for condition {condition}")
+                if any(type(obj.get('id')) is not int for obj in search_results):
+                    raise ValueError(f"Records without an id in table {table_name} can not be updated")
 
-            if not search_results:
-                raise ValueError(f"No matching records found in table {table_name} for condition {condition}")
-                    
-            for obj in data[table_name]:
-                if obj in search_results:
+                for obj in search_results:
                     for key, value in updates.items():
                         obj[key] = value
 
-            self._write_table(table_name, data)
-        else:
-            raise ValueError(f"Table {table_name} does not exist")
-    
-    @_timer
+                ticket = self._append(table_name, search_results)  # The new versions supersede the old ones
+            else:
+                raise ValueError(f"Table {table_name} does not exist")
+        self._wait_durable(ticket)
+
+    @instrumented("select")
     def select(self, table_name, condition):
-        file_path = self._get_table_path(table_name)
-        data = self._read_table(table_name)
-
-        if os.path.exists(file_path):
-            objects = [obj for obj in data[table_name] if not self._is_obj_deleted(obj)]
-            parsed_condition = self._parse_condition(condition)
-            key, value = parsed_condition
-
-            if value == "null":
-                value = None  # Convert 'null' to None
-            elif value == "true":
-                value = True
+        if self.results is not None:
+            condition = parse_condition(condition)
+            results = self.results.lookup(table_name, condition, lambda: list(self.iter_select(table_name, condition)))
+        else:
+            results = list(self.iter_select(table_name, condition))
+
+        if not results:
+            raise ValueError(f"No matching records found in table {table_name} for condition {condition}")
+
+        return results
+
+    def iter_select(self, table_name, condition, limit=None, offset=0, cursor=None):
+        """
+        Returns a lazy iterator over the matching records in id order, so a large result is never held in memory.
+        `cursor` resumes after the last record of a previous page, `offset` and `limit` are applied after it.
+        The records to return are picked under the read lock, writes made while the iterator is consumed do not show up.
+        """
+        if limit is not None and limit < 1:
+            raise ValueError(f"Invalid limit: {limit}, a page holds at least one record")
+        if offset < 0:
+            raise ValueError(f"Invalid offset: {offset}, it can not be negative")
+        with self.locks.read(table_name):
+            if self._exists(table_name):
+                parsed_condition = parse_condition(condition)
+                after = decode_cursor(cursor)
+                matches = self.scanner.scan(table_name, parsed_condition) if self.scanner is not None else None
+                metrics.count("query.parallel_scans" if matches is not None else "query.full_scans")
+                if matches is None:
+                    matches = self._scan(table_name, parsed_condition)
+                results = (obj for obj in matches if after is None or (obj.get('id') or 0) > after)
+                return islice(results, offset, None if limit is None else offset + limit)
             else:
-                try:
-                    value = int(value)  # Try to convert value to an integer (searching for id)
-                except ValueError:
-                    pass
+                raise ValueError(f"Table {table_name} does not exist")
 
-            results = [check for check in objects if key in check and check[key] == value]
+    def select_page(self, table_name, condition, limit=100, offset=0, cursor=None):
+        """
+        Returns one page of results and the cursor of the next page (None on the last page).
+        """
+        if limit < 1:
+            raise ValueError(f"Invalid limit: {limit}, a page holds at least one record")
+        results = list(self.iter_select(table_name, condition, limit + 1, offset, cursor))
+        if len(results) <= limit:
+            return results, None
+        return results[:limit], encode_cursor(results[limit - 1].get('id'))
 
-            if not results:
-                raise ValueError(f"No matching records found in table {table_name} for condition {condition}")
-                
-            return results
-        else:
-            raise ValueError(f"Table {table_name} does not exist")
+    def explain(self, table_name, condition):
+        """
+        Returns the plan used for the condition. This core has no indexes, so it is always a full scan.
+        """
+        with self.locks.read(table_name):
+            if not self._exists(table_name):
+                raise ValueError(f"Table {table_name} does not exist")
+            condition = parse_condition(condition)
+            if table_name not in self.stats:
+                self.stats[table_name] = TableStats.from_records(self._scan(table_name))
+            stats = self.stats[table_name]
+            plan = self.planner.plan(table_name, stats, condition, set(), can_build=False, record=False)
+            return dict({"table": table_name, "condition": str(condition)}, **plan.to_dict())
 
-    @_timer
+    @instrumented("delete")
     def delete(self, table_name, condition):
-        data_to_delete = self.select(table_name, condition)
+        with self.locks.write(table_name):
+            data_to_delete = self.select(table_name, condition)
+
+            if data_to_delete:
+                ids = [obj.get('id') for obj in data_to_delete]
+                with self._logged({"table": table_name, "op": "delete", "ids": ids}) as ticket:
+                    self.storage.delete(table_name, ids)  # A persistent tombstone, the records are dropped by compaction
+                    if self.cache is not None:
+                        self.cache.remove(table_name, ids)
+                self._invalidate(table_name)
+                self._checkpoint_if_needed()
+            else:
+                raise ValueError(f"Data to delete not found in table {table_name}")
+        self._wait_durable(ticket)
 
-        if data_to_delete:
-            if table_name not in self.delete_markers:
-                self.delete_markers[table_name] = set()
+    @instrumented("flush", timed=True)
+    def flush(self, table_name):
+        """
+        Writes the cached changes back and compacts the table right away instead of waiting for the background compaction.
+        """
+        with self.locks.write(table_name):
+            if self.cache is not None:
+                self.cache.flush()  # Write back everything that only lives in the cache
+            if self.storage.exists(table_name):
+                self.storage.compact(table_name, seal=True)
+            self._invalidate(table_name)
+            self.checkpoint()
 
-            for obj in data_to_delete:
-                id = obj.get('id')
+    def checkpoint(self):
+        """
+        Makes everything logged so far durable in the table files and empties the write-ahead log.
+        """
+        if self.wal is not None:
+            self.wal.checkpoint(self._sync_tables)
 
-                if id in self.delete_markers[table_name]:
-                    continue
+    def close(self):
+        self.compactor.close()
+        for sequence in list(self.sequences.values()):
+            sequence.close()
+        if self.scanner is not None:
+            self.scanner.close()
+        self.checkpoint()
+        if self.cache is not None:
+            self.cache.close()
+        if self.wal is not None:
+            self.wal.close()
 
-                self.delete_markers[table_name].add(id)
-                self.delete_counter += 1
+    def _recover(self):
+        """
+        Replays the write-ahead log after a crash. Replaying is idempotent: a record that already reached its
+        table is appended once more and the latest version still wins.
+        """
+        for entry in self.wal.replay():
+            if entry["op"] == "put":
+                self.storage.append_many(entry["table"], entry["records"])
+            elif entry["op"] == "delete":
+                self.storage.delete(entry["table"], entry["ids"])
+        self.checkpoint()
 
-                if self.delete_counter >= FLUSH_THRESHOLD:
-                    self.flush(table_name)
-        else:
-            raise ValueError(f"Data to delete not found in table {table_name}")
-        
-    def _is_obj_deleted(self, obj):
-        return obj.get('id') in self.delete_markers.get('users', set())
-     
-    def flush(self, table_name):
-        for table_name in self.delete_markers.keys():
-            all_data = self._read_table(table_name)
-            remaining_data = list(filter(lambda obj: obj.get('id') not in self.delete_markers[table_name], all_data[table_name]))
-            self._rewrite_table(table_name, remaining_data)
-            self.delete_markers[table_name].clear()
-        self.delete_counter = 0
-    
-    def _get_table_path(self, table_name):
-        base_path = os.path.join(self.db_path, f"{table_name}.json")
-        if os.path.exists(base_path) and os.path.getsize(base_path) > MAX_FILE_SIZE: # If the file is too large (over MAX_FILE_SIZE), create a new file
-            i = 1
-            while True:
-                new_path = os.path.join(self.db_path, f"{table_name}_{i}.json")
-                if not os.path.exists(new_path) or os.path.getsize(new_path) <= MAX_FILE_SIZE:
-                    return new_path
-                i += 1
-        return base_path
+    def _logged(self, entry):
+        return self.wal.write(entry) if self.wal is not None else nullcontext()
+
+    def _wait_durable(self, ticket):
+        """
+        Waits for a logged change to reach the disk. Called after the lock of the table is released,
+        so the writers of the table that queued up meanwhile share the fsync.
+        """
+        if ticket is not None:
+            self.wal.wait(ticket)
+
+    def _checkpoint_if_needed(self):
+        if self.wal is not None and self.wal.needs_checkpoint:
+            self.checkpoint()
+
+    def _sync_tables(self, tables):
+        if self.cache is not None:
+            self.cache.flush()
+        for table_name in tables:
+            self.storage.sync(table_name)
+
+    def _sequence(self, table_name):
+        if table_name not in self.sequences:
+            self.sequences[table_name] = Sequence(
+                os.path.join(self.db_path, f"{table_name}.seq"),
+                initial=lambda: max((obj.get('id', 0) for obj in self.storage.read(table_name)), default=0))  # Not cached, a cached table keeps its writes in memory
+        return self.sequences[table_name]
 
     def _read_table(self, table_name):
-        file_path = self._get_table_path(table_name)
-        with open(file_path, 'r') as file:
-            return json.load(file)
-        
-    def _write_table(self, table_name, data):
-        file_path = self._get_table_path(table_name)
-
-        with open(file_path, 'w') as file:
-            json.dump(data, file, indent=4)
-
-    def _rewrite_table(self, table_name, new_data):
-        file_path = self._get_table_path(table_name)
-
-        if os.path.exists(file_path):
-            with open(file_path, 'r') as file:
-                data = json.load(file)
-                data[table_name] = new_data  # Update the data with the new data
-
-            with open(file_path, 'w') as file:
-                json.dump(data, file, indent=4)
-        else:
-            raise ValueError(f"Table {table_name} does not exist")       
+        return list(self._scan(table_name))
+
+    def _exists(self, table_name):
+        return (self.cache is not None and self.cache.contains(table_name)) or self.storage.exists(table_name)
+
+    def _scan(self, table_name, condition=None):
+        """
+        Yields the latest version of every record matching the condition (of every record without one),
+        from the cache if the table is cached. Cached records are matched in place and only the ones returned are copied.
+        """
+        records = self.cache.records(table_name) if self.cache is not None else None
+        if records is None:
+            records = (obj for _, obj in self.storage.scan(table_name))
+            return records if condition is None else (obj for obj in records if condition.matches(obj))
+        # Deep copies, so callers can not change the cached records
+        return (deepcopy(obj) for obj in records if condition is None or condition.matches(obj))
+
+    def _append(self, table_name, objs):
+        with self._logged({"table": table_name, "op": "put", "records": objs}) as ticket:
+            if self.cache is None or not self.cache.append(table_name, objs):
+                self.storage.append_many(table_name, objs)
+        self._invalidate(table_name)
+        self._checkpoint_if_needed()
+        return ticket
+
+    def _invalidate(self, table_name):
+        self.stats.pop(table_name, None)
+        if self.results is not None:
+            self.results.invalidate(table_name)
 
 
 if __name__ == "__main__":
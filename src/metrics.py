@@ -0,0 +1,181 @@
+import cProfile
+import io
+import pstats
+import random
+import time
+from bisect import bisect_left
+from collections import Counter
+from contextlib import contextmanager
+from functools import wraps
+from threading import Lock
+from src.constants import METRICS_SAMPLE_RATE
+
+# Upper bounds (in seconds) of the latency buckets, the last bucket takes everything slower
+BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    """
+    Counts observed durations in fixed buckets, so recording one is a bisect and an increment and the memory
+    does not grow with the number of calls. Quantiles are read off the buckets, as the bound of the bucket they fall in.
+    """
+    def __init__(self):
+        self.buckets = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, seconds):
+        self.buckets[bisect_left(BUCKETS, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+
+    def quantile(self, fraction):
+        rank = fraction * self.count
+        seen = 0
+        for bound, count in zip(BUCKETS + (float('inf'),), self.buckets):
+            seen += count
+            if seen >= rank and count:
+                return bound
+        return 0.0
+
+    def to_dict(self):
+        return {
+            "count": self.count,
+            "sum": round(self.sum, 6),
+            "p50": self.quantile(0.5),
+            "p99": self.quantile(0.99),
+            "buckets": dict(zip([str(bound) for bound in BUCKETS] + ["+Inf"], self.buckets)),
+        }
+
+
+class Metrics:
+    """
+    Counters and latency histograms of the database, shared by every core of the process.
+    Counters (calls, bytes read and written, records scanned, index lookups, cache hits) are always kept.
+    The latency of single calls is only recorded for a `sample_rate` share of them, 0 turns sampling off.
+    Rare and slow operations (flushes, compactions) are always timed. A cProfile profiler can be switched on
+    at runtime, it profiles the instrumented calls until it is switched off again.
+    args:
+    sample_rate (float): Share of the calls whose latency is recorded
+    """
+    def __init__(self, sample_rate=METRICS_SAMPLE_RATE) -> None:
+        self.sample_rate = sample_rate
+        self.counters = Counter()
+        self.histograms = {}
+        self.profiler = None
+        self.lock = Lock()
+        self._profiling = Lock()  # cProfile can not profile two threads at once, the other calls run unprofiled
+
+    def count(self, name, value=1):
+        with self.lock:
+            self.counters[name] += value
+
+    def observe(self, name, seconds):
+        with self.lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram()
+            histogram.observe(seconds)
+
+    def sampled(self):
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    @contextmanager
+    def timer(self, name):
+        """
+        Records the duration of the block, for operations that are always timed.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def start_profiling(self):
+        with self.lock:
+            if self.profiler is None:
+                self.profiler = cProfile.Profile()
+
+    def stop_profiling(self, limit=30):
+        """
+        Switches the profiler off and returns its report, the `limit` functions with the most cumulative time.
+        """
+        with self.lock:
+            profiler, self.profiler = self.profiler, None
+        if profiler is None:
+            return ""
+        with self._profiling:  # Waits for a call that is still being profiled
+            out = io.StringIO()
+            pstats.Stats(profiler, stream=out).sort_stats('cumulative').print_stats(limit)
+        return out.getvalue()
+
+    def call(self, func, *args, **kwargs):
+        """
+        Runs func under the profiler if it is on and no other thread is being profiled.
+        """
+        profiler = self.profiler
+        if profiler is None or not self._profiling.acquire(blocking=False):
+            return func(*args, **kwargs)
+        try:
+            return profiler.runcall(func, *args, **kwargs)
+        finally:
+            self._profiling.release()
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                "counters": dict(self.counters),
+                "histograms": {name: histogram.to_dict() for name, histogram in self.histograms.items()},
+                "sample_rate": self.sample_rate,
+                "profiling": self.profiler is not None,
+            }
+
+    def to_prometheus(self, prefix="nosql"):
+        """
+        Renders the metrics in the Prometheus text format, e.g. storage.bytes_read becomes nosql_storage_bytes_read.
+        """
+        snapshot = self.snapshot()
+        lines = []
+        for name, value in sorted(snapshot["counters"].items()):
+            metric = f"{prefix}_{name.replace('.', '_')}"
+            lines += [f"# TYPE {metric} counter", f"{metric} {value}"]
+        for name, histogram in sorted(snapshot["histograms"].items()):
+            metric = f"{prefix}_{name.replace('.', '_')}"
+            lines.append(f"# TYPE {metric} histogram")
+            total = 0
+            for bound, count in histogram["buckets"].items():
+                total += count
+                lines.append(f'{metric}_bucket{{le="{bound}"}} {total}')
+            lines += [f"{metric}_sum {histogram['sum']}", f"{metric}_count {histogram['count']}"]
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        with self.lock:
+            self.counters.clear()
+            self.histograms.clear()
+
+
+metrics = Metrics()
+
+
+def instrumented(name, timed=False):
+    """
+    Decorates a Core method: counts its calls and errors, records the latency of a sample of the calls
+    (of every call if `timed`) as <name>.seconds and runs it under the profiler when profiling is on.
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            metrics.count(f"{name}.calls")
+            sample = timed or metrics.sampled()
+            start = time.perf_counter() if sample else None
+            try:
+                return metrics.call(func, *args, **kwargs)
+            except Exception:
+                metrics.count(f"{name}.errors")
+                raise
+            finally:
+                if sample:
+                    metrics.observe(f"{name}.seconds", time.perf_counter() - start)
+        return wrapper
+    return decorator
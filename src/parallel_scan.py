@@ -0,0 +1,83 @@
+import heapq
+import math
+import mmap
+import os
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+from src.compression import CompressedSegment
+from src.constants import PARALLEL_SCAN_MIN_RECORDS, PARALLEL_SCAN_TASKS_PER_WORKER
+from src.metrics import metrics
+from src.query_language import parse_condition
+from src.record_format import decoder
+
+
+def _scan_partition(path, pairs, spec, compression, condition):
+    """
+    Runs in a worker process: maps the segment itself and returns the records of the partition matching the condition.
+    """
+    decode = decoder(spec)
+    if compression:
+        return _matches(CompressedSegment(path), pairs, decode, condition)
+    with open(path, 'rb') as file:
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            return _matches(data, pairs, decode, condition)
+
+
+def _matches(data, pairs, decode, condition):
+    results = []
+    for i in range(0, len(pairs), 2):
+        obj = decode(data[pairs[i]:pairs[i + 1]])
+        if condition.matches(obj):
+            results.append(obj)
+    return results
+
+
+def _id_order(obj):
+    id = obj.get('id')
+    return id if type(id) is int else -1
+
+
+class ParallelScanner:
+    """
+    Evaluates a condition over a whole table in a pool of worker processes. The live records are split into
+    partitions of one segment, every worker maps the segment file itself, parses and filters its partition
+    and only sends the matching records back. The partial results are merged back into id order.
+    args:
+    storage (LogStorage): The storage engine that keeps the table files
+    workers (int): Number of worker processes, defaults to the number of CPUs
+    min_records (int): Tables with fewer records are left to a serial scan, the pool would cost more than it saves
+    lock (callable): lock(table_name) returns the lock held until the workers are done, it has to keep a compaction
+    from removing the segments the workers still have to open
+    """
+    def __init__(self, storage, workers=None, min_records=PARALLEL_SCAN_MIN_RECORDS, lock=None) -> None:
+        self.storage = storage
+        self.workers = workers or os.cpu_count() or 1
+        self.min_records = min_records
+        self.lock = lock
+        self._pool = None
+
+    def scan(self, table_name, condition):
+        """
+        Returns an iterator over the records matching the condition, or None if the table is better scanned serially.
+        The workers open the segment files by path, so the results are collected before the lock is released.
+        """
+        condition = parse_condition(condition)  # Sent to the workers as it is, they do not parse its text again
+        with self.lock(table_name) if self.lock else nullcontext():
+            segments = self.storage.partitions(table_name)
+            records = sum(len(pairs) for _, pairs, _, _ in segments) // 2
+            if records < max(self.min_records, 1):
+                return None
+            size = 2 * math.ceil(records / (self.workers * PARALLEL_SCAN_TASKS_PER_WORKER))  # Two offsets per record
+
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(max_workers=self.workers)
+            futures = [self._pool.submit(_scan_partition, path, pairs[start:start + size], spec, compression, condition)
+                       for path, pairs, spec, compression in segments for start in range(0, len(pairs), size)]
+            results = [future.result() for future in futures]
+        metrics.count("storage.records_scanned", records)
+        return heapq.merge(*results, key=_id_order)
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
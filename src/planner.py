@@ -0,0 +1,217 @@
+import math
+from collections import Counter
+from src.constants import SCAN_COST, FETCH_COST, INDEX_BUILD_COST
+from src.query_language import COMPARISONS, Comparison, In, And, Or, Not, parse_condition
+
+DEFAULT_SELECTIVITY = 1 / 3  # Used when there are no statistics for a field
+
+
+class FieldStats:
+    """
+    Statistics of one field: how often every value occurs, and its smallest and largest numeric value.
+    """
+    def __init__(self):
+        self.values = Counter()
+        self.min = None
+        self.max = None
+        self._bounds_stale = False
+
+    @property
+    def distinct(self):
+        return len(self.values)
+
+    def add(self, value):
+        if not self._hashable(value):
+            return
+        self.values[value] += 1
+        if self._is_number(value):
+            if self.min is None or value < self.min:
+                self.min = value
+            if self.max is None or value > self.max:
+                self.max = value
+
+    def remove(self, value):
+        if not self._hashable(value) or not self.values[value]:
+            return
+        self.values[value] -= 1
+        if not self.values[value]:
+            del self.values[value]
+            if value == self.min or value == self.max:
+                self._bounds_stale = True  # Recomputed the next time the bounds are needed
+
+    def bounds(self):
+        if self._bounds_stale:
+            numbers = [value for value in self.values if self._is_number(value)]
+            self.min = min(numbers, default=None)
+            self.max = max(numbers, default=None)
+            self._bounds_stale = False
+        return self.min, self.max
+
+    @staticmethod
+    def _is_number(value):
+        return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+    @staticmethod
+    def _hashable(value):
+        return not isinstance(value, (dict, list))
+
+
+class TableStats:
+    """
+    Row count and per-field statistics of a table, kept up to date as records are added and removed.
+    """
+    def __init__(self):
+        self.row_count = 0
+        self.fields = {}
+
+    @classmethod
+    def from_records(cls, records):
+        stats = cls()
+        for obj in records:
+            stats.add(obj)
+        return stats
+
+    def add(self, obj):
+        self.row_count += 1
+        for field, value in obj.items():
+            if field not in self.fields:
+                self.fields[field] = FieldStats()
+            self.fields[field].add(value)
+
+    def remove(self, obj):
+        self.row_count -= 1
+        for field, value in obj.items():
+            if field in self.fields:
+                self.fields[field].remove(value)
+
+    def selectivity(self, condition):
+        """
+        Estimates which fraction of the rows matches the condition.
+        """
+        if isinstance(condition, Comparison):
+            field = self.fields.get(condition.field)
+            if field is None or not field.distinct:
+                return DEFAULT_SELECTIVITY
+            equal = field.values.get(condition.value, 0) / max(self.row_count, 1) if FieldStats._hashable(condition.value) else 0
+            if condition.op == '==':
+                return equal
+            if condition.op == '!=':
+                return 1 - equal
+            return self._range_selectivity(field, condition.op, condition.value)
+        if isinstance(condition, In):
+            return min(1.0, sum(self.selectivity(Comparison(condition.field, '==', value)) for value in condition.values))
+        if isinstance(condition, And):
+            return math.prod(self.selectivity(child) for child in condition.children)
+        if isinstance(condition, Or):
+            return min(1.0, sum(self.selectivity(child) for child in condition.children))
+        if isinstance(condition, Not):
+            return 1 - self.selectivity(condition.child)
+        return DEFAULT_SELECTIVITY
+
+    @staticmethod
+    def _range_selectivity(field, op, value):
+        low, high = field.bounds()
+        if low is None or not FieldStats._is_number(value):
+            return DEFAULT_SELECTIVITY
+        if high == low:
+            return 1.0 if COMPARISONS[op](low, value) else 0.0
+        below = min(max((value - low) / (high - low), 0.0), 1.0)
+        return below if op in ('<', '<=') else 1 - below
+
+
+class Plan:
+    """
+    How a condition is going to be answered: 'index' uses existing indexes, 'build_index' builds the
+    missing ones first and 'scan' reads the whole table.
+    """
+    def __init__(self, kind, fields=(), estimated_rows=0, cost=0.0, scan_cost=0.0):
+        self.kind = kind
+        self.fields = set(fields)
+        self.estimated_rows = estimated_rows
+        self.cost = cost
+        self.scan_cost = scan_cost
+
+    def to_dict(self):
+        return {
+            "plan": self.kind,
+            "fields": sorted(self.fields),
+            "estimated_rows": round(self.estimated_rows, 2),
+            "estimated_cost": round(self.cost, 2),
+            "scan_cost": round(self.scan_cost, 2),
+        }
+
+    def __repr__(self):
+        return f"Plan({self.to_dict()})"
+
+
+class QueryPlanner:
+    """
+    Picks the cheapest way to find the records matching a condition, based on the table statistics.
+    An index is built only once a field has been queried often enough for the saved scans to pay for it.
+    """
+    def __init__(self):
+        self.query_counts = Counter()
+
+    def plan(self, table_name, stats, condition, indexed_fields, can_build=True, record=True):
+        condition = parse_condition(condition)
+        rows = stats.row_count
+        scan_cost = rows * SCAN_COST
+        estimated_rows = rows * stats.selectivity(condition)
+        paths = self._paths(stats, condition)
+
+        if record:
+            self._record(table_name, paths)
+
+        indexed = [path for path in paths if path[0] <= indexed_fields]
+        if indexed:
+            fields, path_rows, cost = min(indexed, key=lambda path: path[2])
+            if cost < scan_cost:
+                return Plan('index', fields, path_rows, cost, scan_cost)
+
+        unindexed = [path for path in paths if not path[0] <= indexed_fields]
+        if can_build and unindexed:
+            fields, path_rows, cost = min(unindexed, key=lambda path: path[2])
+            missing = fields - indexed_fields
+            build_cost = len(missing) * rows * INDEX_BUILD_COST
+            seen = min(self.query_counts[(table_name, field)] for field in missing)
+            if seen * (scan_cost - cost) > build_cost:  # The scans saved so far would have paid for the index
+                return Plan('build_index', fields, path_rows, build_cost + cost, scan_cost)
+
+        return Plan('scan', (), estimated_rows, scan_cost, scan_cost)
+
+    def record(self, table_name, condition):
+        """
+        Counts a query that is answered without a plan, e.g. by the scan that collects the first statistics of a table.
+        """
+        self._record(table_name, self._paths(TableStats(), parse_condition(condition)))
+
+    def _record(self, table_name, paths):
+        for fields in {frozenset(fields) for fields, _, _ in paths}:
+            for field in fields:
+                self.query_counts[(table_name, field)] += 1
+
+    def _paths(self, stats, condition):
+        """
+        Returns the ways an index can narrow the condition down, as (fields, estimated rows, cost) tuples.
+        """
+        rows = max(stats.row_count, 1)
+        lookup_cost = math.log(rows + 1, 64)  # Height of a B+ tree with a high fan-out
+
+        if isinstance(condition, Comparison) and condition.op != '!=':
+            matched = rows * stats.selectivity(condition)
+            return [(frozenset([condition.field]), matched, lookup_cost + matched * FETCH_COST)]
+        if isinstance(condition, In):
+            matched = rows * stats.selectivity(condition)
+            return [(frozenset([condition.field]), matched, len(condition.values) * lookup_cost + matched * FETCH_COST)]
+        if isinstance(condition, And):
+            return [path for child in condition.children for path in self._paths(stats, child)]
+        if isinstance(condition, Or):
+            fields, matched, cost = frozenset(), 0, 0
+            for child in condition.children:
+                child_paths = self._paths(stats, child)
+                if not child_paths:
+                    return []
+                child_fields, child_rows, child_cost = min(child_paths, key=lambda path: path[2])
+                fields, matched, cost = fields | child_fields, matched + child_rows, cost + child_cost
+            return [(fields, matched, cost)]
+        return []
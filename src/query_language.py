@@ -1,43 +1,623 @@
+import ast
+import base64
+import binascii
 import json
+import operator
+import re
+from functools import lru_cache
 
-class QueryParser:
+MISSING = object()
+
+_TOKEN_RE = re.compile(r"""
+    \s*(?:
+        (?P<string>"(?:[^"\\]|\\.)*"|'(?:[^'\\]|\\.)*')
+      | (?P<number>-?\d+(?:\.\d+)?(?:[eE][+-]?\d+)?)(?![\w.])
+      | (?P<op>==|!=|<=|>=|<|>|=)
+      | (?P<punct>[(),\[\]{}:?])
+      | (?P<word>[A-Za-z_][\w.]*)
+    )""", re.VERBOSE)
+
+COMPARISONS = {
+    '==': operator.eq,
+    '!=': operator.ne,
+    '<': operator.lt,
+    '<=': operator.le,
+    '>': operator.gt,
+    '>=': operator.ge,
+}
+
+_END_RE = re.compile(r"\s*$")
+
+_PAGING_RE = re.compile(r"(?:\s+limit\s+(?P<limit>\d+))?(?:\s+offset\s+(?P<offset>\d+))?(?:\s+cursor\s+(?P<cursor>[\w=-]+))?\s*$", re.IGNORECASE)
+
+_KEYWORDS = {'and', 'or', 'not', 'in'}
+_LITERALS = {'true': True, 'false': False, 'null': None}
+_LEGACY_LITERALS = {'true': True, 'null': None}
+
+
+def tokenize(text):
     """
-    A class to parse the query string and return a tuple of the command and the arguments
+    Splits a condition into (kind, value) tokens. Quoted strings are unescaped and numbers are converted.
     """
-    def __init__(self, string: str) -> None:
-        self.string = string
-    
-    @staticmethod
-    def parse(query):
-        tokens = query.split()
-        command = tokens[0].lower()
+    tokens = []
+    pos = 0
+    while True:
+        token = _token(text, pos)
+        if token is None:
+            return tokens
+        token, pos = token
+        tokens.append(token)
+
+
+def _token(text, pos):
+    """
+    Returns the (kind, value) token at `pos` and the position right after it, or None at the end of the text.
+    """
+    match = _TOKEN_RE.match(text, pos)
+    if match is None:
+        if _END_RE.match(text, pos):
+            return None
+        raise ValueError(f"Invalid condition: unexpected character at {pos} in {text!r}")
+    kind = match.lastgroup
+    value = match.group(kind)
+    if kind == 'string':
+        value = _unquote(value)
+    elif kind == 'number':
+        value = float(value) if any(c in value for c in '.eE') else int(value)
+    elif kind == 'op' and value == '=':
+        value = '=='
+    elif kind == 'word' and value.lower() in _KEYWORDS:
+        kind, value = 'keyword', value.lower()
+    return (kind, value), match.end()
+
+
+def _legacy_value(text):
+    """
+    Returns what the first condition parser read a quoted operand as, it did not keep "null", "true" or integers
+    as strings. Returns MISSING for any other text.
+    """
+    if text in _LEGACY_LITERALS:
+        return _LEGACY_LITERALS[text]
+    try:
+        return int(text)
+    except ValueError:
+        return MISSING
+
+
+def _unquote(text):
+    if text[0] == '"':
+        try:
+            return json.loads(text)
+        except ValueError:
+            pass  # An escape JSON does not know, e.g. \'
+    return ast.literal_eval(text)
+
+
+class Param:
+    """
+    A ? placeholder in a query, replaced by the parameter with this index when the query is executed.
+    """
+    __slots__ = ('index',)
+
+    def __init__(self, index):
+        self.index = index
+
+    def __repr__(self):
+        return f"Param({self.index})"
+
+
+def bind_value(value, params):
+    """
+    Returns a copy of a parsed value (or object, or list) with its placeholders replaced by the parameters.
+    Always a copy, the caller may change it, e.g. an insert sets the id of the object.
+    """
+    if type(value) is Param:
+        return params[value.index]
+    if type(value) is dict:
+        return {key: bind_value(item, params) for key, item in value.items()}
+    if type(value) is list:
+        return [bind_value(item, params) for item in value]
+    return value
+
+
+def field_getter(path):
+    """
+    Returns a function that reads a (possibly nested, dot separated) field from a record.
+    """
+    keys = path.split('.')
+    if len(keys) == 1:
+        key = keys[0]
+        return lambda obj: obj.get(key, MISSING)
+
+    def get(obj):
+        for key in keys:
+            if not isinstance(obj, dict) or key not in obj:
+                return MISSING
+            obj = obj[key]
+        return obj
+    return get
+
+
+class Condition:
+    """
+    A compiled condition. `matches(obj)` tells whether a record satisfies it.
+    Conditions pickle as their parts and are compiled again when unpickled, e.g. in a parallel scan worker.
+    """
+    text = ''
+    params = 0  # Number of ? placeholders, set on the condition the parser returns
+    _normalized = None
+
+    def __str__(self):
+        return self.text
+
+    def normalized(self):
+        """
+        A canonical text of the condition, the same for conditions that only differ in quoting, spacing,
+        the case of the keywords or the order of the parts of an AND, OR or IN. Built once per condition.
+        """
+        if self._normalized is None:
+            self._normalized = self._normalize()
+        return self._normalized
+
+
+class Comparison(Condition):
+    def __init__(self, field, op, value):
+        self.field = field
+        self.op = op
+        self.value = value
+        get = field_getter(field)
+        compare = COMPARISONS[op]
+
+        def matches(obj):
+            current = get(obj)
+            if current is MISSING:
+                return False
+            try:
+                return compare(current, value)
+            except TypeError:  # e.g. a string compared with a number
+                return False
+        self.matches = matches
+
+    def __reduce__(self):
+        return Comparison, (self.field, self.op, self.value)
+
+    def _normalize(self):
+        return f"{json.dumps(self.field)} {self.op} {json.dumps(self.value, sort_keys=True)}"
+
+    def bind(self, params):
+        return Comparison(self.field, self.op, bind_value(self.value, params)) if _has_params(self.value) else self
+
+
+class In(Condition):
+    def __init__(self, field, values):
+        self.field = field
+        self.values = values
+        get = field_getter(field)
+
+        def matches(obj):
+            current = get(obj)
+            return current is not MISSING and current in values
+        self.matches = matches
+
+    def __reduce__(self):
+        return In, (self.field, self.values)
+
+    def _normalize(self):
+        return f"{json.dumps(self.field)} in ({', '.join(sorted(json.dumps(value, sort_keys=True) for value in self.values))})"
+
+    def bind(self, params):
+        return In(self.field, bind_value(self.values, params)) if _has_params(self.values) else self
+
+
+class And(Condition):
+    def __init__(self, children):
+        self.children = children
+        checks = [child.matches for child in children]
+        self.matches = lambda obj: all(check(obj) for check in checks)
+
+    def __reduce__(self):
+        return And, (self.children,)
+
+    def _normalize(self):
+        return "(" + " and ".join(sorted(child.normalized() for child in self.children)) + ")"
+
+    def bind(self, params):
+        return And([child.bind(params) for child in self.children])
+
+
+class Or(Condition):
+    def __init__(self, children):
+        self.children = children
+        checks = [child.matches for child in children]
+        self.matches = lambda obj: any(check(obj) for check in checks)
+
+    def __reduce__(self):
+        return Or, (self.children,)
+
+    def _normalize(self):
+        return "(" + " or ".join(sorted(child.normalized() for child in self.children)) + ")"
+
+    def bind(self, params):
+        return Or([child.bind(params) for child in self.children])
+
+
+class Not(Condition):
+    def __init__(self, child):
+        self.child = child
+        check = child.matches
+        self.matches = lambda obj: not check(obj)
+
+    def __reduce__(self):
+        return Not, (self.child,)
+
+    def _normalize(self):
+        return "not " + self.child.normalized()
+
+    def bind(self, params):
+        return Not(self.child.bind(params))
+
+
+def _has_params(value):
+    if type(value) is Param:
+        return True
+    if type(value) is dict:
+        return any(_has_params(item) for item in value.values())
+    if type(value) is list:
+        return any(_has_params(item) for item in value)
+    return False
 
+
+def bind_condition(condition, params):
+    """
+    Returns the condition with its ? placeholders replaced by the parameters, a condition without any is returned as is.
+    The text of a bound condition is its normalized form, it is only shown (e.g. by explain) and never parsed again.
+    """
+    if len(params) != condition.params:
+        raise ValueError(f"The condition expects {condition.params} parameters but got {len(params)}")
+    if not condition.params:
+        return condition
+    bound = condition.bind(params)
+    bound.text = bound.normalized()
+    return bound
+
+
+class ConditionParser:
+    """
+    Recursive descent parser for conditions:
+        condition  := and_expr (OR and_expr)*
+        and_expr   := not_expr (AND not_expr)*
+        not_expr   := NOT not_expr | '(' condition ')' | comparison
+        comparison := field (== | != | < | <= | > | >=) value | field IN (value, ...)
+    Fields may be quoted and use dots for nested fields, values are JSON-like literals. A ? stands for a parameter.
+    A quoted "true", "null" or integer compared with == or != also matches the literal, as it always has.
+    """
+    what = 'condition'
+
+    def __init__(self, text):
+        self.text = text
+        self.tokens = tokenize(text)
+        self.pos = 0
+        self.params = 0
+
+    def parse(self):
+        if not self.tokens:
+            raise ValueError("Invalid condition: the condition is empty")
+        condition = self._or()
+        self._expect_end()
+        condition.text = self.text.strip()
+        condition.params = self.params
+        return condition
+
+    def _expect_end(self):
+        kind, value = self._peek()
+        if kind is not None:
+            raise ValueError(f"Invalid {self.what}: unexpected {value!r} in {self.text!r}")
+
+    def _peek(self):
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else (None, None)
+
+    def _next(self):
+        token = self._peek()
+        if token[0] is None:
+            raise ValueError(f"Invalid {self.what}: unexpected end of {self.text!r}")
+        self.pos += 1
+        return token
+
+    def _expect(self, kind, value):
+        token = self._next()
+        if token != (kind, value):
+            raise ValueError(f"Invalid {self.what}: expected {value!r} but got {token[1]!r} in {self.text!r}")
+
+    def _or(self):
+        children = [self._and()]
+        while self._peek() == ('keyword', 'or'):
+            self.pos += 1
+            children.append(self._and())
+        return children[0] if len(children) == 1 else Or(children)
+
+    def _and(self):
+        children = [self._not()]
+        while self._peek() == ('keyword', 'and'):
+            self.pos += 1
+            children.append(self._not())
+        return children[0] if len(children) == 1 else And(children)
+
+    def _not(self):
+        if self._peek() == ('keyword', 'not'):
+            self.pos += 1
+            return Not(self._not())
+        if self._peek() == ('punct', '('):
+            self.pos += 1
+            condition = self._or()
+            self._expect('punct', ')')
+            return condition
+        return self._comparison()
+
+    def _comparison(self):
+        kind, field = self._next()
+        if kind not in ('string', 'word'):
+            raise ValueError(f"Invalid condition: expected a field name but got {field!r} in {self.text!r}")
+
+        kind, op = self._next()
+        if (kind, op) == ('keyword', 'in'):
+            return In(field, self._list())
+        if kind != 'op':
+            raise ValueError(f"Invalid condition: expected an operator but got {op!r} in {self.text!r}")
+        quoted = self._peek()[0] == 'string'
+        value = self._value()
+        if quoted and op in ('==', '!=') and _legacy_value(value) is not MISSING:
+            # "id" == "5" matched the number 5 before conditions had types, it now matches the number and the string
+            condition = In(field, [value, _legacy_value(value)])
+            return condition if op == '==' else Not(condition)
+        return Comparison(field, op, value)
+
+    def _list(self):
+        kind, opening = self._next()
+        if (kind, opening) not in (('punct', '('), ('punct', '[')):
+            raise ValueError(f"Invalid condition: IN expects a list of values in {self.text!r}")
+        closing = ')' if opening == '(' else ']'
+        values = []
+        while self._peek() != ('punct', closing):
+            values.append(self._value())
+            if self._peek() == ('punct', ','):
+                self.pos += 1
+        self._expect('punct', closing)
+        return values
+
+    def _value(self):
+        kind, value = self._next()
+        if kind in ('string', 'number'):
+            return value
+        if kind == 'word':
+            return _LITERALS.get(value.lower(), value)  # Bare words other than true/false/null are strings
+        if kind == 'punct':
+            if value == '?':
+                self.params += 1
+                return Param(self.params - 1)
+            if value == '[':
+                items = []
+                while self._peek() != ('punct', ']'):
+                    items.append(self._value())
+                    if self._peek() == ('punct', ','):
+                        self.pos += 1
+                self.pos += 1
+                return items
+            if value == '{':
+                obj = {}
+                while self._peek() != ('punct', '}'):
+                    kind, key = self._next()
+                    if kind not in ('string', 'word'):
+                        raise ValueError(f"Invalid {self.what}: expected a key but got {key!r} in {self.text!r}")
+                    self._expect('punct', ':')
+                    obj[key] = self._value()
+                    if self._peek() == ('punct', ','):
+                        self.pos += 1
+                self.pos += 1
+                return obj
+        raise ValueError(f"Invalid {self.what}: expected a value but got {value!r} in {self.text!r}")
+
+
+@lru_cache(maxsize=1024)
+def _parse_condition_text(text):
+    return ConditionParser(text).parse()
+
+
+def parse_condition(condition):
+    """
+    Compiles a condition string once, compiled conditions are cached and passed through unchanged.
+    """
+    if isinstance(condition, Condition):
+        return condition
+    parsed = _parse_condition_text(condition)
+    if parsed.params:
+        raise ValueError(f"The condition {condition!r} has ? placeholders, it has to be run as a query with parameters")
+    return parsed
+
+
+def encode_cursor(last_id):
+    """
+    Builds the opaque continuation cursor that resumes a select after the record with this id.
+    """
+    return base64.urlsafe_b64encode(json.dumps({"after": last_id}).encode()).decode()
+
+
+def decode_cursor(cursor):
+    if cursor is None:
+        return None
+    try:
+        return json.loads(base64.urlsafe_b64decode(cursor.encode()))["after"]
+    except (binascii.Error, ValueError, KeyError, TypeError):
+        raise ValueError(f"Invalid cursor: {cursor}")
+
+
+def parse_paging(text):
+    """
+    Splits the trailing LIMIT, OFFSET and CURSOR clauses off a condition.
+    Returns the condition text and a dict with the paging arguments (empty if there are none).
+    """
+    match = _PAGING_RE.search(text)
+    paging = {}
+    if match.group('limit') is not None:
+        paging['limit'] = int(match.group('limit'))
+        if paging['limit'] < 1:
+            raise ValueError(f"Invalid limit: {paging['limit']}, a page holds at least one record")
+    if match.group('offset') is not None:
+        paging['offset'] = int(match.group('offset'))
+    if match.group('cursor') is not None:
+        paging['cursor'] = match.group('cursor')
+    return text[:match.start()], paging
+
+
+class StatementParser(ConditionParser):
+    """
+    Parses a whole query:
+        insert [many] table value
+        select table where condition [limit n] [offset n] [cursor c]
+        update table set object where condition
+        delete table where condition
+        flush table
+        explain (select | update | delete) ...
+    Objects and lists are written like the values of conditions, so strings may use either quote.
+    A ? may stand for any value. Tokens are read as they are needed, the condition that ends a query
+    is compiled from its text through the cache of parse_condition, once no matter which query it is part of.
+    """
+    what = 'query'
+
+    def __init__(self, text):
+        self.text = text
+        self.tokens = []
+        self.pos = 0
+        self.params = 0
+        self._end = 0  # Where the text after the last read token starts
+
+    def parse(self):
+        command = self._word()
         if command == 'insert':
-            table_name = tokens[1]
-            tokens = query.split()
-            json_string = ' '.join(tokens[2:])  # only take the JSON part of the string
-            json_string = json_string.replace("'", "\"")
-            object = json.loads(json_string)
-            return ('insert', table_name, object)
+            many = self._peek()[0] == 'word' and self._peek()[1].lower() == 'many'
+            if many:
+                self.pos += 1
+            table_name = self._table()
+            value = self._value()
+            self._expect_end()
+            if not many:
+                return ('insert', table_name, value)
+            if not isinstance(value, list):
+                raise ValueError("insert many expects a list of objects")
+            return ('insert_many', table_name, value)
         elif command == 'select':
-            table_name = tokens[1]
-            condition = ' '.join(tokens[3:])
-            return ('select', table_name, condition)
+            table_name = self._table()
+            self._keyword('where')
+            condition, paging = parse_paging(self._rest())
+            return ('select', table_name, _parse_condition_text(condition), paging)
         elif command == 'update':
-            table_name = tokens[1]
-            updates = json.loads(' '.join(tokens[3:tokens.index('where')]))
-            condition = ' '.join(tokens[tokens.index('where') + 1:])
-            return ('update', table_name, updates, condition)
+            table_name = self._table()
+            self._keyword('set')
+            updates = self._value()
+            if not isinstance(updates, dict):
+                raise ValueError("update expects an object with the new values")
+            self._keyword('where')
+            return ('update', table_name, updates, _parse_condition_text(self._rest()))
         elif command == 'delete':
-            table_name = tokens[1]
-            condition = ' '.join(tokens[3:])
-            return ('delete', table_name, condition)
+            table_name = self._table()
+            self._keyword('where')
+            return ('delete', table_name, _parse_condition_text(self._rest()))
         elif command == 'flush':
-            table_name = tokens[1]
+            table_name = self._table()
+            self._expect_end()
             return ('flush', table_name)
+        elif command == 'explain':
+            parser = StatementParser(self._rest())
+            explained = parser.parse()
+            self.params += parser.params
+            if explained[0] not in ('select', 'update', 'delete'):
+                raise ValueError(f"Can not explain {explained[0]}")
+            return ('explain', explained[1], explained[3] if explained[0] == 'update' else explained[2])
         else:
             raise ValueError(f"Unknown command: {command}")
 
+    def _peek(self):
+        if self.pos == len(self.tokens):
+            token = _token(self.text, self._end)
+            if token is None:
+                return (None, None)
+            token, self._end = token
+            self.tokens.append(token)
+        return self.tokens[self.pos]
+
+    def _rest(self):
+        return self.text[self._end:].strip()
+
+    def _word(self):
+        kind, value = self._next()
+        if kind not in ('word', 'keyword'):
+            raise ValueError(f"Invalid query: expected a command but got {value!r} in {self.text!r}")
+        return value.lower()
+
+    def _keyword(self, word):
+        kind, value = self._next()
+        if kind != 'word' or value.lower() != word:
+            raise ValueError(f"Invalid query: expected {word!r} but got {value!r} in {self.text!r}")
+
+    def _table(self):
+        kind, value = self._next()
+        if kind not in ('word', 'string'):
+            raise ValueError(f"Invalid query: expected a table name but got {value!r} in {self.text!r}")
+        return value
+
+
+class PreparedStatement:
+    """
+    A parsed query. bind fills its ? placeholders with parameters, so running it again only binds them.
+    args:
+    query (str): The query, ? placeholders stand for values given when it is executed
+    """
+    def __init__(self, query) -> None:
+        parser = StatementParser(query)
+        self.query = query
+        self.parts = parser.parse()
+        self.value_params = parser.params  # The placeholders of the objects, they come before those of the condition
+        self.params = parser.params + sum(part.params for part in self.parts if isinstance(part, Condition))
+
+    def bind(self, params=()):
+        """
+        Returns the parsed query, like QueryParser.parse, with the parameters in place of the placeholders.
+        Objects are copied, so the statement can be run again after a command changed them.
+        """
+        if len(params) != self.params:
+            raise ValueError(f"The query expects {self.params} parameters but got {len(params)}")
+        bound = []
+        start = self.value_params
+        for part in self.parts:
+            if isinstance(part, Condition):  # Numbers its own placeholders from 0
+                bound.append(bind_condition(part, params[start:start + part.params]))
+                start += part.params
+            elif isinstance(part, (dict, list)):
+                bound.append(bind_value(part, params))
+            else:
+                bound.append(part)
+        return tuple(bound)
+
+
+@lru_cache(maxsize=1024)
+def prepare(query):
+    """
+    Returns the prepared statement of a query. Statements are cached by their text, so a query template
+    with ? placeholders is parsed once however often it runs.
+    """
+    return PreparedStatement(query)
+
+
+class QueryParser:
+    """
+    A class to parse the query string and return a tuple of the command and the arguments
+    """
+    def __init__(self, string: str) -> None:
+        self.string = string
+
+    @staticmethod
+    def parse(query, params=()):
+        return prepare(query).bind(params)
+
 
 class QueryExecutor:
     """
@@ -45,16 +625,32 @@ class QueryExecutor:
     """
     def __init__(self, db):
         self.db = db
-    
-    def execute(self, query):
-        parsed_query = QueryParser.parse(query)
+
+    def prepare(self, query):
+        """
+        Parses a query once, e.g. 'select users where "age" == ?', to be executed with different parameters.
+        """
+        return prepare(query)
+
+    def execute(self, query, *params):
+        """
+        Runs a query, given as text or as a prepared statement. The parameters fill its ? placeholders in order.
+        """
+        statement = query if isinstance(query, PreparedStatement) else prepare(query)
+        parsed_query = statement.bind(params)
         command = parsed_query[0]
 
         if command == 'insert':
             _, table_name, object = parsed_query
             self.db.insert(table_name, object)
+        elif command == 'insert_many':
+            _, table_name, objects = parsed_query
+            self.db.insert_many(table_name, objects)
         elif command == 'select':
-            _, table_name, condition = parsed_query
+            _, table_name, condition, paging = parsed_query
+            if paging:
+                data, cursor = self.db.select_page(table_name, condition, **paging)
+                return {"data": data, "cursor": cursor}
             return self.db.select(table_name, condition)
         elif command == 'update':
             _, table_name, updates, condition = parsed_query
@@ -64,5 +660,8 @@ class QueryExecutor:
             self.db.delete(table_name, condition)
         elif command == 'flush':
             self.db.flush(parsed_query[1])
+        elif command == 'explain':
+            _, table_name, condition = parsed_query
+            return self.db.explain(table_name, condition)
         else:
-            raise ValueError(f"Unknown command: {command}")
\ No newline at end of file
+            raise ValueError(f"Unknown command: {command}")
@@ -0,0 +1,221 @@
+import json
+import os
+import struct
+
+_NONE, _FALSE, _TRUE, _INT, _FLOAT, _STR, _LIST, _DICT = range(8)
+_DOUBLE = struct.Struct('>d')
+_END = 0x0A  # Last byte of every record, a record without it was torn by a crash
+
+
+class JsonFormat:
+    """
+    One JSON document per line. json.dumps escapes newlines inside strings, so every newline ends a record.
+    """
+    name = 'json'
+
+    @staticmethod
+    def encode_many(objs):
+        return [json.dumps(obj).encode() + b'\n' for obj in objs]
+
+    @staticmethod
+    def decode(data):
+        return json.loads(data)
+
+    @staticmethod
+    def scan(data, pos):
+        """
+        Yields (end, record) for every complete record from `pos` on, `end` is right after its last byte.
+        """
+        while True:
+            end = data.find(b'\n', pos)
+            if end == -1:  # Nothing left, or a torn write without its newline
+                return
+            yield end + 1, json.loads(data[pos:end])
+            pos = end + 1
+
+    def spec(self):
+        return ('json', None)
+
+
+class BinaryFormat:
+    """
+    Compact binary records: a varint length, the record and a newline as end marker. Field names are replaced
+    by their number in the field dictionary of the table (<table>.fields), so a repeated key like "email" takes
+    a byte or two instead of its quoted name. Values are a type byte followed by a zigzag varint for integers,
+    8 bytes for floats, a varint length and UTF-8 for strings, or a varint count and the items for lists
+    and objects. No whitespace and no escaping, so records are smaller and are found by their length alone.
+    args:
+    path (str): The path to the field dictionary, one JSON string per line in the order the numbers were given out
+    """
+    name = 'binary'
+
+    def __init__(self, path) -> None:
+        self.path = path
+        self.names = []
+        self.numbers = {}
+        if os.path.exists(path):
+            with open(path, 'rb') as file:
+                for line in file:
+                    if not line.endswith(b'\n'):
+                        break  # Torn, no record was written with it since it is synced before use
+                    self._add(json.loads(line))
+
+    def encode_many(self, objs):
+        """
+        Encodes the records and persists the field names they introduce before any of them can reach a table file.
+        """
+        known = len(self.names)
+        records = []
+        for obj in objs:
+            body = bytearray()
+            self._object(obj, body)
+            head = bytearray()
+            _varint(len(body), head)
+            records.append(bytes(head + body) + b'\n')
+        if len(self.names) > known:
+            with open(self.path, 'ab') as file:
+                file.write(b''.join(json.dumps(name).encode() + b'\n' for name in self.names[known:]))
+                file.flush()
+                os.fsync(file.fileno())
+        return records
+
+    def decode(self, data):
+        return decode_binary(data, self.names)
+
+    def scan(self, data, pos):
+        """
+        Yields (end, record) for every complete record from `pos` on, `end` is right after its end marker.
+        """
+        size = len(data)
+        while pos < size:
+            try:
+                length, start = _read_varint(data, pos)
+            except IndexError:
+                return  # Torn in the middle of the length
+            end = start + length + 1
+            if end > size or data[end - 1] != _END:
+                return  # Torn by a crash
+            yield end, decode_binary(data[pos:end - 1], self.names)
+            pos = end
+
+    def spec(self):
+        return ('binary', list(self.names))
+
+    def _add(self, name):
+        self.numbers[name] = len(self.names)
+        self.names.append(name)
+
+    def _object(self, obj, out):
+        _varint(len(obj), out)
+        for key, value in obj.items():
+            if type(key) is not str:
+                key = json.dumps(key).strip('"')  # The key JSON would store, e.g. "1" for 1
+            number = self.numbers.get(key)
+            if number is None:
+                self._add(key)
+                number = len(self.names) - 1
+            _varint(number, out)
+            self._value(value, out)
+
+    def _value(self, value, out):
+        kind = type(value)
+        if value is None:
+            out.append(_NONE)
+        elif kind is bool:
+            out.append(_TRUE if value else _FALSE)
+        elif kind is int:
+            out.append(_INT)
+            _varint(value << 1 if value >= 0 else (-value << 1) - 1, out)
+        elif kind is float:
+            out.append(_FLOAT)
+            out += _DOUBLE.pack(value)
+        elif kind is str:
+            encoded = value.encode()
+            out.append(_STR)
+            _varint(len(encoded), out)
+            out += encoded
+        elif kind in (list, tuple):
+            out.append(_LIST)
+            _varint(len(value), out)
+            for item in value:
+                self._value(item, out)
+        elif kind is dict:
+            out.append(_DICT)
+            self._object(value, out)
+        else:
+            raise TypeError(f"Object of type {kind.__name__} is not JSON serializable")
+
+
+def decode_binary(data, names):
+    """
+    Decodes a record of BinaryFormat, `data` is the record without its end marker.
+    """
+    _, pos = _read_varint(data, 0)
+    obj, _ = _read_object(data, pos, names)
+    return obj
+
+
+def decoder(spec):
+    """
+    Returns the decode function for the (format, field names) pair of Format.spec(), for worker processes.
+    """
+    kind, names = spec
+    if kind == 'json':
+        return json.loads
+    return lambda data: decode_binary(data, names)
+
+
+def _varint(value, out):
+    while value > 0x7F:
+        out.append(value & 0x7F | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _read_varint(data, pos):
+    result = shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return result, pos
+        shift += 7
+
+
+def _read_object(data, pos, names):
+    count, pos = _read_varint(data, pos)
+    obj = {}
+    for _ in range(count):
+        number, pos = _read_varint(data, pos)
+        obj[names[number]], pos = _read_value(data, pos, names)
+    return obj, pos
+
+
+def _read_value(data, pos, names):
+    kind = data[pos]
+    pos += 1
+    if kind == _STR:
+        length, pos = _read_varint(data, pos)
+        return data[pos:pos + length].decode(), pos + length
+    if kind == _INT:
+        value, pos = _read_varint(data, pos)
+        return (value >> 1) if not value & 1 else -((value + 1) >> 1), pos
+    if kind == _NONE:
+        return None, pos
+    if kind == _TRUE:
+        return True, pos
+    if kind == _FALSE:
+        return False, pos
+    if kind == _FLOAT:
+        return _DOUBLE.unpack_from(data, pos)[0], pos + 8
+    if kind == _LIST:
+        count, pos = _read_varint(data, pos)
+        items = []
+        for _ in range(count):
+            item, pos = _read_value(data, pos, names)
+            items.append(item)
+        return items, pos
+    if kind == _DICT:
+        return _read_object(data, pos, names)
+    raise ValueError(f"Unknown value type {kind} at {pos - 1}")
@@ -0,0 +1,97 @@
+import json
+import logging
+import os
+import queue
+import random
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from src.constants import SERVER_LOG_MAX_BYTES, SERVER_LOG_BACKUPS, SERVER_LOG_SAMPLE_RATE
+
+# Attributes every LogRecord has, the rest of its attributes are the fields passed to RequestLog
+_RECORD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {'message', 'asctime'}
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Formats a record as one JSON object per line: time, level, message and the fields of the request.
+    """
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "message": record.getMessage(),
+        }
+        entry.update((key, value) for key, value in vars(record).items() if key not in _RECORD_ATTRIBUTES)
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class _LazyQueueHandler(QueueHandler):
+    def prepare(self, record):
+        return record  # The queue never leaves the process, so the message and payload are formatted by the listener
+
+
+class _BatchedFileHandler(RotatingFileHandler):
+    def flush(self):
+        pass  # Called by emit after every record, the listener flushes once per batch instead
+
+    def flush_batch(self):
+        with self.lock:
+            if self.stream:
+                self.stream.flush()
+
+
+class _BatchingListener(QueueListener):
+    def handle(self, record):
+        super().handle(record)
+        if self.queue.empty():  # A burst of requests is written with one flush
+            for handler in self.handlers:
+                handler.flush_batch()
+
+
+class RequestLog:
+    """
+    The request log of the web server, kept off the request path: a request only puts the record on a queue,
+    a listener thread formats it as a JSON line and writes it to a rotating file, flushing once the queue is empty.
+    Messages and payloads are formatted by the listener, and only a `sample_rate` share of the successful requests
+    is logged at all; errors always are. The records of `logger` are no longer propagated to the root logger,
+    whose handlers would write them on the request path.
+    args:
+    logger (logging.Logger): The logger the records are sent to
+    path (str): The path to the log file, its directory is created if needed
+    max_bytes (int): Size of the log file after which it is rotated
+    backups (int): How many rotated files are kept
+    sample_rate (float): Share of the successful requests that are logged
+    """
+    def __init__(self, logger, path, max_bytes=SERVER_LOG_MAX_BYTES, backups=SERVER_LOG_BACKUPS,
+                 sample_rate=SERVER_LOG_SAMPLE_RATE) -> None:
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.logger = logger
+        self.path = path
+        self.sample_rate = sample_rate
+        self.queue = queue.SimpleQueue()
+        file_handler = _BatchedFileHandler(path, maxBytes=max_bytes, backupCount=backups, delay=True)
+        file_handler.setFormatter(JsonFormatter())
+        self.listener = _BatchingListener(self.queue, file_handler)
+        self.handler = _LazyQueueHandler(self.queue)
+
+        logger.addHandler(self.handler)
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+        self.listener.start()
+
+    def success(self, message, *args, **fields):
+        if self.sample_rate >= 1 or random.random() < self.sample_rate:
+            self.logger.info(message, *args, extra=fields)
+
+    def error(self, message, *args, **fields):
+        self.logger.error(message, *args, extra=fields)
+
+    def close(self):
+        """
+        Writes out the records still in the queue and closes the file.
+        """
+        self.logger.removeHandler(self.handler)
+        self.listener.stop()
+        for handler in self.listener.handlers:
+            handler.close()
@@ -0,0 +1,73 @@
+from collections import OrderedDict
+from copy import deepcopy
+from threading import Lock
+from src.metrics import metrics
+
+
+class ResultCache:
+    """
+    Keeps the results of recent selects, keyed by the table and the normalized condition, so a repeated query
+    skips the scan or index search. Every table has a version that each write increments; a result is only
+    served while its table is still at the version it was computed at. Results are evicted least recently used
+    first once all of them together hold more than `max_records` records.
+    args:
+    max_records (int): How many records the cached results may hold together, larger results are not cached
+    """
+    def __init__(self, max_records) -> None:
+        self.max_records = max_records
+        self.entries = OrderedDict()  # (table, normalized condition) -> (table version, records)
+        self.versions = {}
+        self.records = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = Lock()
+
+    def lookup(self, table_name, condition, compute):
+        """
+        Returns copies of the cached records matching the condition, or computes them with compute() on a miss.
+        The version is read before computing, so a result that raced with a write is stored as already stale.
+        """
+        key = (table_name, condition.normalized())
+        with self.lock:
+            version = self.versions.get(table_name, 0)
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] == version:
+                self.hits += 1
+                self.entries.move_to_end(key)
+                records = entry[1]
+            else:
+                self.misses += 1
+                records = None
+                if entry is not None:  # Computed before the last write, it can never be served again
+                    self._remove(key)
+        if records is not None:
+            metrics.count("result_cache.hits")
+            return deepcopy(records)  # Deep copies, so callers can not change the cached records or nested documents
+
+        metrics.count("result_cache.misses")
+        results = compute()
+        if len(results) <= self.max_records:
+            with self.lock:
+                if key in self.entries:
+                    self._remove(key)
+                self.entries[key] = (version, deepcopy(results))
+                self.records += len(results)
+                while self.records > self.max_records:
+                    self._remove(next(iter(self.entries)))
+        return results
+
+    def invalidate(self, table_name):
+        """
+        Called by every write to the table, the results computed before it are not served anymore.
+        """
+        with self.lock:
+            self.versions[table_name] = self.versions.get(table_name, 0) + 1
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {"entries": len(self.entries), "records": self.records, "hits": self.hits, "misses": self.misses,
+                    "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0}
+
+    def _remove(self, key):
+        self.records -= len(self.entries.pop(key)[1])
@@ -0,0 +1,56 @@
+import os
+from threading import Lock
+from src.constants import SEQUENCE_BLOCK_SIZE
+
+
+class Sequence:
+    """
+    Durable id allocator for a single table. Ids are handed out from memory in O(1),
+    the file only stores the highest id that has been reserved so far and is rewritten once per block.
+    After a crash the sequence restarts above the last reserved block, so an id is never handed out twice
+    (the unused rest of the block is skipped). close saves the last id handed out, so a clean restart skips none.
+    args:
+    path (str): The path to the metadata file of the sequence (<table>.seq)
+    initial (callable): Returns the highest id already stored in the table, only called when there is no metadata file yet
+    block_size (int): How many ids are reserved on disk at once
+    """
+    def __init__(self, path, initial=None, block_size=SEQUENCE_BLOCK_SIZE) -> None:
+        self.path = path
+        self.block_size = block_size
+        self.lock = Lock()
+
+        if os.path.exists(path):
+            with open(path, 'r') as file:
+                self.limit = int(file.read())
+        else:
+            self.limit = initial() if initial is not None else 0
+        self.next = self.limit + 1
+
+    def next_id(self):
+        return self.reserve(1)[0]
+
+    def reserve(self, count):
+        """
+        Reserves `count` consecutive ids and returns them as a range.
+        """
+        with self.lock:
+            first = self.next
+            last = first + count - 1
+            if last > self.limit:
+                self._persist(last + self.block_size)
+            self.next = last + 1
+            return range(first, last + 1)
+
+    def close(self):
+        with self.lock:
+            if self.limit != self.next - 1:
+                self._persist(self.next - 1)
+
+    def _persist(self, limit):
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as file:
+            file.write(str(limit))
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp_path, self.path)
+        self.limit = limit
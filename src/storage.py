@@ -0,0 +1,923 @@
+import json
+import mmap
+import os
+import re
+import time
+from array import array
+from bisect import bisect_right
+from contextlib import nullcontext
+from threading import RLock
+from src.compression import BlockCache, CompressedSegment, write_compressed
+from src.constants import MAX_FILE_SIZE, RECORD_FORMAT, SEGMENT_COMPRESSION, COMPRESSION_BLOCK_SIZE, BLOCK_CACHE_BLOCKS
+from src.metrics import metrics
+from src.record_format import BinaryFormat, JsonFormat
+
+
+class Storage:
+    """
+    Base class for the storage engines used by Core. A storage engine owns the files of every table
+    and knows how to append, scan and rewrite the records stored in them.
+    args:
+    db_path (str): The path to the directory where the table files are stored
+    """
+    def __init__(self, db_path) -> None:
+        self.db_path = db_path
+
+    def exists(self, table_name):
+        raise NotImplementedError
+
+    def append(self, table_name, obj):
+        return self.append_many(table_name, [obj])[0]
+
+    def append_many(self, table_name, objs):
+        raise NotImplementedError
+
+    def scan(self, table_name):
+        raise NotImplementedError
+
+    def read(self, table_name):
+        return [obj for _, obj in self.scan(table_name)]
+
+    def read_at(self, table_name, location):
+        raise NotImplementedError
+
+    def rewrite(self, table_name, records):
+        raise NotImplementedError
+
+    def delete(self, table_name, ids):
+        raise NotImplementedError
+
+    def deleted(self, table_name):
+        raise NotImplementedError
+
+    def compact(self, table_name, rate=None, lock=None, on_moved=None):
+        raise NotImplementedError
+
+    def compress(self, table_name, rate=None, lock=None):
+        raise NotImplementedError
+
+    def sync(self, table_name):
+        raise NotImplementedError
+
+    def segments(self, table_name):
+        raise NotImplementedError
+
+    def export(self, table_name, file_path):
+        """
+        Writes the records of the table as indented JSON in the {table: [...]} format of the old table files.
+        """
+        with open(file_path, 'w') as file:
+            json.dump({table_name: self.read(table_name)}, file, indent=4)
+
+
+class MappedReader:
+    """
+    Keeps table files memory mapped between reads, so reading a record is a slice of the map instead of
+    an open, seek and read. A map is refreshed when a read goes past its end because the file has grown,
+    the old map is only dropped: a scan may still read from it, it is closed once nothing uses it anymore.
+    """
+    def __init__(self) -> None:
+        self._maps = {}
+
+    def map(self, path, end=0):
+        data = self._maps.get(path)
+        if data is None or len(data) < end:
+            with open(path, 'rb') as file:
+                data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            self._maps[path] = data
+        return data
+
+    def read(self, path, location):
+        start, end = location
+        return self.map(path, end)[start:end]
+
+    def forget(self, path):
+        """
+        Drops the map of a removed file without closing it, a scan that still uses it keeps working.
+        """
+        self._maps.pop(path, None)
+
+    def close(self, path=None):
+        paths = [path] if path is not None else list(self._maps)
+        for path in paths:
+            data = self._maps.pop(path, None)
+            if data is not None:
+                try:
+                    data.close()
+                except BufferError:  # A view is still alive, the map is closed once it is released
+                    pass
+
+
+class _Segment:
+    __slots__ = ('file', 'base', 'size', 'first', 'records', 'min_id', 'max_id', 'compression')
+
+    def __init__(self, file, base=None, records=None, min_id=None, max_id=None, compression=None):
+        self.file = file
+        self.base = base  # Where the segment starts in the address space of the table
+        self.size = 0
+        self.first = 0  # Index of the first line of the segment in the offsets of the table
+        self.records = records  # Only known for sealed segments, the active one is counted from its offsets
+        self.min_id = min_id
+        self.max_id = max_id
+        self.compression = compression  # The codec of a compressed sealed segment, None if it is stored raw
+
+    def to_dict(self):
+        entry = {"file": self.file, "base": self.base, "records": self.records, "min_id": self.min_id, "max_id": self.max_id}
+        if self.compression:
+            entry["compression"] = self.compression
+        return entry
+
+
+class LogStorage(Storage):
+    """
+    Append-only storage engine. Every table is a list of segment files with one record per line,
+    so inserting a record appends a single line instead of rewriting the whole table. New tables store their
+    records in the compact binary format of BinaryFormat, tables written before it existed (and tables
+    of a storage created with record_format='json') keep one JSON document per line; `export` writes JSON either way.
+    Updated records are appended as a new version with the same id and the latest version wins on scan.
+    The segments are listed in <table>.manifest with their record counts and id ranges. Records are only appended
+    to the last (active) segment, it is sealed once it grows past `segment_size` and a sealed segment never changes.
+    A location is a (start, end) range in the address space of the table, in which every segment starts at its base.
+    Deleted ids are kept as tombstones in <table>.tombstones and skipped by every scan until compaction
+    merges the sealed segments and drops the deleted and superseded records for good.
+    Tables in the old {table: [...]} JSON format are migrated into the log the first time they are opened.
+    The end offset and id of every line are kept in an .offsets sidecar next to each segment. The manifest and
+    the offsets are loaded once per table, after that no operation needs to stat or scan the table files.
+    With `compression` set, `compress` rewrites sealed segments as compressed blocks (see CompressedSegment),
+    the active segment is never compressed; decompressed blocks are kept in a small BlockCache.
+    args:
+    db_path (str): The path to the directory where the table files are stored
+    segment_size (int): The size in bytes after which the active segment is sealed and a new one is started
+    record_format (str): 'binary' or 'json', the format of new tables; a rewrite converts a table to it
+    compression (str): 'zlib' or 'lzma' to compress sealed segments, None (the default) keeps them raw
+    block_size (int): Size of the uncompressed content of a compressed block
+    """
+    def __init__(self, db_path, segment_size=MAX_FILE_SIZE, record_format=RECORD_FORMAT,
+                 compression=SEGMENT_COMPRESSION, block_size=COMPRESSION_BLOCK_SIZE) -> None:
+        super().__init__(db_path)
+        if record_format not in ('binary', 'json'):
+            raise ValueError(f"Unknown record format {record_format}")
+        if compression not in (None, 'zlib', 'lzma'):
+            raise ValueError(f"Unknown compression {compression}")
+        self.segment_size = segment_size
+        self.record_format = record_format
+        self.compression = compression
+        self.block_size = block_size
+        self.blocks = BlockCache(BLOCK_CACHE_BLOCKS)
+        self._compressed = {}  # Opened compressed segments by path
+        self._formats = {}
+        self._opened = set()
+        self._segments = {}
+        self._next = {}  # Number of the next segment file of every table
+        self._offsets = {}
+        self._tombstones = {}
+        self._unsynced = {}  # Files written since the last sync
+        self.reader = MappedReader()
+        self.lock = RLock()  # Guards the manifest and offsets held in memory, compaction swaps them from another thread
+
+    def path(self, table_name):
+        """
+        Returns the path of the active segment of the table.
+        """
+        with self.lock:
+            self._open(table_name)
+            segments = self._segments[table_name]
+            return self._segment_path(segments[-1] if segments else _Segment(f"{table_name}.0.log"))
+
+    def exists(self, table_name):
+        with self.lock:
+            self._open(table_name)
+            return bool(self._segments[table_name])
+
+    def tables(self):
+        """
+        Returns the tables opened so far.
+        """
+        with self.lock:
+            return [table_name for table_name in self._opened if self._segments.get(table_name)]
+
+    def segments(self, table_name):
+        """
+        Returns the file, size, record count and id range of every segment of the table, the active one last.
+        """
+        with self.lock:
+            self._open(table_name)
+            segments = self._segments[table_name]
+            result = []
+            for i, segment in enumerate(segments):
+                if i == len(segments) - 1:
+                    self._count(table_name, segment, len(self._offsets[table_name][0]))
+                result.append(dict(segment.to_dict(), size=segment.size, sealed=i < len(segments) - 1))
+            return result
+
+    def append_many(self, table_name, objs):
+        with self.lock:
+            self._open(table_name)
+            segments = self._segments[table_name]
+            if not segments:
+                segments.append(self._new_segment(table_name, 0))
+                self._save_manifest(table_name)
+            elif segments[-1].size >= self.segment_size:
+                self._seal(table_name)
+            active = segments[-1]
+            lines = self._formats[table_name].encode_many(objs)
+            data = b''.join(lines)
+
+            with open(self._segment_path(active), 'ab') as file:
+                file.write(data)
+            metrics.count("storage.bytes_written", len(data))
+
+            ends, ids = self._offsets[table_name]
+            new_ends, new_ids = array('q'), array('q')
+            locations = []
+            pos = active.base + active.size
+            for obj, line in zip(objs, lines):
+                locations.append((pos, pos + len(line) - 1))  # The location does not include the trailing newline
+                pos += len(line)
+                new_ends.append(pos - active.base)
+                new_ids.append(self._record_id(obj))
+            active.size = pos - active.base
+            ends.extend(end + 1 for _, end in locations)
+            ids.extend(new_ids)
+            self._save_offsets(active, new_ends, new_ids)
+            self._unsynced.setdefault(table_name, set()).add(active.file)
+            return locations
+
+    def scan(self, table_name):
+        """
+        Yields (location, record) for the latest version of every live record, in id order, across all segments.
+        The table is captured when scan is called, so writes made while the records are consumed do not show up.
+        """
+        with self.lock:
+            locations = self.locations(table_name)
+            segments = self._segments[table_name]
+            bases = [segment.base for segment in segments]
+            # Mapped up front, so a compaction that removes a segment in the middle of the scan does not affect it
+            maps = [self._data(segment) for segment in segments]
+            decode = self._formats[table_name].decode
+        return self._records(locations, bases, maps, decode)
+
+    @staticmethod
+    def _records(locations, bases, maps, decode):
+        scanned = read = 0
+        try:
+            for location in locations:
+                start, end = location
+                i = bisect_right(bases, start) - 1
+                scanned += 1
+                read += end - start
+                yield location, decode(maps[i][start - bases[i]:end - bases[i]])
+        finally:  # Also counts a scan that was stopped early, e.g. by a limit
+            metrics.count("storage.records_scanned", scanned)
+            metrics.count("storage.bytes_read", read)
+
+    def locations(self, table_name):
+        """
+        Returns the location of the latest version of every live record without parsing any of them, in id order.
+        Compaction moves records around, so the order of the lines is not the order of the records.
+        Records without an id come first.
+        """
+        with self.lock:
+            ends, ids = self.offsets(table_name)
+            segments = self._segments[table_name]
+            live = {}
+            for segment, stop in zip(segments, [segment.first for segment in segments[1:]] + [len(ends)]):
+                start = segment.base
+                for end, id in zip(ends[segment.first:stop], ids[segment.first:stop]):
+                    live[id if id != -1 else ('', start)] = (start, end - 1)  # Records without an id can not be superseded
+                    start = end
+            for id in self._tombstones[table_name]:
+                live.pop(id, None)
+            # Nearly sorted already, the ids are handed out in insertion order
+            return [location for _, location in sorted(live.items(), key=lambda item: item[0] if type(item[0]) is int else -1)]
+
+    def partitions(self, table_name):
+        """
+        Groups the live records by segment, for scans that read the segment files themselves. Returns
+        (segment path, array of start and end pairs within the segment, record format, compression) tuples, every
+        group is in id order. The record format is the picklable spec of record_format.decoder.
+        """
+        with self.lock:
+            locations = self.locations(table_name)
+            segments = self._segments[table_name]
+            bases = [segment.base for segment in segments]
+            by_segment = {}
+            for start, end in locations:
+                i = bisect_right(bases, start) - 1
+                pairs = by_segment.setdefault(i, array('q'))
+                pairs.append(start - bases[i])
+                pairs.append(end - bases[i])
+            spec = self._formats[table_name].spec()
+            return [(self._segment_path(segments[i]), pairs, spec, segments[i].compression)
+                    for i, pairs in sorted(by_segment.items())]
+
+    def offsets(self, table_name):
+        """
+        Returns (ends, ids) for every line of the table: ends[i] is the location right after the newline of line i
+        and ids[i] is the integer id of the record on it, or -1 if it has none.
+        """
+        with self.lock:
+            self._open(table_name)
+            return self._offsets[table_name]
+
+    def read_at(self, table_name, location):
+        with self.lock:
+            self._open(table_name)
+            segment, (start, end) = self._locate(table_name, location)
+            metrics.count("storage.bytes_read", end - start)
+            return self._formats[table_name].decode(self._data(segment, end)[start:end])
+
+    def delete(self, table_name, ids):
+        """
+        Marks the records with the given ids as deleted. The tombstones are persisted right away,
+        the records themselves are dropped by the next compaction.
+        """
+        with self.lock:
+            self._open(table_name)
+            tombstones = self._tombstones[table_name]
+            new_ids = array('q', dict.fromkeys(id for id in ids if type(id) is int and id not in tombstones))
+            if not new_ids:
+                return
+            with open(self._tombstones_path(table_name), 'ab') as file:
+                new_ids.tofile(file)
+            tombstones.update(new_ids)
+            self._unsynced.setdefault(table_name, set()).add(os.path.basename(self._tombstones_path(table_name)))
+
+    def deleted(self, table_name):
+        """
+        Returns the ids of the deleted records that are still in the segments, until compaction drops them.
+        """
+        with self.lock:
+            self._open(table_name)
+            return frozenset(self._tombstones[table_name])
+
+    def garbage(self, table_name):
+        """
+        Returns the fraction of the lines in the sealed segments that a compaction would drop.
+        Only a copy of the ids and tombstones is taken under the lock, the other tables are not held up by the count.
+        """
+        with self.lock:
+            self._open(table_name)
+            segments = self._segments[table_name]
+            stop = segments[-1].first if segments else 0
+            if not stop:
+                return 0.0
+            ids, tombstones = array('q', self._offsets[table_name][1]), frozenset(self._tombstones[table_name])
+        return len(self._dead_lines(ids, tombstones, stop)) / stop
+
+    def compact(self, table_name, rate=None, lock=None, on_moved=None, seal=False):
+        """
+        Merges the sealed segments into as few segments as possible, dropping deleted and superseded records.
+        The active segment is left alone, so writes go on while the records are copied; only the final switch
+        to the new segments holds `lock` (and the lock of the storage). `rate` limits the copying to that many
+        bytes per second. on_moved(table_name, moved) is called during the switch with the old and new location
+        of every record that was kept. Returns the moved locations.
+        With `seal` the active segment is sealed first and compacted as well, so a table with a single segment
+        shrinks too. The caller has to keep writes out of the table then, e.g. by holding its write lock.
+        """
+        with self.lock:
+            self._open(table_name)
+            if seal and self._segments[table_name] and self._segments[table_name][-1].size:
+                self._seal(table_name)
+            segments = list(self._segments[table_name])
+            sealed = segments[:-1]
+            if not sealed:
+                return {}
+            ends, ids = self._offsets[table_name]
+            stop = segments[-1].first
+            all_ids, tombstones = array('q', ids), frozenset(self._tombstones[table_name])
+            ends, ids = ends[:stop], ids[:stop]
+            maps = [self._data(segment) for segment in sealed]
+        dead = self._dead_lines(all_ids, tombstones, stop)
+
+        moved = {}
+        new_segments, new_offsets = [], []
+        base = sealed[0].base
+        started, copied = time.monotonic(), 0
+        file = None
+        try:
+            for segment, data, segment_stop in zip(sealed, maps, [segment.first for segment in segments[1:]]):
+                start = segment.base
+                for i in range(segment.first, segment_stop):
+                    end = ends[i]
+                    if i not in dead:
+                        if file is None or new_segments[-1].size >= self.segment_size:
+                            if file is not None:
+                                self._finish_segment(file, new_segments[-1], *new_offsets[-1])
+                            with self.lock:
+                                new_segments.append(self._new_segment(table_name, base))
+                            new_offsets.append((array('q'), array('q')))
+                            file = open(self._segment_path(new_segments[-1]), 'wb')
+                        new_segment, (segment_ends, segment_ids) = new_segments[-1], new_offsets[-1]
+                        line = data[start - segment.base:end - segment.base]
+                        file.write(line)
+                        new_start = new_segment.base + new_segment.size
+                        moved[(start, end - 1)] = (new_start, new_start + len(line) - 1)
+                        new_segment.size += len(line)
+                        segment_ends.append(new_segment.size)
+                        segment_ids.append(ids[i])
+                        base = new_start + len(line)
+                        copied += len(line)
+                        if rate:
+                            delay = copied / rate - (time.monotonic() - started)
+                            if delay > 0:
+                                time.sleep(delay)  # Leaves the disk to the requests served meanwhile
+                    start = end
+            if file is not None:
+                self._finish_segment(file, new_segments[-1], *new_offsets[-1])
+        except BaseException:
+            if file is not None:
+                file.close()
+            for new_segment in new_segments:
+                self._remove_segment(new_segment)
+            raise
+
+        with lock if lock is not None else nullcontext(), self.lock:
+            if self._segments[table_name][:len(sealed)] != sealed:  # Compacted by someone else meanwhile, e.g. a flush
+                for new_segment in new_segments:
+                    self._remove_segment(new_segment)
+                return {}
+            ends, ids = self._offsets[table_name]  # Records may have been appended while copying
+            kept = self._segments[table_name][len(sealed):]  # Including segments sealed while copying
+            new_ends, new_ids = array('q'), array('q')
+            for new_segment, (segment_ends, segment_ids) in zip(new_segments, new_offsets):
+                new_segment.first = len(new_ids)
+                new_ends.extend(end + new_segment.base for end in segment_ends)
+                new_ids.extend(segment_ids)
+                self._count(table_name, new_segment, len(new_ids), new_ids)
+            for segment in kept:
+                segment.first += len(new_ids) - stop
+            new_ends.extend(ends[stop:])
+            new_ids.extend(ids[stop:])
+            self._segments[table_name] = new_segments + kept
+            self._offsets[table_name] = (new_ends, new_ids)
+            self._save_manifest(table_name)
+            self._purge_tombstones(table_name)
+            if on_moved is not None:
+                on_moved(table_name, moved)
+
+        self._remove_segments(sealed)
+        return moved
+
+    def compress(self, table_name, rate=None, lock=None):
+        """
+        Rewrites the sealed segments that are still raw as compressed segments. Locations do not change, a compressed
+        segment keeps the base and the offsets of the raw one. Like compact, the copying runs outside the locks and is
+        limited to `rate` bytes per second, only the switch holds `lock`. Returns the number of compressed segments.
+        """
+        if not self.compression:
+            return 0
+        with self.lock:
+            self._open(table_name)
+            segments = self._segments[table_name]
+            ends, ids = self._offsets[table_name]
+            raw = []
+            for segment, stop in zip(segments[:-1], [segment.first for segment in segments[1:]]):
+                if not segment.compression and stop > segment.first:
+                    segment_ends = array('q', (end - segment.base for end in ends[segment.first:stop]))
+                    raw.append((segment, self._data(segment), segment_ends, ids[segment.first:stop]))
+
+        replacements = []
+        started, copied = time.monotonic(), 0
+        try:
+            for segment, data, segment_ends, segment_ids in raw:
+                with self.lock:
+                    new_segment = self._new_segment(table_name, segment.base)
+                replacements.append((segment, new_segment))
+
+                def pace(end, before=copied):
+                    if rate:
+                        delay = (before + end) / rate - (time.monotonic() - started)
+                        if delay > 0:
+                            time.sleep(delay)  # Leaves the disk to the requests served meanwhile
+                write_compressed(self._segment_path(new_segment), data, segment_ends, self.compression, self.block_size, pace)
+                copied += segment.size
+                self._save_offsets(new_segment, segment_ends, segment_ids)
+        except BaseException:
+            for _, new_segment in replacements:
+                self._remove_segment(new_segment)
+            raise
+
+        with lock if lock is not None else nullcontext(), self.lock:
+            segments = self._segments[table_name]
+            replaced, dropped = [], []
+            for segment, new_segment in replacements:
+                if segment in segments:
+                    new_segment.first, new_segment.size = segment.first, segment.size
+                    new_segment.records, new_segment.min_id, new_segment.max_id = segment.records, segment.min_id, segment.max_id
+                    new_segment.compression = self.compression
+                    segments[segments.index(segment)] = new_segment
+                    replaced.append(segment)
+                else:  # Compacted away while it was compressed
+                    dropped.append(new_segment)
+            if replaced:
+                self._save_manifest(table_name)
+
+        self._remove_segments(replaced + dropped)
+        return len(replaced)
+
+    def rewrite(self, table_name, records):
+        """
+        Writes the records into new segments and switches the manifest over to them, the old segments are removed
+        afterwards. Replacing the manifest is atomic, so a crash leaves either the old or the new table.
+        """
+        with self.lock:
+            self._open(table_name)
+            old_segments = self._segments[table_name]
+            segments, ends, ids = [], array('q'), array('q')
+            chunks = []
+            self._formats[table_name] = self._new_format(table_name, self.record_format)
+            records = list(records)
+            for obj, line in zip(records, self._formats[table_name].encode_many(records)):
+                if not chunks or (chunks[-1][1] >= self.segment_size):
+                    chunks.append(([], 0))
+                lines, size = chunks[-1]
+                lines.append((obj, line))
+                chunks[-1] = (lines, size + len(line))
+            if not chunks:
+                chunks.append(([], 0))
+
+            base = 0
+            for lines, size in chunks:
+                segment = self._new_segment(table_name, base)
+                segment.first = len(ends)
+                self._remove_offsets(segment)  # Left behind by a rewrite that crashed
+                with open(self._segment_path(segment), 'wb') as file:
+                    file.write(b''.join(line for _, line in lines))
+                    file.flush()
+                    os.fsync(file.fileno())
+                segment_ends, segment_ids = array('q'), array('q')
+                for obj, line in lines:
+                    segment.size += len(line)
+                    segment_ends.append(segment.size)
+                    segment_ids.append(self._record_id(obj))
+                self._save_offsets(segment, segment_ends, segment_ids)
+                ends.extend(end + base for end in segment_ends)
+                ids.extend(segment_ids)
+                segments.append(segment)
+                base += segment.size
+            for segment, next_segment in zip(segments, segments[1:]):
+                self._count(table_name, segment, next_segment.first, ids)
+
+            self._segments[table_name] = segments
+            self._offsets[table_name] = (ends, ids)
+            self._save_manifest(table_name)
+            self._purge_tombstones(table_name)
+            self._unsynced.pop(table_name, None)
+        self._remove_segments(old_segments)
+
+    def sync(self, table_name):
+        """
+        Forces the segments written since the last sync to disk. The directory is synced as well,
+        so the files created by a seal or a rewrite survive a crash.
+        """
+        for file_name in self._unsynced.pop(table_name, ()):
+            file_path = os.path.join(self.db_path, file_name)
+            if os.path.exists(file_path):
+                with open(file_path, 'ab') as file:
+                    os.fsync(file.fileno())
+        if hasattr(os, 'O_DIRECTORY'):  # Directories can not be opened on Windows, renames are durable there
+            fd = os.open(self.db_path, os.O_RDONLY | os.O_DIRECTORY)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+
+    def fingerprint(self, table_name):
+        """
+        Identifies the current content of the table: segment files are never reused, so their names and sizes change
+        whenever records are written, and the tombstone count whenever records are deleted.
+        """
+        with self.lock:
+            self._open(table_name)
+            return {"segments": [[segment.file, segment.size] for segment in self._segments[table_name]],
+                    "tombstones": len(self._tombstones[table_name])}
+
+    @staticmethod
+    def _record_id(obj):
+        id = obj.get('id')
+        return id if type(id) is int else -1
+
+    def _segment_path(self, segment):
+        return os.path.join(self.db_path, segment.file)
+
+    def _offsets_path(self, segment):
+        return os.path.join(self.db_path, segment.file[:-len('.log')] + '.offsets')
+
+    def _manifest_path(self, table_name):
+        return os.path.join(self.db_path, f"{table_name}.manifest")
+
+    def _tombstones_path(self, table_name):
+        return os.path.join(self.db_path, f"{table_name}.tombstones")
+
+    def _fields_path(self, table_name):
+        return os.path.join(self.db_path, f"{table_name}.fields")
+
+    def _new_format(self, table_name, name):
+        return BinaryFormat(self._fields_path(table_name)) if name == 'binary' else JsonFormat()
+
+    def _locate(self, table_name, location):
+        """
+        Returns the segment holding the location and the location within that segment.
+        """
+        segments = self._segments[table_name]
+        start, end = location
+        segment = segments[bisect_right([segment.base for segment in segments], start) - 1]
+        return segment, (start - segment.base, end - segment.base)
+
+    def _data(self, segment, end=None):
+        """
+        Returns the content of the segment, sliced like bytes: the map of a raw segment (covering at least `end`)
+        or the CompressedSegment of a compressed one.
+        """
+        path = self._segment_path(segment)
+        if segment.compression:
+            data = self._compressed.get(path)
+            if data is None:
+                data = self._compressed[path] = CompressedSegment(path, self.blocks)
+            return data
+        if not segment.size:
+            return None
+        return self.reader.map(path, segment.size if end is None else end)
+
+    def _new_segment(self, table_name, base):
+        number = self._next.get(table_name, 0)
+        self._next[table_name] = number + 1
+        return _Segment(f"{table_name}.{number}.log", base)
+
+    def _seal(self, table_name):
+        segments = self._segments[table_name]
+        active = segments[-1]
+        self._count(table_name, active, len(self._offsets[table_name][0]))
+        new_segment = self._new_segment(table_name, active.base + active.size)
+        new_segment.first = len(self._offsets[table_name][0])
+        segments.append(new_segment)
+        self._save_manifest(table_name)
+
+    @staticmethod
+    def _dead_lines(ids, tombstones, stop):
+        """
+        Returns the indexes of the lines before `stop` that hold a superseded version or a deleted record,
+        given the ids of all lines of the table and its tombstones.
+        """
+        latest = {}
+        for i, id in enumerate(ids):
+            if id != -1:
+                latest[id] = i
+        return {i for i, id in enumerate(ids[:stop]) if id != -1 and (latest[id] != i or id in tombstones)}
+
+    def _purge_tombstones(self, table_name):
+        """
+        Forgets the tombstones of records that are no longer in any segment.
+        """
+        tombstones = self._tombstones[table_name]
+        remaining = tombstones.intersection(self._offsets[table_name][1])
+        if remaining == tombstones:
+            return
+        self._tombstones[table_name] = remaining
+        tombstones_path = self._tombstones_path(table_name)
+        tmp_path = tombstones_path + '.tmp'
+        with open(tmp_path, 'wb') as file:
+            array('q', sorted(remaining)).tofile(file)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp_path, tombstones_path)
+
+    def _finish_segment(self, file, segment, ends, ids):
+        file.flush()
+        os.fsync(file.fileno())
+        file.close()
+        self._save_offsets(segment, ends, ids)
+
+    def _count(self, table_name, segment, stop, ids=None):
+        segment_ids = [id for id in (ids if ids is not None else self._offsets[table_name][1])[segment.first:stop] if id != -1]
+        segment.records = stop - segment.first
+        segment.min_id = min(segment_ids, default=None)
+        segment.max_id = max(segment_ids, default=None)
+
+    def _save_manifest(self, table_name):
+        segments = self._segments[table_name]
+        manifest = {
+            "next": self._next[table_name],
+            "format": self._formats[table_name].name,
+            "segments": [segment.to_dict() if i < len(segments) - 1 else {"file": segment.file, "base": segment.base}
+                         for i, segment in enumerate(segments)],
+        }
+        manifest_path = self._manifest_path(table_name)
+        tmp_path = manifest_path + '.tmp'
+        with open(tmp_path, 'w') as file:
+            json.dump(manifest, file)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp_path, manifest_path)
+
+    def _load_manifest(self, table_name):
+        manifest_path = self._manifest_path(table_name)
+        if not os.path.exists(manifest_path):
+            return False
+        with open(manifest_path, 'r') as file:
+            manifest = json.load(file)
+        self._next[table_name] = manifest["next"]
+        self._formats[table_name] = self._new_format(table_name, manifest.get("format", 'json'))
+        self._segments[table_name] = [_Segment(entry["file"], entry.get("base"), entry.get("records"), entry.get("min_id"),
+                                               entry.get("max_id"), entry.get("compression")) for entry in manifest["segments"]]
+        return True
+
+    def _scan_offsets(self, record_format, segment, start):
+        """
+        Finds the line ends of a segment from `start` on, up to a record torn by a crash.
+        """
+        ends, ids = array('q'), array('q')
+        if segment.compression:
+            data = self._data(segment).read_all()
+        else:
+            with open(self._segment_path(segment), 'rb') as file:
+                data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        for end, obj in record_format.scan(data, start):
+            ends.append(end)
+            ids.append(self._record_id(obj))
+        return ends, ids
+
+    def _load_offsets(self, table_name, segment):
+        """
+        Returns the offsets of a segment from its sidecar, scanning only the lines the sidecar does not cover yet.
+        """
+        offsets_path = self._offsets_path(segment)
+        pairs = array('q')
+        if os.path.exists(offsets_path):
+            with open(offsets_path, 'rb') as file:
+                content = file.read()
+            pairs.frombytes(content[:len(content) // 16 * 16])  # Drop a pair that was only partially written
+
+        ends, ids = pairs[0::2], pairs[1::2]
+        if ends and (ends[-1] > segment.size or not self._ends_with_newline(segment, ends[-1])):
+            self._remove_offsets(segment)  # The sidecar does not belong to this segment
+            ends, ids = array('q'), array('q')
+
+        covered = ends[-1] if ends else 0
+        if covered < segment.size:
+            new_ends, new_ids = self._scan_offsets(self._formats[table_name], segment, covered)
+            ends.extend(new_ends)
+            ids.extend(new_ids)
+            self._save_offsets(segment, new_ends, new_ids)
+        return ends, ids
+
+    def _ends_with_newline(self, segment, end):
+        if segment.compression:
+            return end == segment.size  # A compressed segment is complete, its sidecar has to cover all of it
+        with open(self._segment_path(segment), 'rb') as file:
+            file.seek(end - 1)
+            return file.read(1) == b'\n'
+
+    def _save_offsets(self, segment, ends, ids):
+        pairs = array('q', [0]) * (2 * len(ends))
+        pairs[0::2] = ends
+        pairs[1::2] = ids
+        with open(self._offsets_path(segment), 'ab') as file:
+            pairs.tofile(file)
+
+    def _remove_offsets(self, segment):
+        if os.path.exists(self._offsets_path(segment)):
+            os.remove(self._offsets_path(segment))
+
+    def _remove_segment(self, segment):
+        if os.path.exists(self._segment_path(segment)):
+            os.remove(self._segment_path(segment))
+        self._remove_offsets(segment)
+
+    def _remove_segments(self, segments):
+        for segment in segments:
+            self.reader.forget(self._segment_path(segment))
+            if self._compressed.pop(self._segment_path(segment), None) is not None:
+                self.blocks.forget(self._segment_path(segment))
+            try:
+                self._remove_segment(segment)
+            except OSError:  # Still mapped on Windows, removed as an orphan the next time the table is opened
+                pass
+
+    def _open(self, table_name):
+        """
+        Loads the manifest and the offsets of the table the first time it is used. The table only counts as opened
+        once it is loaded, so a concurrent first read waits for the lock instead of seeing an empty table.
+        """
+        with self.lock:
+            if table_name in self._opened:
+                return
+            migrate = self._load(table_name)
+            self._opened.add(table_name)
+            if migrate:
+                self._migrate(table_name)
+
+    def _load(self, table_name):
+        """
+        Returns True if there is no table yet, it may still have to be migrated from the old JSON format.
+        """
+        self._segments[table_name] = []
+        self._offsets[table_name] = (array('q'), array('q'))
+        self._tombstones[table_name] = set()
+        self._formats[table_name] = self._new_format(table_name, self.record_format)
+        tombstones_path = self._tombstones_path(table_name)
+        if os.path.exists(tombstones_path):
+            with open(tombstones_path, 'rb') as file:
+                content = file.read()
+            self._tombstones[table_name] = set(array('q', content[:len(content) // 8 * 8]))
+
+        if not self._load_manifest(table_name):
+            if os.path.exists(os.path.join(self.db_path, f"{table_name}.log")):  # A log from before segments existed
+                self._next[table_name] = 0
+                self._segments[table_name] = [_Segment(f"{table_name}.log")]
+                self._formats[table_name] = JsonFormat()
+                self._save_manifest(table_name)
+            else:
+                return True
+
+        self._remove_orphans(table_name)
+        segments = self._segments[table_name]
+        if segments and self._formats[table_name].name == 'json':
+            self._repair(self._segment_path(segments[-1]))
+        ends, ids = self._offsets[table_name]
+        base = 0
+        for segment in segments:
+            file_path = self._segment_path(segment)
+            if segment.base is None:  # A manifest written before compaction existed, the segments are contiguous
+                segment.base = base
+            segment.first = len(ends)
+            if segment.compression:
+                segment.size = len(self._data(segment))  # The size of the uncompressed content
+            else:
+                segment.size = os.path.getsize(file_path) if os.path.exists(file_path) else 0
+            segment_ends, segment_ids = self._load_offsets(table_name, segment)
+            if segment is segments[-1] and (segment_ends[-1] if segment_ends else 0) < segment.size:
+                self._truncate(segment, segment_ends[-1] if segment_ends else 0)  # A binary record torn by a crash
+            ends.extend(end + segment.base for end in segment_ends)
+            ids.extend(segment_ids)
+            base = segment.base + segment.size
+        return False
+
+    def _remove_orphans(self, table_name):
+        """
+        Removes the segment files a crashed rewrite left behind, they are not listed in the manifest.
+        """
+        listed = {segment.file for segment in self._segments[table_name]}
+        pattern = re.compile(re.escape(table_name) + r'\.\d+\.(log|offsets)$')
+        for file_name in os.listdir(self.db_path):
+            if pattern.match(file_name) and file_name[:file_name.rindex('.')] + '.log' not in listed:
+                os.remove(os.path.join(self.db_path, file_name))
+
+    def _truncate(self, segment, size):
+        with open(self._segment_path(segment), 'rb+') as file:
+            file.truncate(size)
+        segment.size = size
+
+    @staticmethod
+    def _repair(file_path):
+        if not os.path.exists(file_path):
+            return
+
+        with open(file_path, 'rb+') as file:
+            size = file.seek(0, os.SEEK_END)
+            end = size
+            while end > 0:
+                chunk_start = max(0, end - 65536)
+                file.seek(chunk_start)
+                newline = file.read(end - chunk_start).rfind(b'\n')
+                if newline != -1:
+                    end = chunk_start + newline + 1
+                    break
+                end = chunk_start
+            if end != size:  # Cut off a record that was only partially written before a crash
+                file.truncate(end)
+
+    def _legacy_paths(self, table_name):
+        paths = []
+        base_path = os.path.join(self.db_path, f"{table_name}.json")
+        if os.path.exists(base_path):
+            paths.append(base_path)
+
+        i = 1
+        while os.path.exists(os.path.join(self.db_path, f"{table_name}_{i}.json")):
+            paths.append(os.path.join(self.db_path, f"{table_name}_{i}.json"))
+            i += 1
+        return paths
+
+    def _migrate(self, table_name):
+        legacy_paths = self._legacy_paths(table_name)
+        if not legacy_paths:
+            return
+
+        records = []
+        for file_path in legacy_paths:
+            with open(file_path, 'r') as file:
+                content = file.read()
+            if content.strip():
+                records.extend(json.loads(content).get(table_name, []))
+
+        next_id = max((obj['id'] for obj in records if type(obj.get('id')) is int), default=0) + 1
+        for obj in records:
+            if type(obj.get('id')) is not int:  # Without an id a record could never be superseded by an update
+                obj['id'] = next_id
+                next_id += 1
+
+        self.rewrite(table_name, records)
+        for file_path in legacy_paths:
+            os.replace(file_path, file_path + '.migrated')  # Keep the old file around, but never migrate it twice
@@ -0,0 +1,139 @@
+import json
+import os
+from contextlib import contextmanager
+from threading import Condition
+from src.constants import WAL_CHECKPOINT_BYTES
+
+
+class WriteAheadLog:
+    """
+    Write-ahead log shared by all tables of a database. Every change is appended to wal.log and made durable
+    before it is applied to the table files, so the table files themselves never have to be synced per write.
+    Writers that commit at the same time share one fsync (group commit): the first one to arrive writes and
+    syncs everything that is buffered, the others only wait for it. A writer hands its entry to the log while it
+    holds its locks and waits for the fsync after releasing them, so writers of the same table share fsyncs too.
+    args:
+    path (str): The path to the log file
+    checkpoint_bytes (int): The log size after which `needs_checkpoint` becomes true
+    """
+    def __init__(self, path, checkpoint_bytes=WAL_CHECKPOINT_BYTES) -> None:
+        self.path = path
+        self.checkpoint_bytes = checkpoint_bytes
+        self.file = open(path, 'ab')
+        self.size = self.file.tell()
+        self.condition = Condition()
+        self.buffer = []
+        self.written = 0  # Number of entries handed to the log
+        self.durable = 0  # Number of entries known to be on disk
+        self.syncing = False
+        self.active = 0  # Writers that are between their commit and the end of applying it
+        self.checkpointing = False
+        self.tables = set()  # Tables changed since the last checkpoint
+        self.syncs = 0
+
+    def replay(self):
+        """
+        Returns the entries written since the last checkpoint, an entry torn by a crash is ignored.
+        Their tables count as changed, so the next checkpoint syncs the replayed writes before it empties the log.
+        """
+        entries = []
+        with open(self.path, 'rb') as file:
+            for line in file:
+                if not line.endswith(b'\n'):
+                    break
+                entries.append(json.loads(line))
+        with self.condition:
+            self.tables.update(entry['table'] for entry in entries)
+        return entries
+
+    @contextmanager
+    def write(self, entry):
+        """
+        Hands the entry to the log and keeps a checkpoint from starting until the caller has applied it.
+        Yields the ticket of the entry, the change is durable once wait(ticket) returns:
+            with wal.write(entry) as ticket:
+                apply the change to the table files
+            wal.wait(ticket)  # After releasing the locks of the table
+        """
+        with self.condition:
+            while self.checkpointing:
+                self.condition.wait()
+            self.active += 1
+        try:
+            yield self.append(entry)
+        finally:
+            with self.condition:
+                self.active -= 1
+                self.condition.notify_all()
+
+    def append(self, entry):
+        """
+        Buffers the entry and returns its ticket, without waiting for it to reach the disk.
+        """
+        line = json.dumps(entry).encode() + b'\n'
+        with self.condition:
+            self.buffer.append(line)
+            self.written += 1
+            self.tables.add(entry['table'])
+            return self.written
+
+    def commit(self, entry):
+        self.wait(self.append(entry))
+
+    def wait(self, ticket):
+        """
+        Returns once the entry with this ticket and all before it are durable, syncing the buffered entries if no
+        other writer is doing it already.
+        """
+        with self.condition:
+            while self.durable < ticket:
+                if self.syncing:
+                    self.condition.wait()  # Another writer is syncing, our entry may be part of its batch
+                    continue
+
+                self.syncing = True
+                batch, self.buffer = self.buffer, []
+                target = self.written
+                self.condition.release()
+                try:
+                    data = b''.join(batch)
+                    self.file.write(data)
+                    self.file.flush()
+                    os.fsync(self.file.fileno())
+                finally:
+                    self.condition.acquire()
+                    self.syncing = False
+                self.size += len(data)
+                self.durable = target
+                self.syncs += 1
+                self.condition.notify_all()
+
+    @property
+    def needs_checkpoint(self):
+        return self.size >= self.checkpoint_bytes
+
+    def checkpoint(self, sync):
+        """
+        Waits for the writers in flight, calls sync(tables) to make the table files durable and then empties the log.
+        """
+        with self.condition:
+            while self.checkpointing:
+                self.condition.wait()
+            self.checkpointing = True
+            while self.active or self.syncing:
+                self.condition.wait()
+            try:
+                sync(set(self.tables))
+                self.file.truncate(0)
+                self.file.seek(0)
+                os.fsync(self.file.fileno())
+                self.size = 0
+                self.tables = set()
+                self.buffer = []  # Applied by writers that are done, the synced table files hold them now
+                self.durable = self.written
+            finally:
+                self.checkpointing = False
+                self.condition.notify_all()
+
+    def close(self):
+        self.file.close()
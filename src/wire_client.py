@@ -0,0 +1,123 @@
+import asyncio
+import json
+from itertools import count
+from src.wire_protocol import ERROR, REQUEST, encode_frame, read_frame
+
+
+class WireClient:
+    """
+    One connection to a WireServer. Requests are pipelined: `execute` sends the command right away without
+    waiting for the responses of earlier requests, a background task matches every response to its request by id.
+    A command that fails on the server raises ValueError with the message of the server.
+    args:
+    host (str): The host of the server
+    port (int): The port of the server
+    """
+    def __init__(self, host='127.0.0.1', port=5002) -> None:
+        self.host = host
+        self.port = port
+        self._reader = None
+        self._writer = None
+        self._pending = {}
+        self._ids = count(1)
+        self._receiver = None
+        self._connecting = None
+
+    async def connect(self):
+        if self._writer is None:
+            if self._connecting is None:
+                self._connecting = asyncio.ensure_future(asyncio.open_connection(self.host, self.port))
+            try:
+                reader, writer = await asyncio.shield(self._connecting)
+            except BaseException:
+                self._connecting = None
+                raise
+            if self._writer is None:
+                self._reader, self._writer = reader, writer
+                self._receiver = asyncio.ensure_future(self._receive())
+        return self
+
+    async def execute(self, query):
+        await self.connect()
+        request_id = next(self._ids) & 0xFFFFFFFF
+        response = asyncio.get_running_loop().create_future()
+        self._pending[request_id] = response
+        self._writer.write(encode_frame(request_id, REQUEST, query.encode()))
+        if self._writer.transport.get_write_buffer_size() > 65536:
+            await self._writer.drain()
+        return await response
+
+    async def execute_many(self, queries):
+        """
+        Pipelines all queries on the connection and returns their results in the same order.
+        """
+        return await asyncio.gather(*(self.execute(query) for query in queries))
+
+    async def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            try:
+                await self._writer.wait_closed()
+            except ConnectionError:
+                pass
+        if self._receiver is not None:
+            await asyncio.gather(self._receiver, return_exceptions=True)
+        self._writer = self._reader = self._receiver = self._connecting = None
+
+    async def __aenter__(self):
+        return await self.connect()
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def _receive(self):
+        error = ConnectionError("The connection to the server was closed")
+        try:
+            while True:
+                request_id, kind, body = await read_frame(self._reader)
+                response = self._pending.pop(request_id, None)
+                if response is None or response.done():
+                    continue
+                if kind == ERROR:
+                    response.set_exception(ValueError(body.decode()))
+                else:
+                    response.set_result(json.loads(body))
+        except (asyncio.IncompleteReadError, ConnectionError) as e:
+            error = ConnectionError(str(e) or "The connection to the server was closed")
+        finally:
+            pending, self._pending = self._pending, {}
+            for response in pending.values():
+                if not response.done():
+                    response.set_exception(error)
+            self._writer = None
+            self._connecting = None
+
+
+class WireClientPool:
+    """
+    A fixed number of pipelined connections to a WireServer, requests are spread over them round robin.
+    The requests sent through one connection are executed in order, requests on different connections in parallel.
+    args:
+    host (str): The host of the server
+    port (int): The port of the server
+    size (int): Number of connections
+    """
+    def __init__(self, host='127.0.0.1', port=5002, size=4) -> None:
+        self.clients = [WireClient(host, port) for _ in range(size)]
+        self._next = count()
+
+    async def execute(self, query):
+        return await self.clients[next(self._next) % len(self.clients)].execute(query)
+
+    async def execute_many(self, queries):
+        return await asyncio.gather(*(self.execute(query) for query in queries))
+
+    async def close(self):
+        await asyncio.gather(*(client.close() for client in self.clients))
+
+    async def __aenter__(self):
+        await asyncio.gather(*(client.connect() for client in self.clients))
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
@@ -0,0 +1,38 @@
+"""
+Length-prefixed frames for WireServer and WireClient. Only the frame header is binary. A request body is the
+QueryExecutor command text and a result body is JSON without whitespace. msgpack is not a dependency, and
+encoding results with the pure Python BinaryFormat of record_format is about twice as slow as json.dumps for
+a page of records, although the output is smaller. Point lookups are bound by CPU rather than by the bytes
+they send, so text payloads give the higher throughput.
+"""
+import json
+import struct
+
+# Every frame is a fixed header followed by the body: body length, request id and kind, in network byte order
+HEADER = struct.Struct('>IIB')
+
+REQUEST = 0  # Body: a QueryExecutor command in UTF-8
+RESULT = 1  # Body: the result of the command as JSON
+ERROR = 2  # Body: the error message in UTF-8
+
+
+def encode_frame(request_id, kind, body):
+    return HEADER.pack(len(body), request_id, kind) + body
+
+
+def encode_result(request_id, result):
+    return encode_frame(request_id, RESULT, json.dumps(result, separators=(',', ':')).encode())
+
+
+def encode_error(request_id, message):
+    return encode_frame(request_id, ERROR, message.encode())
+
+
+async def read_frame(reader, max_bytes=None):
+    """
+    Returns (request id, kind, body) of the next frame. Raises asyncio.IncompleteReadError if the stream ends.
+    """
+    length, request_id, kind = HEADER.unpack(await reader.readexactly(HEADER.size))
+    if max_bytes is not None and length > max_bytes:
+        raise ValueError(f"Frame of {length} bytes is larger than {max_bytes} bytes")
+    return request_id, kind, await reader.readexactly(length)
@@ -0,0 +1,85 @@
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from src.constants import ASYNC_WORKERS, MAX_REQUEST_BYTES
+from src.query_language import QueryExecutor
+from src.wire_protocol import REQUEST, encode_error, encode_result, read_frame
+
+logger = logging.getLogger(__name__)
+
+
+class WireServer:
+    """
+    Serves QueryExecutor commands over a length-prefixed binary TCP protocol (see wire_protocol), without the
+    HTTP request and JSON envelope of DBWebServer. A client may pipeline any number of requests on one
+    connection; the requests of a connection are executed in order, so a select sees the inserts sent before it,
+    and every response carries the id of its request.
+
+    Args:
+    db (NoSQLDatabase): The database the commands are executed on.
+    host (str): The host address for the server. Default is '127.0.0.1'.
+    port (int): The port number for the server, 0 picks a free one. Default is 5002.
+    workers (int): Number of commands that can run at once, across all connections.
+    """
+    def __init__(self, db, host='127.0.0.1', port=5002, workers=ASYNC_WORKERS):
+        self.executor = QueryExecutor(db)
+        self.host = host
+        self.port = port
+        self.server = None
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='wire')
+
+    async def start(self):
+        self.server = await asyncio.start_server(self._serve_connection, self.host, self.port, backlog=4096)
+        self.port = self.server.sockets[0].getsockname()[1]
+        logger.info("Serving the wire protocol on %s:%s", self.host, self.port)
+        return self.server
+
+    async def serve_forever(self):
+        if self.server is None:
+            await self.start()
+        async with self.server:
+            await self.server.serve_forever()
+
+    async def close(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+            self.server = None
+        self.pool.shutdown()
+
+    def run(self):
+        asyncio.run(self.serve_forever())
+
+    async def _serve_connection(self, reader, writer):
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                try:
+                    request_id, kind, body = await read_frame(reader, MAX_REQUEST_BYTES)
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    break
+                except ValueError as e:  # Too large, the rest of the stream can not be trusted
+                    writer.write(encode_error(0, str(e)))
+                    break
+
+                if kind != REQUEST:
+                    writer.write(encode_error(request_id, f"Unexpected frame kind {kind}"))
+                    continue
+                try:
+                    result = await loop.run_in_executor(self.pool, self.executor.execute, body.decode())
+                    writer.write(encode_result(request_id, result))
+                except Exception as e:
+                    logger.error("Error executing %s: %s", body[:200], e)
+                    writer.write(encode_error(request_id, str(e)))
+                if writer.transport.get_write_buffer_size() > 65536:
+                    await writer.drain()  # Only waits for a slow reader, pipelined responses are sent in bulk
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+
+if __name__ == "__main__":
+    from main import NoSQLDatabase
+    logging.basicConfig(level=logging.INFO)
+    WireServer(NoSQLDatabase('D:/OOP/NoSQL Database project/db')).run()
@@ -0,0 +1,115 @@
+import asyncio
+import pytest
+from src.async_client import AsyncDBClient
+from src.async_server import AsyncDBServer
+from src.main_core import Core
+
+
+def _serve(tmp_path, scenario):
+    async def run():
+        server = AsyncDBServer(str(tmp_path), port=0, core=Core(str(tmp_path), compaction_interval=None))
+        await server.start()
+        try:
+            async with AsyncDBClient(port=server.port, max_connections=4) as client:
+                return await scenario(server, client)
+        finally:
+            await server.close()
+            server.core.close()
+    return asyncio.run(run())
+
+
+def test_operations(tmp_path):
+    async def scenario(server, client):
+        await client.insert("users", {"name": "John Doe", "age": 30})
+        assert await client.insert_many("users", [{"name": "Jane Doe", "age": 25}, {"name": "Jim Doe", "age": 40}]) == 2
+        await client.update("users", '"id" == 1', {"age": 31})
+        await client.delete("users", '"id" == 2')
+
+        assert await client.select("users", '"age" > 30') == [{"name": "John Doe", "age": 31, "id": 1},
+                                                               {"name": "Jim Doe", "age": 40, "id": 3}]
+        page, cursor = await client.select_page("users", '"age" > 0', limit=1)
+        assert page == [{"name": "John Doe", "age": 31, "id": 1}]
+        assert (await client.select_page("users", '"age" > 0', limit=1, cursor=cursor))[0][0]["id"] == 3
+        with pytest.raises(ValueError, match="does not exist"):
+            await client.select("orders", '"id" == 1')
+    _serve(tmp_path, scenario)
+
+
+def test_concurrent_requests_reuse_connections(tmp_path):
+    async def scenario(server, client):
+        opened = []
+        open_connection = asyncio.open_connection
+
+        async def counting(*args):
+            opened.append(args)
+            return await open_connection(*args)
+
+        asyncio.open_connection = counting
+        try:
+            await asyncio.gather(*(client.insert("users", {"n": i}) for i in range(200)))
+            results = await asyncio.gather(*(client.select("users", f'"n" == {i}') for i in range(0, 200, 20)))
+        finally:
+            asyncio.open_connection = open_connection
+
+        assert [result[0]["n"] for result in results] == list(range(0, 200, 20))
+        assert len(opened) <= 4
+    _serve(tmp_path, scenario)
+
+
+def test_idle_connections_do_not_block_requests(tmp_path):
+    async def scenario(server, client):
+        idle = [await asyncio.open_connection('127.0.0.1', server.port) for _ in range(200)]
+        try:
+            await client.insert("users", {"name": "John Doe"})
+            assert await client.select("users", '"id" == 1') == [{"name": "John Doe", "id": 1}]
+        finally:
+            for _, writer in idle:
+                writer.close()
+    _serve(tmp_path, scenario)
+
+
+def test_writes_are_not_sent_twice(tmp_path):
+    received = []
+
+    async def handle(reader, writer):  # Answers the first request, the next one is received but never answered
+        while True:
+            head = await reader.readuntil(b'\r\n\r\n')
+            length = int(head.split(b'Content-Length: ')[1].split(b'\r\n')[0])
+            received.append(await reader.readexactly(length))
+            if len(received) > 1:
+                writer.close()
+                return
+            body = b'{"status": "success"}'
+            writer.write(b'HTTP/1.1 200 OK\r\nContent-Length: %d\r\n\r\n%s' % (len(body), body))
+            await writer.drain()
+
+    async def run():
+        server = await asyncio.start_server(handle, '127.0.0.1', 0)
+        async with AsyncDBClient(port=server.sockets[0].getsockname()[1]) as client:
+            await client.insert("users", {"name": "John Doe"})
+            with pytest.raises((ConnectionError, asyncio.IncompleteReadError)):
+                await client.insert("users", {"name": "Jane Doe"})  # May have been applied, so it is not resent
+        server.close()
+        await server.wait_closed()
+
+    asyncio.run(run())
+    assert len(received) == 2
+
+
+@pytest.mark.parametrize("request_bytes", [
+    b'POST /insert HTTP/1.1\r\nContent-Length: 2\r\n\r\n[]',
+    b'POST /insert HTTP/1.1\r\nContent-Length: 4\r\n\r\n"hi"',
+    b'POST /insert HTTP/1.1\r\nContent-Length: abc\r\n\r\n',
+    b'POST /insert HTTP/1.1\r\nContent-Length: -1\r\n\r\n',
+])
+def test_malformed_requests_get_a_bad_request_response(tmp_path, request_bytes):
+    async def scenario(server, client):
+        reader, writer = await asyncio.open_connection('127.0.0.1', server.port)
+        try:
+            writer.write(request_bytes)
+            await writer.drain()
+            assert (await reader.readline()).startswith(b'HTTP/1.1 400 ')
+        finally:
+            writer.close()
+        await client.insert("users", {"name": "John Doe"})  # The server keeps serving
+    _serve(tmp_path, scenario)
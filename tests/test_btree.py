@@ -0,0 +1,116 @@
+import os
+import pytest
+from src.BTree import BPlusTree
+from src.core_with_binary_tree import Core
+
+
+def _depth(tree):
+    depth, node = 1, tree.root
+    while not node.leaf:
+        node = node.children[0]
+        depth += 1
+    return depth
+
+
+def test_monotonic_keys_stay_balanced():
+    tree = BPlusTree(order=8)
+    for i in range(10_000):
+        tree.insert(i, (i, i + 1))
+
+    assert len(tree) == 10_000
+    assert _depth(tree) <= 6
+    assert tree.search(7777) == [(7777, 7778)]
+    assert tree.search(10_000) is None
+
+
+def test_range_scan():
+    tree = BPlusTree(order=4)
+    for i in reversed(range(100)):
+        tree.insert(i, i)
+
+    assert [key for key, _ in tree.range(10, 15)] == [10, 11, 12, 13, 14, 15]
+    assert [key for key, _ in tree.range(10, 15, include_low=False, include_high=False)] == [11, 12, 13, 14]
+    assert [key for key, _ in tree.range(high=2)] == [0, 1, 2]
+
+
+def test_mixed_key_types():
+    tree = BPlusTree(order=4)
+    for key in ["b", 2, None, "a", 1]:
+        tree.insert(key, key)
+
+    assert [key for key, _ in tree.items()] == [None, 1, 2, "a", "b"]
+
+
+def test_save_and_load(tmp_path):
+    path = os.path.join(tmp_path, "users.id.idx")
+    tree = BPlusTree(order=4)
+    for i in range(200):
+        tree.insert(i % 50, (i, i + 1))
+    tree.save(path, {"fingerprint": [1, 2]})
+
+    loaded = BPlusTree.load(path)
+    assert loaded.meta == {"fingerprint": [1, 2]}
+    assert list(loaded.items()) == list(tree.items())
+    assert loaded.search(49) == tree.search(49)
+
+
+def test_index_survives_restart(tmp_path):
+    db = Core(str(tmp_path), compaction_interval=None)
+    db.insert_many("users", [{"name": f"user {i}", "age": i % 5} for i in range(20)])
+    db.add_index("users", "age")
+    assert [obj["id"] for obj in db.select("users", '"age" == 3')] == [4, 9, 14, 19]
+    assert os.path.exists(os.path.join(tmp_path, "users.age.idx"))
+
+    db = Core(str(tmp_path))
+    db.create_index = None  # A valid index file must be loaded, not rebuilt
+    assert [obj["id"] for obj in db.select("users", '"age" == 3')] == [4, 9, 14, 19]
+    db.close()
+
+
+def test_deleted_records_stay_deleted_without_close(tmp_path):
+    db = Core(str(tmp_path), compaction_interval=None)
+    db.insert_many("users", [{"name": f"u{i}", "age": i} for i in range(1, 6)])
+    db.add_index("users", "name")
+    db.save_indexes()
+    db.delete("users", '"name" == "u3"')
+
+    db = Core(str(tmp_path))  # The index file predates the delete
+    with pytest.raises(ValueError):
+        db.select("users", '"name" == "u3"')
+    assert [obj["name"] for obj in db.select("users", '"age" >= 1')] == ["u1", "u2", "u4", "u5"]
+    db.close()
+
+
+def test_index_written_to_is_saved_on_close(tmp_path):
+    db = Core(str(tmp_path))
+    db.insert_many("users", [{"name": f"user {i}", "age": i % 5} for i in range(20)])
+    db.add_index("users", "age")
+    db.insert("users", {"name": "new user", "age": 3})
+    db.close()
+
+    db = Core(str(tmp_path))
+    db.create_index = None
+    assert [obj["id"] for obj in db.select("users", '"age" == 3')] == [4, 9, 14, 19, 21]
+    db.close()
+
+
+def test_indexes_are_maintained_in_place(tmp_path):
+    db = Core(str(tmp_path))
+    db.insert_many("users", [{"name": f"user {i}", "age": i % 5} for i in range(10)])
+    for field in ("age", "name", "id"):
+        db.add_index("users", field)
+
+    def no_rebuild(*args):
+        raise AssertionError("index was rebuilt")
+    db.create_index = no_rebuild
+
+    db.insert("users", {"name": "new user", "age": 1})
+    assert [obj["id"] for obj in db.select("users", '"age" == 1')] == [2, 7, 11]
+
+    db.update("users", '"name" == "user 3"', {"age": 1})
+    assert [obj["id"] for obj in db.select("users", '"age" == 1')] == [2, 4, 7, 11]
+    assert db.select("users", '"name" == "user 3"') == [{"name": "user 3", "age": 1, "id": 4}]
+    db.close()
+
+    db.delete("users", '"id" == 7')
+    assert [obj["id"] for obj in db.select("users", '"age" == 1')] == [2, 4, 11]
@@ -0,0 +1,139 @@
+import time
+from src.main_core import Core
+from src.storage import LogStorage
+
+
+def _reads_from_disk(db):
+    reads = []
+    scan = db.storage.scan
+    db.storage.scan = lambda table_name: reads.append(table_name) or scan(table_name)
+    return reads
+
+
+def test_hot_table_is_read_from_memory(tmp_path):
+    db = Core(str(tmp_path))
+    db.insert_many("users", [{"name": f"user {i}", "age": i} for i in range(10)])
+    db.close()
+    db = Core(str(tmp_path), cache_bytes=1_000_000)
+    reads = _reads_from_disk(db)
+
+    for _ in range(3):
+        assert [obj["id"] for obj in db.select("users", '"age" < 3')] == [1, 2, 3]
+    assert reads == ["users"]
+    assert db.cache.stats()["hits"] == 2
+    db.close()
+
+
+def test_writes_are_written_back_on_flush(tmp_path):
+    db = Core(str(tmp_path))
+    db.insert("users", {"name": "John Doe"})
+    db.close()
+    db = Core(str(tmp_path), cache_bytes=1_000_000)
+    db.select("users", '"id" == 1')
+    db.insert("users", {"name": "Jane Doe"})
+    db.update("users", '"id" == 1', {"name": "John Smith"})
+
+    assert [obj["name"] for obj in db.select("users", '"id" >= 1')] == ["John Smith", "Jane Doe"]
+    assert len(db.storage.read("users")) == 1  # Still only in memory
+
+    db.flush("users")
+    assert [obj["name"] for obj in db.storage.read("users")] == ["John Smith", "Jane Doe"]
+    db.close()
+
+
+def test_cached_records_can_not_be_changed_by_callers(tmp_path):
+    db = Core(str(tmp_path), cache_bytes=1_000_000)
+    obj = {"name": "John Doe"}
+    db.insert("users", obj)
+    db.select("users", '"id" == 1')[0]["name"] = "changed"
+    obj["name"] = "changed"
+
+    assert db.select("users", '"id" == 1') == [{"name": "John Doe", "id": 1}]
+    db.close()
+
+
+def test_cached_nested_documents_can_not_be_changed_by_callers(tmp_path):
+    db = Core(str(tmp_path), cache_bytes=1_000_000)
+    db.insert("users", {"name": "John Doe"})
+    db.select("users", '"id" == 1')  # Caches the table
+    obj = {"name": "Jane Doe", "addr": {"city": "Kyiv"}}
+    db.insert("users", obj)
+    obj["addr"]["city"] = "changed"
+    db.select("users", '"id" == 2')[0]["addr"]["city"] = "changed"
+
+    assert db.select("users", '"addr.city" == "Kyiv"') == [{"name": "Jane Doe", "addr": {"city": "Kyiv"}, "id": 2}]
+    db.close()
+
+
+def test_least_recently_used_table_is_evicted(tmp_path):
+    db = Core(str(tmp_path), cache_bytes=700)
+    for table_name in ("a", "b", "c"):
+        db.insert_many(table_name, [{"value": "x" * 20} for _ in range(10)])
+        db.select(table_name, '"id" == 1')
+    db.insert(table_name, {"value": "dirty"})
+
+    assert not db.cache.contains("a")
+    assert db.cache.contains("c")
+    db.select("a", '"id" == 1')
+    assert not db.cache.contains("b")
+    assert db.storage.read("c")[-1] == {"value": "x" * 20, "id": 10}  # Only in memory so far
+    db.select("b", '"id" == 1')
+    assert not db.cache.contains("c")
+    assert db.storage.read("c")[-1] == {"value": "dirty", "id": 11}  # Written back when evicted
+    db.close()
+
+
+def test_table_larger_than_the_budget_is_not_cached(tmp_path):
+    db = Core(str(tmp_path), cache_bytes=100)
+    db.insert_many("users", [{"name": f"user {i}"} for i in range(10)])
+
+    assert len(db.select("users", '"id" > 0')) == 10
+    assert not db.cache.contains("users")
+
+    reads = _reads_from_disk(db)
+    db.select("users", '"id" > 0')
+    assert reads == ["users"]  # Only the scan of the select itself, the cache does not try to load it again
+    db.close()
+
+
+def test_dirty_tables_are_written_back_by_the_timer(tmp_path):
+    db = Core(str(tmp_path), cache_bytes=1_000_000, cache_flush_interval=0.01)
+    db.insert("users", {"name": "John Doe"})
+    db.select("users", '"id" == 1')
+    db.insert("users", {"name": "Jane Doe"})
+
+    deadline = time.time() + 2
+    while len(db.storage.read("users")) < 2 and time.time() < deadline:
+        time.sleep(0.01)
+    db.close()
+    assert len(db.storage.read("users")) == 2
+
+
+def test_deleted_dirty_records_stay_deleted_after_background_compaction(tmp_path):
+    storage = LogStorage(str(tmp_path), segment_size=50)
+    for i in range(1, 11):
+        storage.append("users", {"id": i, "age": i})  # Sealed segments, so there is something to compact
+    db = Core(str(tmp_path), storage=storage, cache_bytes=1_000_000, compaction_interval=None)
+    db.insert("users", {"age": 100})
+    db.delete("users", '"age" == 100')
+    db.insert("users", {"age": 200})
+    db.delete("users", '"age" < 5')
+
+    db.compactor.run_once()
+    assert db.compactor.compactions == 1
+    assert storage.read("users")[-1] == {"age": 200, "id": 12}  # Written back before the compaction
+    db.close()
+
+    db = Core(str(tmp_path), compaction_interval=None)
+    assert [obj["age"] for obj in db.select("users", '"id" > 0')] == [5, 6, 7, 8, 9, 10, 200]
+    db.close()
+
+
+def test_writes_to_a_new_table_are_not_kept_in_memory(tmp_path):
+    db = Core(str(tmp_path), cache_bytes=1_000_000, compaction_interval=None)
+    db.insert("users", {"name": "John Doe"})
+    db.insert("users", {"name": "Jane Doe"})  # No close, e.g. the process just exits
+
+    db = Core(str(tmp_path))
+    assert [obj["name"] for obj in db.select("users", '"id" >= 1')] == ["John Doe", "Jane Doe"]
+    db.close()
@@ -0,0 +1,130 @@
+import os
+import threading
+import time
+import pytest
+from src.compaction import Compactor
+from src.core_with_binary_tree import Core as IndexedCore
+from src.main_core import Core
+from src.storage import LogStorage
+
+
+def _table_size(storage, table_name):
+    return sum(segment["size"] for segment in storage.segments(table_name))
+
+
+def test_compaction_drops_deleted_and_superseded_records(tmp_path):
+    storage = LogStorage(str(tmp_path), segment_size=100)
+    storage.append_many("users", [{"id": i, "name": f"user {i}"} for i in range(1, 21)])
+    storage.append_many("users", [{"id": i, "name": "updated"} for i in range(1, 6)])
+    storage.delete("users", range(6, 11))
+    storage.append("users", {"id": 21})
+    before = storage.read("users")
+    size = _table_size(storage, "users")
+
+    assert storage.garbage("users") > 0.3
+    storage.compact("users")
+
+    assert storage.read("users") == before
+    assert storage.garbage("users") == 0
+    assert _table_size(storage, "users") < size
+    assert storage._tombstones["users"] == set()  # The deleted records are gone, so are their tombstones
+    assert LogStorage(str(tmp_path)).read("users") == before
+
+
+def test_garbage_is_counted_outside_the_storage_lock(tmp_path):
+    storage = LogStorage(str(tmp_path), segment_size=100)
+    for batch in range(4):  # Seals the segments as it goes
+        storage.append_many("users", [{"id": i} for i in range(batch * 10 + 1, batch * 10 + 11)])
+    storage.delete("users", range(1, 11))
+    dead_lines = storage._dead_lines
+    free = []
+
+    def counting(*args):
+        thread = threading.Thread(target=lambda: free.append(storage.lock.acquire(timeout=1) and storage.lock.release() is None))
+        thread.start()
+        thread.join()
+        return dead_lines(*args)
+
+    storage._dead_lines = counting
+    assert storage.garbage("users") > 0
+    assert free == [True]  # Another thread could take the lock while the dead records were counted
+
+
+@pytest.mark.parametrize("core", [Core, IndexedCore])
+def test_flush_compacts_a_table_with_a_single_segment(tmp_path, core):
+    db = core(str(tmp_path), compaction_interval=None)
+    db.insert_many("users", [{"name": f"user {i}", "age": 0} for i in range(100)])
+    for age in range(1, 6):
+        db.update("users", '"id" >= 1', {"age": age})
+    db.delete("users", '"id" > 10')
+    assert len(db.storage.segments("users")) == 1
+    size = _table_size(db.storage, "users")
+
+    db.flush("users")
+
+    assert _table_size(db.storage, "users") < size / 20
+    assert db.storage._tombstones["users"] == set()
+    assert db.storage.garbage("users") == 0
+    assert [obj["age"] for obj in db.select("users", '"id" >= 1')] == [5] * 10
+    db.insert("users", {"name": "new"})
+    assert db.select("users", '"name" == "new"')[0]["id"] == 101
+    db.close()
+
+
+def test_tombstones_survive_a_restart(tmp_path):
+    db = Core(str(tmp_path), compaction_interval=None)
+    db.insert_many("users", [{"name": f"user {i}"} for i in range(3)])
+    db.delete("users", '"id" == 2')
+
+    db = Core(str(tmp_path), compaction_interval=None)
+    assert [obj["id"] for obj in db.select("users", '"id" >= 1')] == [1, 3]
+    db.close()
+
+
+def test_compaction_is_rate_limited(tmp_path):
+    storage = LogStorage(str(tmp_path), segment_size=1000)
+    storage.append_many("users", [{"id": i, "bio": "x" * 80} for i in range(1, 41)])
+    storage.append("users", {"id": 41})
+
+    started = time.monotonic()
+    storage.compact("users", rate=20_000)
+
+    assert time.monotonic() - started >= 0.15  # About 4 KB copied at 20 KB per second
+
+
+def test_background_compaction_keeps_indexes_valid(tmp_path):
+    db = IndexedCore(str(tmp_path), storage=LogStorage(str(tmp_path), segment_size=200), compaction_interval=None)
+    db.insert_many("users", [{"name": f"user {i}", "age": i % 5} for i in range(30)])
+    db.add_index("users", "age")
+    db.delete("users", '"age" == 1')
+    db.update("users", '"age" == 2', {"name": "updated"})
+
+    compactor = Compactor(db.storage, interval=None, garbage_ratio=0.1, lock=db.locks.write, on_moved=db._relocate)
+    compactor.run_once()
+
+    assert compactor.compactions == 1
+    assert [obj["id"] for obj in db.select("users", '"age" == 3')] == [4, 9, 14, 19, 24, 29]
+    assert {obj["name"] for obj in db.select("users", '"age" == 2')} == {"updated"}
+    assert not os.path.exists(os.path.join(tmp_path, "users.0.log"))
+    db.close()
+
+
+def test_background_compaction_survives_a_failed_run(tmp_path, caplog):
+    storage = LogStorage(str(tmp_path))
+    storage.append("users", {"id": 1})
+    runs = []
+
+    def garbage(table_name):
+        runs.append(table_name)
+        if len(runs) == 1:
+            raise OSError("disk full")
+        return 0.0
+    storage.garbage = garbage
+    compactor = Compactor(storage, interval=0.01)
+
+    deadline = time.time() + 2
+    while len(runs) < 2 and time.time() < deadline:
+        time.sleep(0.01)
+    compactor.close()
+    assert len(runs) >= 2
+    assert "Background compaction failed" in caplog.text
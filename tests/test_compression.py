@@ -0,0 +1,62 @@
+import os
+from src.compaction import Compactor
+from src.main_core import Core
+from src.storage import LogStorage
+
+
+def _users(start, stop):
+    return [{"id": i, "name": f"user {i}", "email": f"user{i}@example.com", "city": "Kyiv"} for i in range(start, stop)]
+
+
+def _fill(storage):
+    for start in range(1, 401, 50):  # Seals a segment every few batches
+        storage.append_many("users", _users(start, start + 50))
+
+
+def test_sealed_segments_are_compressed(tmp_path):
+    storage = LogStorage(str(tmp_path), segment_size=4000, compression='zlib', block_size=1000)
+    _fill(storage)
+    raw_size = sum(os.path.getsize(os.path.join(tmp_path, segment["file"])) for segment in storage.segments("users"))
+    before = storage.read("users")
+
+    compressed = storage.compress("users")
+
+    segments = storage.segments("users")
+    assert compressed == len(segments) - 1
+    assert all(segment.get("compression") == 'zlib' for segment in segments[:-1])
+    assert "compression" not in segments[-1]  # The active segment stays raw
+    assert sum(os.path.getsize(os.path.join(tmp_path, segment["file"])) for segment in segments) < raw_size / 2
+    for storage in (storage, LogStorage(str(tmp_path), compression='zlib')):
+        assert storage.read("users") == before
+        assert storage.read_at("users", storage.locations("users")[100]) == before[100]
+
+
+def test_point_read_decompresses_one_block(tmp_path):
+    storage = LogStorage(str(tmp_path), segment_size=4000, compression='zlib', block_size=1000)
+    _fill(storage)
+    storage.compress("users")
+    storage = LogStorage(str(tmp_path), compression='zlib')
+
+    location = storage.locations("users")[10]
+    assert storage.read_at("users", location)["id"] == 11
+    assert storage.read_at("users", storage.locations("users")[11])["id"] == 12  # Most likely in the same block
+    assert storage.blocks.misses == 1 and storage.blocks.hits == 1
+
+
+def test_compressed_segments_are_compacted_and_scanned_in_parallel(tmp_path):
+    storage = LogStorage(str(tmp_path), segment_size=4000, compression='lzma')
+    db = Core(str(tmp_path), storage=storage, compaction_interval=None, scan_workers=2)
+    db.scanner.min_records = 1
+    try:
+        _fill(storage)
+        compactor = Compactor(storage, interval=None)
+        compactor.run_once()
+        assert compactor.compressions > 0
+
+        db.delete("users", '"id" <= 200')
+        compactor.run_once()
+        assert compactor.compactions == 1
+        assert [obj["id"] for obj in db.select("users", '"city" == "Kyiv"')] == list(range(201, 401))
+        assert LogStorage(str(tmp_path)).read("users") == _users(201, 401)
+    finally:
+        db.close()
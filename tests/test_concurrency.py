@@ -0,0 +1,160 @@
+import sys
+import threading
+import pytest
+from src.core_with_binary_tree import Core as IndexedCore
+from src.locks import RWLock
+from src.main_core import Core
+
+
+def test_readers_share_the_lock_and_writers_wait():
+    lock = RWLock()
+    events = []
+    reading = threading.Event()
+    release = threading.Event()
+
+    def reader():
+        with lock.read():
+            reading.set()
+            release.wait()
+            events.append("read")
+
+    def writer():
+        with lock.write():
+            events.append("write")
+
+    reader_thread = threading.Thread(target=reader)
+    reader_thread.start()
+    reading.wait()
+    with lock.read():  # A second reader gets in while the first one holds the lock
+        pass
+
+    writer_thread = threading.Thread(target=writer)
+    writer_thread.start()
+    writer_thread.join(timeout=0.2)
+    assert writer_thread.is_alive() and events == []  # The writer waits for the reader
+
+    release.set()
+    reader_thread.join()
+    writer_thread.join()
+    assert events == ["read", "write"]
+
+
+def test_writer_may_read_again():
+    lock = RWLock()
+    with lock.write():
+        with lock.read():
+            with lock.write():
+                pass
+    with lock.write():  # Released completely
+        pass
+
+
+@pytest.mark.parametrize("core", [Core, IndexedCore])
+def test_concurrent_reads_and_writes(tmp_path, core):
+    db = core(str(tmp_path), compaction_interval=None)
+    for table_name in ("users", "orders"):
+        db.insert_many(table_name, [{"a": 0, "b": 0} for _ in range(50)])
+    if core is IndexedCore:
+        db.add_index("users", "a")
+
+    errors = []
+    done = threading.Event()
+
+    def guard(target):
+        def run():
+            try:
+                target()
+            except Exception as e:
+                errors.append(e)
+        return run
+
+    def writer(table_name, value):
+        for i in range(20):
+            db.insert(table_name, {"a": value, "b": value})
+            db.update(table_name, f'"id" == {20 * (value - 1) + i + 1}', {"a": value, "b": value})  # Both fields in one write
+        db.delete(table_name, f'"a" == {value}')
+
+    def reader(table_name):
+        while not done.is_set():
+            records = db.select(table_name, '"id" >= 1')
+            ids = [obj["id"] for obj in records]
+            assert ids == sorted(set(ids))
+            assert all(obj["a"] == obj["b"] for obj in records)
+
+    writers = [threading.Thread(target=guard(lambda t=t, v=v: writer(t, v)))
+               for t in ("users", "orders") for v in (1, 2)]
+    readers = [threading.Thread(target=guard(lambda t=t: reader(t))) for t in ("users", "orders") for _ in range(2)]
+    for thread in writers + readers:
+        thread.start()
+    for thread in writers:
+        thread.join()
+    done.set()
+    for thread in readers:
+        thread.join()
+
+    assert errors == []
+    for table_name in ("users", "orders"):
+        records = db.select(table_name, '"id" >= 1')
+        assert [obj["id"] for obj in records] == list(range(41, 51))  # Every writer deleted the records it updated
+        assert len({obj["id"] for obj in records}) == len(records)
+    db.close()
+
+
+def test_iterator_survives_writes_and_other_reads(tmp_path):
+    db = Core(str(tmp_path), compaction_interval=None)
+    db.insert_many("users", [{"a": i} for i in range(3)])
+    results = db.iter_select("users", '"a" >= 0')
+    next(results)
+    db.insert("users", {"a": 99})  # Grows the segment, the next read maps it again
+    assert db.select("users", '"a" == 99') == [{"a": 99, "id": 4}]
+
+    assert [obj["id"] for obj in results] == [2, 3]
+    db.close()
+
+
+def test_indexes_built_while_other_tables_are_written(tmp_path):
+    db = IndexedCore(str(tmp_path), compaction_interval=None)
+    tables = [f"t{i}" for i in range(10)]
+    for table_name in tables:
+        db.insert_many(table_name, [{"a": i} for i in range(5)])
+    for field in ("a", "id", "b", "c", "d"):
+        db.add_index("t0", field)
+
+    errors = []
+
+    done = threading.Event()
+    inserted = []
+
+    def writer():
+        try:
+            while not done.is_set():
+                db.insert("t0", {"a": 1000 + len(inserted)})
+                inserted.append(1)
+        except Exception as e:
+            errors.append(e)
+
+    def indexer(fields):
+        try:
+            for table_name in tables[1:]:
+                for field in fields:
+                    db.add_index(table_name, field)
+        except Exception as e:
+            errors.append(e)
+
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)  # Switch threads often, so a new index lands while an insert walks the indexes
+    try:
+        writer_thread = threading.Thread(target=writer)
+        indexers = [threading.Thread(target=indexer, args=([f"f{i}" for i in range(start, 100, 2)],)) for start in (0, 1)]
+        for thread in [writer_thread] + indexers:
+            thread.start()
+        for thread in indexers:
+            thread.join()
+        done.set()
+        writer_thread.join()
+    finally:
+        sys.setswitchinterval(interval)
+
+    assert errors == []
+    assert len(db._get_index("t0", "a").lookup(">=", 1000)) == len(inserted)  # Every insert reached the index
+    db.close()
@@ -0,0 +1,67 @@
+import pytest
+from src.DBWebServer import DBWebServer
+from src.core_with_binary_tree import Core as IndexedCore
+from src.main_core import Core
+from src.metrics import metrics
+
+
+@pytest.fixture(autouse=True)
+def _fresh_metrics():
+    metrics.reset()
+    yield
+    metrics.sample_rate = 0.0
+    metrics.stop_profiling()
+
+
+def test_counters_are_kept_and_sampling_is_off_by_default(tmp_path):
+    db = Core(str(tmp_path), compaction_interval=None)
+    try:
+        db.insert_many("users", [{"name": f"user {i}", "age": i} for i in range(10)])
+        db.select("users", '"age" >= 5')
+        with pytest.raises(ValueError):
+            db.select("users", '"age" > 100')
+        db.flush("users")
+    finally:
+        db.close()
+
+    snapshot = metrics.snapshot()
+    counters = snapshot["counters"]
+    assert counters["insert_many.calls"] == 1
+    assert counters["select.calls"] == 2 and counters["select.errors"] == 1
+    assert counters["query.full_scans"] == 2
+    assert counters["storage.records_scanned"] == 20
+    assert counters["storage.bytes_written"] > 0 and counters["storage.bytes_read"] > 0
+    assert set(snapshot["histograms"]) == {"flush.seconds"}  # Flushes are always timed, single calls only when sampled
+
+
+def test_sampled_latency_and_index_lookups(tmp_path):
+    metrics.sample_rate = 1.0
+    db = IndexedCore(str(tmp_path), compaction_interval=None)
+    try:
+        db.insert_many("users", [{"name": f"user {i}"} for i in range(100)])
+        db.add_index("users", "id")
+        db.select("users", '"id" == 7')
+        db.select("users", '"name" == "user 7"')
+    finally:
+        db.close()
+
+    counters = metrics.counters
+    assert counters["query.index_lookups"] == 1 and counters["query.full_scans"] == 1
+    assert metrics.histograms["select.seconds"].count == 2
+    assert 'nosql_select_seconds_count 2' in metrics.to_prometheus()
+
+
+def test_metrics_endpoint_and_runtime_profiling(tmp_path):
+    server = DBWebServer(str(tmp_path), core=Core(str(tmp_path), compaction_interval=None))
+    client = server.app.test_client()
+    try:
+        assert client.post('/profile', json={"enabled": True}).get_json()["status"] == "success"
+        client.post('/insert', json={"table": "users", "object": {"name": "Alice"}})
+        report = client.post('/profile', json={"enabled": False}).get_json()["report"]
+        assert "insert" in report
+
+        assert "nosql_insert_calls 1" in client.get('/metrics').get_data(as_text=True)
+        assert client.get('/metrics?format=json').get_json()["counters"]["insert.calls"] == 1
+    finally:
+        server.close()
+        server.core.close()
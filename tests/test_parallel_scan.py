@@ -0,0 +1,63 @@
+import time
+from concurrent.futures import ProcessPoolExecutor
+from src.main_core import Core
+from src.parallel_scan import ParallelScanner
+from src.query_language import prepare
+from src.storage import LogStorage
+
+
+def test_parallel_scan_matches_serial_scan(tmp_path):
+    storage = LogStorage(str(tmp_path), segment_size=2000)
+    db = Core(str(tmp_path), storage=storage, compaction_interval=None, scan_workers=2)
+    db.scanner.min_records = 1
+    db.insert_many("users", [{"name": f"user {i}", "age": i % 50} for i in range(500)])
+    db.update("users", '"age" == 7', {"age": 70})
+    db.delete("users", '"age" == 8')
+
+    serial = Core(str(tmp_path), storage=storage, compaction_interval=None)
+    try:
+        for condition in ('"age" > 40', '"age" == 70 or "id" < 5', '"name" == "user 13"'):
+            assert db.scanner.scan("users", condition) is not None
+            assert db.select("users", condition) == serial.select("users", condition)
+        assert [obj["id"] for obj in db.select_page("users", '"age" >= 0', limit=3, offset=2)[0]] == [3, 4, 5]
+    finally:
+        db.close()
+        serial.close()
+
+
+def test_workers_get_the_bound_condition(tmp_path):
+    db = Core(str(tmp_path), compaction_interval=None, scan_workers=2)
+    db.scanner.min_records = 1
+    db.insert_many("users", [{"age": 30}, {"age": "30"}, {"age": 31}])
+    _, _, condition, _ = prepare('select users where "age" == ?').bind(("30",))  # Its text would match "30" and 30
+    try:
+        assert [obj["id"] for obj in db.scanner.scan("users", condition)] == [2]
+    finally:
+        db.close()
+
+
+def test_small_tables_are_scanned_serially(tmp_path):
+    db = Core(str(tmp_path), compaction_interval=None, scan_workers=2)
+    db.insert("users", {"name": "John Doe"})
+    try:
+        assert db.scanner.scan("users", '"id" == 1') is None
+        assert db.select("users", '"id" == 1') == [{"name": "John Doe", "id": 1}]
+    finally:
+        db.close()
+
+
+def test_results_survive_a_compaction(tmp_path):
+    storage = LogStorage(str(tmp_path), segment_size=2000)
+    for batch in range(10):  # Seals the segments as it goes
+        storage.append_many("users", [{"id": i, "age": i % 50} for i in range(batch * 50 + 1, batch * 50 + 51)])
+    storage.delete("users", range(1, 251))
+    scanner = ParallelScanner(storage, 1, min_records=1)
+    scanner._pool = ProcessPoolExecutor(max_workers=1)
+    scanner._pool.submit(time.sleep, 0.5)  # Keeps the worker busy, the partitions are only opened afterwards
+    try:
+        results = scanner.scan("users", '"age" >= 0')
+        storage.compact("users")  # Removes the segments the workers were given
+
+        assert [obj["id"] for obj in results] == list(range(251, 501))
+    finally:
+        scanner.close()
@@ -0,0 +1,102 @@
+from src.core_with_binary_tree import Core as IndexedCore
+from src.main_core import Core
+from src.query_language import QueryExecutor
+
+
+def _fill(db, n=200):
+    db.insert_many("users", [{"name": f"user {i}", "age": 18 + i % 50, "city": "Kyiv" if i % 2 else "Lviv"} for i in range(n)])
+
+
+def test_one_off_query_scans_instead_of_building_an_index(tmp_path):
+    db = IndexedCore(str(tmp_path))
+    _fill(db)
+
+    assert db.explain("users", '"name" == "user 7"')["plan"] == "scan"
+    assert [obj["id"] for obj in db.select("users", '"name" == "user 7"')] == [8]
+    assert ("users", "name") not in db.garden
+    db.close()
+
+
+def test_repeated_queries_build_an_index(tmp_path):
+    db = IndexedCore(str(tmp_path))
+    _fill(db)
+
+    built = []
+    for _ in range(4):
+        db.select("users", '"name" == "user 7"')
+        built.append(("users", "name") in db.garden)
+
+    assert built == [False, False, True, True]
+    assert db.explain("users", '"name" == "user 7"')["plan"] == "index"
+    db.close()
+
+
+def test_unselective_condition_prefers_scan_over_index(tmp_path):
+    db = IndexedCore(str(tmp_path))
+    _fill(db)
+    db.add_index("users", "city")
+    db.add_index("users", "age")
+
+    assert db.explain("users", '"age" >= 18')["plan"] == "scan"  # Every row matches, the index would only add reads
+    plan = db.explain("users", '"city" == "Kyiv" AND "age" == 20')
+    assert plan["plan"] == "index" and plan["fields"] == ["age"]
+    assert plan["estimated_rows"] == 4
+    assert db.explain("users", '"age" > 60')["estimated_rows"] < 30
+    db.close()
+
+
+def test_statistics_follow_writes(tmp_path):
+    db = IndexedCore(str(tmp_path))
+    _fill(db, 10)
+    assert db.explain("users", '"age" == 99')["estimated_rows"] == 0
+
+    db.update("users", '"id" == 1', {"age": 99})
+    db.insert("users", {"name": "new", "age": 99})
+    assert db.explain("users", '"age" == 99')["estimated_rows"] == 2
+    db.close()
+
+
+def test_explain_query(tmp_path):
+    db = Core(str(tmp_path))
+    _fill(db, 10)
+
+    plan = QueryExecutor(db).execute('explain select users where "city" == "Kyiv"')
+    assert plan["plan"] == "scan"
+    assert plan["estimated_rows"] == 5
+    assert plan["condition"] == '"city" == "Kyiv"'
+    db.close()
+
+
+def _count_scans(db):
+    scans = []
+    scan = db.storage.scan
+    db.storage.scan = lambda table_name: scans.append(table_name) or scan(table_name)
+    return scans
+
+
+def test_first_query_collects_the_statistics_in_its_scan(tmp_path):
+    db = IndexedCore(str(tmp_path))
+    _fill(db)
+    db.close()
+    db = IndexedCore(str(tmp_path))
+    scans = _count_scans(db)
+
+    assert [obj["id"] for obj in db.select("users", '"name" == "user 7"')] == [8]
+    assert scans == ["users"]
+    assert db.explain("users", '"age" == 20')["estimated_rows"] == 4
+    assert scans == ["users"]
+    db.close()
+
+
+def test_explain_reads_the_table_once_per_write(tmp_path):
+    db = Core(str(tmp_path))
+    _fill(db, 10)
+    scans = _count_scans(db)
+
+    db.explain("users", '"city" == "Kyiv"')
+    assert db.explain("users", '"city" == "Lviv"')["estimated_rows"] == 5
+    assert scans == ["users"]
+    db.insert("users", {"city": "Lviv"})
+    assert db.explain("users", '"city" == "Lviv"')["estimated_rows"] == 6
+    assert scans == ["users", "users"]
+    db.close()
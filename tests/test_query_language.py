@@ -0,0 +1,160 @@
+import pytest
+from main import NoSQLDatabase
+from src.DBWebServer import DBWebServer
+from src.core_with_binary_tree import Core as IndexedCore
+from src.main_core import Core
+from src.query_language import QueryExecutor, QueryParser, parse_condition, prepare
+
+USERS = [
+    {"name": "John Doe", "age": 30, "address": {"city": "Kyiv"}},
+    {"name": "Jane Doe", "age": 25, "address": {"city": "Lviv"}},
+    {"name": "Jim O'Neil", "age": 41},
+    {"name": "Jill", "age": "unknown"},
+]
+
+
+def test_comparisons():
+    assert parse_condition('"age" >= 30').matches(USERS[0])
+    assert not parse_condition('"age" > 30').matches(USERS[0])
+    assert not parse_condition('"age" < 30').matches(USERS[3])  # A string is never less than a number
+    assert parse_condition('"name" != "Jane Doe"').matches(USERS[0])
+    assert parse_condition("name == 'Jim O\\'Neil'").matches(USERS[2])
+
+
+def test_quoted_literals_still_match_the_values_they_always_matched():
+    records = [{"id": 5, "degree": True, "email": None}, {"id": "5", "degree": "true", "email": "null"}, {"id": 6, "degree": False}]
+    for text in ['"id" == "5"', '"degree" == "true"', '"email" == "null"']:
+        assert [parse_condition(text).matches(obj) for obj in records] == [True, True, False]
+        assert [parse_condition(text.replace("==", "!=")).matches(obj) for obj in records] == [False, False, True]
+    assert not parse_condition('"degree" == "false"').matches(records[2])  # Never read as a literal
+    assert not parse_condition('"id" > "4"').matches(records[0])  # Only equality, ordering compares the types
+    assert parse_condition('"id" == "5"').normalized() == parse_condition('"id" IN (5, "5")').normalized()
+
+
+@pytest.mark.parametrize("core", [Core, IndexedCore])
+def test_quoted_ids_select_records(tmp_path, core):
+    db = core(str(tmp_path))
+    db.insert_many("users", [{"name": "John", "degree": True}, {"name": "Jane", "email": None}])
+    if core is IndexedCore:
+        db.add_index("users", "id")
+    assert db.select("users", '"id" == "2"') == [{"name": "Jane", "email": None, "id": 2}]
+    assert [obj["name"] for obj in db.select("users", '"degree" == "true"')] == ["John"]
+    assert [obj["name"] for obj in db.select("users", '"email" == "null"')] == ["Jane"]
+    db.close()
+
+
+def test_boolean_operators_and_nested_fields():
+    condition = parse_condition('address.city IN ("Kyiv", "Odesa") OR (age > 40 AND NOT name == "Jill")')
+    assert [condition.matches(obj) for obj in USERS] == [True, False, True, False]
+
+
+def test_condition_is_compiled_once():
+    assert parse_condition('"id" == 5') is parse_condition('"id" == 5')
+    assert QueryParser.parse('select users where "id" == 5')[2] is parse_condition('"id" == 5')
+
+
+@pytest.mark.parametrize("text", ['', '"age" >', '"age" == 1 AND', '"age" IN 1', '("age" == 1'])
+def test_invalid_conditions(text):
+    with pytest.raises(ValueError):
+        parse_condition(text)
+
+
+@pytest.mark.parametrize("core", [Core, IndexedCore])
+def test_select_with_rich_conditions(tmp_path, core):
+    db = core(str(tmp_path))
+    db.insert_many("users", [dict(obj) for obj in USERS])
+
+    def ids(condition):
+        return sorted(obj["id"] for obj in db.select("users", condition))
+
+    assert ids('"age" >= 30') == [1, 3]
+    assert ids('"age" < 30') == [2]
+    assert ids('"age" IN (25, 41)') == [2, 3]
+    assert ids('"age" > 26 AND "name" != "Jim O\'Neil"') == [1]
+    assert ids('"age" == 25 OR "name" == "Jill"') == [2, 4]
+    assert ids('NOT "age" > 26') == [2, 4]
+    assert ids('address.city == "Lviv"') == [2]
+    db.close()
+
+
+@pytest.mark.parametrize("core", [Core, IndexedCore])
+def test_paging_with_cursor(tmp_path, core):
+    db = core(str(tmp_path))
+    db.insert_many("users", [{"name": f"user {i}", "age": i % 3} for i in range(10)])
+
+    pages, cursor = [], None
+    while True:
+        page, cursor = db.select_page("users", '"age" == 0', limit=2, cursor=cursor)
+        pages.append([obj["id"] for obj in page])
+        if cursor is None:
+            break
+
+    assert pages == [[1, 4], [7, 10]]
+    assert [obj["id"] for obj in db.iter_select("users", '"age" >= 0', limit=3, offset=2)] == [3, 4, 5]
+    with pytest.raises(ValueError):
+        db.select_page("users", '"age" == 0', limit=0)  # Its cursor would skip the first match
+    for paging in ({"limit": 0}, {"offset": -1}):
+        with pytest.raises(ValueError, match="Invalid"):
+            db.iter_select("users", '"age" == 0', **paging)
+    db.close()
+
+
+def test_web_server_rejects_bad_streaming_selects(tmp_path):
+    server = DBWebServer(str(tmp_path), core=Core(str(tmp_path), compaction_interval=None))
+    client = server.app.test_client()
+    try:
+        client.post('/insert', json={"table": "users", "object": {"name": "Alice", "age": 30}})
+        for paging, message in (({"offset": -1}, "Invalid offset: -1"), ({"limit": 0}, "Invalid limit: 0")):
+            response = client.get('/select_stream', query_string={"table": "users", "condition": '"age" > 0', **paging})
+            assert response.get_json()["status"] == "error" and response.get_json()["message"].startswith(message)
+        for path in ('/select', '/select_stream', '/select_html'):
+            response = client.get(path, query_string={"table": "users"})
+            assert response.status_code == 400 and b"Missing condition" in response.data
+    finally:
+        server.close()
+        server.core.close()
+
+
+def test_paging_clauses_are_parsed():
+    parsed = QueryParser.parse('select users where "name" == "limit 5" limit 10 offset 20')
+    assert str(parsed[2]) == '"name" == "limit 5"'
+    assert parsed[3] == {"limit": 10, "offset": 20}
+    with pytest.raises(ValueError):
+        QueryParser.parse('select users where "age" == 1 limit 0')
+
+
+def test_quotes_in_inserted_values_are_kept(tmp_path):
+    db = Core(str(tmp_path))
+    executor = QueryExecutor(db)
+    executor.execute("""insert users {'name': "Jim O'Neil", 'bio': 'it\\'s "quoted"', 'tags': ['a', null, 1.5]}""")
+    executor.execute('insert many users [{"name": "Ann\'s"}]')
+
+    assert db.storage.read("users") == [
+        {"name": "Jim O'Neil", "bio": 'it\'s "quoted"', "tags": ['a', None, 1.5], "id": 1}, {"name": "Ann's", "id": 2}]
+    db.close()
+
+
+def test_prepared_statements_bind_parameters(tmp_path):
+    db = NoSQLDatabase(str(tmp_path))
+    executor = QueryExecutor(db)
+    insert = executor.prepare('insert users {"name": ?, "age": ?}')
+    for name, age in [("Jim O'Neil", 41), ("Jane", 25), ("John", 30)]:
+        executor.execute(insert, name, age)
+    executor.execute('update users set {"age": ?} where "name" == ?', 26, "Jane")
+
+    select = executor.prepare('select users where "age" >= ? and "name" != ? limit 5')
+    assert select is prepare('select users where "age" >= ? and "name" != ? limit 5')  # Parsed once per template
+    assert [obj["name"] for obj in executor.execute(select, 26, "John")["data"]] == ["Jim O'Neil", "Jane"]
+    assert [obj["id"] for obj in executor.execute('select users where "name" IN (?, ?)', "Jane", "John")] == [2, 3]
+    with pytest.raises(ValueError):
+        executor.execute(select, 26)
+    with pytest.raises(ValueError):
+        db.select("users", '"age" == ?')
+    db.close()
+
+
+def test_parsed_templates_are_not_changed_by_execution():
+    statement = prepare('insert users {"name": "John", "tags": [?]}')
+    first = statement.bind(("a",))
+    first[2]["id"] = 1
+    assert statement.bind(("b",)) == ('insert', 'users', {"name": "John", "tags": ["b"]})
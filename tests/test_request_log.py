@@ -0,0 +1,62 @@
+import json
+import logging
+import threading
+from src.DBWebServer import DBWebServer
+from src.main_core import Core
+from src.request_log import RequestLog
+
+
+def _entries(path):
+    with open(path) as file:
+        return [json.loads(line) for line in file]
+
+
+def test_web_server_logs_errors_and_samples_successes(tmp_path):
+    db_path = str(tmp_path / "db")
+    server = DBWebServer(db_path, core=Core(db_path, compaction_interval=None), log_sample_rate=0.0)
+    client = server.app.test_client()
+    try:
+        client.post('/insert', json={"table": "users", "object": {"name": "Alice"}})
+        client.post('/delete', json={"table": "users", "condition": '"id" == 100'})
+    finally:
+        server.close()
+        server.core.close()
+
+    entries = _entries(tmp_path / "db" / "server_logs" / "db_web_server.log")
+    assert [entry["message"] for entry in entries] == [
+        "Logging is set up.", "Error deleting from table users: No matching records found in table users for condition \"id\" == 100"]
+    assert entries[1]["level"] == "ERROR" and entries[1]["table"] == "users" and entries[1]["condition"] == '"id" == 100'
+
+
+def test_servers_only_log_their_own_requests(tmp_path):
+    servers = [DBWebServer(str(tmp_path / name), core=Core(str(tmp_path / name), compaction_interval=None),
+                           log_sample_rate=1.0) for name in ("a", "b")]
+    try:
+        servers[0].app.test_client().post('/insert', json={"table": "users", "object": {"name": "Alice"}})
+    finally:
+        for server in servers:
+            server.close()
+            server.core.close()
+
+    assert [entry["message"] for entry in _entries(tmp_path / "a" / "server_logs" / "db_web_server.log")] == [
+        "Logging is set up.", "Inserted into table users"]
+    assert [entry["message"] for entry in _entries(tmp_path / "b" / "server_logs" / "db_web_server.log")] == [
+        "Logging is set up."]
+    assert not servers[0].logger.handlers
+
+
+def test_payloads_are_formatted_by_the_listener(tmp_path):
+    formatted_in = []
+
+    class Payload:
+        def __str__(self):
+            formatted_in.append(threading.current_thread())
+            return "payload"
+
+    log = RequestLog(logging.getLogger("test_request_log"), str(tmp_path / "requests.log"), sample_rate=1.0)
+    log.success("Inserted %s", Payload(), table="users", object={"name": "Alice"})
+    log.close()
+
+    [entry] = _entries(tmp_path / "requests.log")
+    assert entry["message"] == "Inserted payload" and entry["object"] == {"name": "Alice"}
+    assert formatted_in and threading.current_thread() not in formatted_in
@@ -0,0 +1,66 @@
+import pytest
+from src.DBWebServer import DBWebServer
+from src.main_core import Core
+from src.query_language import parse_condition
+from src.result_cache import ResultCache
+
+
+@pytest.fixture
+def db(tmp_path):
+    db = Core(str(tmp_path), compaction_interval=None, result_cache_records=1000)
+    db.insert_many("users", [{"name": f"user {i}", "age": 20 + i % 10} for i in range(50)])
+    yield db
+    db.close()
+
+
+def test_equivalent_conditions_share_a_result(db):
+    first = db.select("users", '"age" >= 25 and "name" != "user 7"')
+    assert db.select("users", "name != 'user 7' AND age >= 25") == first
+    first[0]["age"] = 100  # Callers get copies
+    assert db.select("users", '"age" >= 25 and "name" != "user 7"')[0]["age"] != 100
+    assert db.results.stats() == {"entries": 1, "records": len(first), "hits": 2, "misses": 1, "hit_rate": 0.6667}
+
+
+def test_nested_documents_are_copied(db):
+    db.insert("users", {"name": "nested", "addr": {"city": "Kyiv"}})
+    for _ in range(2):  # A miss and a hit
+        db.select("users", '"name" == "nested"')[0]["addr"]["city"] = "changed"
+    assert db.select("users", '"name" == "nested"')[0]["addr"] == {"city": "Kyiv"}
+
+
+def test_writes_invalidate_the_results_of_their_table(db):
+    assert len(db.select("users", '"age" == 20')) == 5
+    db.insert("users", {"name": "new", "age": 20})
+    assert len(db.select("users", '"age" == 20')) == 6
+    db.update("users", '"name" == "new"', {"age": 21})
+    assert len(db.select("users", '"age" == 20')) == 5
+    db.delete("users", '"id" == 1')
+    assert len(db.select("users", '"age" == 20')) == 4
+    db.flush("users")
+    assert len(db.select("users", '"age" == 20')) == 4
+    assert db.results.hits == 0
+
+
+def test_least_recently_used_results_are_evicted():
+    cache = ResultCache(max_records=5)
+    conditions = [parse_condition(f'"id" == {i}') for i in range(3)]
+    for condition in conditions:
+        cache.lookup("users", condition, lambda: [{"id": 1}, {"id": 2}])
+    assert cache.stats()["entries"] == 2 and cache.records == 4
+    cache.lookup("users", conditions[0], lambda: [])  # Evicted, computed again
+    assert cache.misses == 4
+    cache.lookup("users", parse_condition('"id" > 0'), lambda: [{"id": i} for i in range(6)])  # Too large to keep
+    assert cache.records <= 5
+
+
+def test_web_server_selects_use_the_cache(tmp_path):
+    server = DBWebServer(str(tmp_path), result_cache_records=1000)
+    client = server.app.test_client()
+    try:
+        client.post('/insert', json={"table": "users", "object": {"name": "Alice"}})
+        for _ in range(3):
+            assert client.get('/select', query_string={"table": "users", "condition": '"name" == "Alice"'}).get_json()["data"]
+        assert server.core.results.hits == 2
+    finally:
+        server.close()
+        server.core.close()
@@ -0,0 +1,40 @@
+import os
+import pytest
+from src.core_with_binary_tree import Core as IndexedCore
+from src.main_core import Core
+from src.sequence import Sequence
+
+
+@pytest.mark.parametrize("core", [Core, IndexedCore])
+def test_ids_continue_after_restart(tmp_path, core):
+    db = core(str(tmp_path))
+    db.insert("users", {"name": "John Doe"})
+    db.insert("users", {"name": "Jane Doe"})
+    db.close()
+
+    db = core(str(tmp_path))
+    db.insert("users", {"name": "Jim Doe"})
+    db.close()
+
+    assert [obj["id"] for obj in db.storage.read("users")] == [1, 2, 3]
+
+
+def test_reserve_returns_contiguous_block(tmp_path):
+    sequence = Sequence(os.path.join(tmp_path, "users.seq"), block_size=10)
+    assert sequence.next_id() == 1
+    assert sequence.reserve(25) == range(2, 27)
+    assert sequence.next_id() == 27
+
+
+def test_crash_never_reuses_reserved_ids(tmp_path):
+    path = os.path.join(tmp_path, "users.seq")
+    sequence = Sequence(path, block_size=10)
+    handed_out = [sequence.next_id() for _ in range(3)]
+
+    recovered = Sequence(path, block_size=10)  # The process died without any shutdown
+    assert recovered.next_id() > max(handed_out)
+
+
+def test_initial_value_comes_from_existing_table(tmp_path):
+    sequence = Sequence(os.path.join(tmp_path, "users.seq"), initial=lambda: 41)
+    assert sequence.next_id() == 42
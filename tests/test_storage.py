@@ -0,0 +1,238 @@
+import json
+import os
+import pytest
+from src.core_with_binary_tree import Core as IndexedCore
+from src.main_core import Core
+from src.storage import LogStorage
+
+
+def test_insert_appends_one_line(tmp_path):
+    db = Core(str(tmp_path), storage=LogStorage(str(tmp_path), record_format='json'))
+    db.insert("users", {"name": "John Doe", "age": 30})
+    db.insert("users", {"name": "Jane Doe", "age": 25})
+
+    with open(db.storage.path("users"), 'rb') as file:
+        lines = file.read().splitlines()
+
+    assert [json.loads(line)["id"] for line in lines] == [1, 2]
+    db.close()
+
+
+def test_update_appends_new_version(tmp_path):
+    db = Core(str(tmp_path))
+    db.insert("users", {"name": "John Doe", "age": 30})
+    db.insert("users", {"name": "Jane Doe", "age": 25})
+    db.update("users", '"id" == 1', {"age": 31})
+
+    assert db.select("users", '"name" == "John Doe"') == [{"name": "John Doe", "age": 31, "id": 1}]
+    assert [obj["id"] for obj in db.storage.read("users")] == [1, 2]
+    db.close()
+
+
+def test_migrates_legacy_json_table(tmp_path):
+    with open(os.path.join(tmp_path, "users.json"), 'w') as file:
+        json.dump({"users": [{"name": "John Doe", "id": 1}]}, file, indent=4)
+    with open(os.path.join(tmp_path, "users_1.json"), 'w') as file:
+        json.dump({"users": [{"name": "Jane Doe", "id": 2}]}, file, indent=4)
+
+    db = Core(str(tmp_path))
+    db.insert("users", {"name": "Jim Doe"})
+
+    assert [obj["id"] for obj in db.storage.read("users")] == [1, 2, 3]
+    assert os.path.exists(os.path.join(tmp_path, "users.json.migrated"))
+    assert not os.path.exists(os.path.join(tmp_path, "users.json"))
+    db.close()
+
+
+@pytest.mark.parametrize("core", [Core, IndexedCore])
+def test_update_can_not_change_the_id(tmp_path, core):
+    db = core(str(tmp_path))
+    db.insert("users", {"name": "John Doe"})
+
+    with pytest.raises(ValueError):
+        db.update("users", '"id" == 1', {"id": 99})
+    assert db.select("users", '"id" >= 0') == [{"name": "John Doe", "id": 1}]
+    db.close()
+
+
+def test_migrated_records_without_id_get_one(tmp_path):
+    with open(os.path.join(tmp_path, "users.json"), 'w') as file:
+        json.dump({"users": [{"name": "John Doe", "id": 4}, {"name": "Jane Doe"}]}, file, indent=4)
+
+    db = Core(str(tmp_path))
+    db.update("users", '"name" == "Jane Doe"', {"age": 30})
+    db.update("users", '"name" == "Jane Doe"', {"age": 31})
+
+    assert db.select("users", '"name" == "Jane Doe"') == [{"name": "Jane Doe", "id": 5, "age": 31}]
+    db.insert("users", {"name": "Jim Doe"})
+    assert db.select("users", '"name" == "Jim Doe"')[0]["id"] == 6
+    db.close()
+
+
+@pytest.mark.parametrize("record_format", ['json', 'binary'])
+def test_torn_record_is_dropped(tmp_path, record_format):
+    storage = LogStorage(str(tmp_path), record_format=record_format)
+    storage.append("users", {"id": 1})
+    torn = storage._formats["users"].encode_many([{"id": 2, "name": "John Doe"}])[0][:-3]
+    with open(storage.path("users"), 'ab') as file:
+        file.write(torn)
+
+    storage = LogStorage(str(tmp_path), record_format=record_format)
+    storage.append("users", {"id": 3})
+
+    assert storage.read("users") == [{"id": 1}, {"id": 3}]
+    assert LogStorage(str(tmp_path)).read("users") == [{"id": 1}, {"id": 3}]
+
+
+def test_flush_removes_deleted_records(tmp_path):
+    db = Core(str(tmp_path))
+    for i in range(3):
+        db.insert("users", {"name": f"user {i}"})
+    db.delete("users", '"id" == 2')
+    db.flush("users")
+
+    assert [obj["id"] for obj in db.storage.read("users")] == [1, 3]
+    db.close()
+
+
+def test_insert_many_assigns_contiguous_ids(tmp_path):
+    db = Core(str(tmp_path))
+    db.insert("users", {"name": "John Doe"})
+    db.insert_many("users", [{"name": f"user {i}"} for i in range(3)])
+
+    assert [obj["id"] for obj in db.storage.read("users")] == [1, 2, 3, 4]
+    db.close()
+
+
+def test_insert_many_query(tmp_path):
+    from src.query_language import QueryExecutor
+    db = Core(str(tmp_path))
+    QueryExecutor(db).execute("insert many users [{'name': 'John Doe'}, {'name': 'Jane Doe'}]")
+
+    assert db.select("users", '"name" == "Jane Doe"') == [{"name": "Jane Doe", "id": 2}]
+    db.close()
+
+
+def test_offsets_sidecar_is_reused(tmp_path):
+    storage = LogStorage(str(tmp_path))
+    storage.append_many("users", [{"id": 1, "bio": "{not a brace}\n\"quoted\""}, {"id": 2}])
+    storage.append("users", {"id": 1, "bio": "}{"})
+    assert storage.read("users") == [{"id": 1, "bio": "}{"}, {"id": 2}]
+    assert os.path.getsize(os.path.join(tmp_path, "users.0.offsets")) == 3 * 16
+
+    storage = LogStorage(str(tmp_path))
+    storage.append("users", {"id": 3})
+    scanned = []
+    scan_offsets = storage._scan_offsets
+    storage._scan_offsets = lambda record_format, path, start: scanned.append(start) or scan_offsets(record_format, path, start)
+
+    assert [obj["id"] for obj in storage.read("users")] == [1, 2, 3]
+    assert scanned == []  # The offsets of the appended record were recorded by the append itself
+
+
+def test_stale_offsets_sidecar_is_discarded(tmp_path):
+    storage = LogStorage(str(tmp_path), record_format='json')
+    storage.append_many("users", [{"id": 1}, {"id": 2}, {"id": 3}])
+    storage.read("users")
+    with open(storage.path("users"), 'wb') as file:
+        file.write(b'{"id": 7}\n')
+
+    assert LogStorage(str(tmp_path)).read("users") == [{"id": 7}]
+
+
+def test_mapped_reads_follow_appends_and_rewrites(tmp_path):
+    storage = LogStorage(str(tmp_path), record_format='json')
+    first = storage.append("users", {"id": 1, "name": "Олександр"})
+    assert storage.read_at("users", first) == {"id": 1, "name": "Олександр"}
+
+    second = storage.append("users", {"id": 2})  # Past the end of the current map
+    assert storage.read_at("users", second) == {"id": 2}
+
+    storage.rewrite("users", [{"id": 2, "name": "rewritten"}])
+    assert storage.read_at("users", storage.locations("users")[0]) == {"id": 2, "name": "rewritten"}
+
+
+def test_full_segments_are_sealed(tmp_path):
+    storage = LogStorage(str(tmp_path), segment_size=50)
+    for i in range(1, 11):
+        storage.append("users", {"id": i, "name": f"user {i}"})
+    storage.append("users", {"id": 3, "name": "updated"})
+
+    segments = storage.segments("users")
+    assert len(segments) > 1 and all(segment["sealed"] for segment in segments[:-1])
+    assert sum(segment["records"] for segment in segments) == 11
+    assert segments[0]["min_id"] == 1
+
+    for storage in (storage, LogStorage(str(tmp_path), segment_size=50)):  # Also after a restart, from the manifest
+        records = storage.read("users")
+        assert [obj["id"] for obj in records] == list(range(1, 11))
+        assert records[2]["name"] == "updated"
+        assert [storage.read_at("users", location)["id"] for location in storage.locations("users")] == list(range(1, 11))
+
+
+def test_rewrite_replaces_all_segments(tmp_path):
+    storage = LogStorage(str(tmp_path), segment_size=50)
+    storage.append_many("users", [{"id": i, "name": f"user {i}"} for i in range(1, 11)])
+    storage.append_many("users", [{"id": i} for i in range(11, 21)])
+    old_files = [segment["file"] for segment in storage.segments("users")]
+
+    storage.rewrite("users", [{"id": i} for i in range(1, 21) if i % 2])
+
+    assert not any(os.path.exists(os.path.join(tmp_path, file)) for file in old_files)
+    assert [obj["id"] for obj in LogStorage(str(tmp_path)).read("users")] == list(range(1, 21, 2))
+
+
+def test_log_from_before_segments_is_adopted(tmp_path):
+    with open(os.path.join(tmp_path, "users.log"), 'w') as file:
+        file.write('{"id": 1}\n{"id": 2}\n')
+
+    storage = LogStorage(str(tmp_path))
+    storage.append("users", {"id": 3})
+
+    assert [obj["id"] for obj in LogStorage(str(tmp_path)).read("users")] == [1, 2, 3]
+    assert storage.segments("users")[0]["file"] == "users.log"
+
+
+def test_binary_records_round_trip(tmp_path):
+    records = [
+        {"id": 1, "name": "Олександр", "age": 23, "score": -1.5, "admin": False, "email": None},
+        {"id": 2, "name": "it's \"quoted\"\n", "tags": ["a", 1, [True]], "address": {"city": "Kyiv", "zip": -300},
+         "big": 2 ** 70, "negative": -2 ** 70},
+    ]
+    storage = LogStorage(str(tmp_path))
+    storage.append_many("users", records)
+
+    assert storage.read("users") == records
+    assert LogStorage(str(tmp_path)).read("users") == records  # Field dictionary and offsets from disk
+    assert LogStorage(str(tmp_path)).read_at("users", storage.locations("users")[1]) == records[1]
+
+
+def test_binary_records_are_smaller_than_json(tmp_path):
+    records = [{"name": f"user {i}", "age": i % 60, "email": f"user{i}@example.com"} for i in range(100)]
+    sizes = {}
+    for record_format in ('json', 'binary'):
+        os.makedirs(tmp_path / record_format)
+        storage = LogStorage(str(tmp_path / record_format), record_format=record_format)
+        storage.append_many("users", records)
+        sizes[record_format] = os.path.getsize(storage.path("users"))
+
+    assert sizes['binary'] < sizes['json'] * 0.7
+
+
+def test_rewrite_converts_json_tables_and_export_writes_json(tmp_path):
+    storage = LogStorage(str(tmp_path), record_format='json')
+    storage.append_many("users", [{"id": 1, "name": "John Doe"}, {"id": 2, "name": "Jane Doe"}])
+
+    def table_format():
+        with open(os.path.join(tmp_path, "users.manifest")) as file:
+            return json.load(file)["format"]
+
+    storage = LogStorage(str(tmp_path))
+    storage.append("users", {"id": 3})
+    assert table_format() == 'json'  # Existing tables keep JSON
+    storage.rewrite("users", [obj for obj in storage.read("users") if obj["id"] < 3])
+    assert table_format() == 'binary'
+
+    storage.export("users", os.path.join(tmp_path, "users.export.json"))
+    with open(os.path.join(tmp_path, "users.export.json")) as file:
+        assert json.load(file) == {"users": [{"id": 1, "name": "John Doe"}, {"id": 2, "name": "Jane Doe"}]}
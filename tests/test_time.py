@@ -1,10 +0,0 @@
-import time
-
-def _timer(func):
-    def wrapper(*args, **kwargs):
-        start = time.time()
-        result = func(*args, **kwargs)
-        end = time.time()
-        print(f"Function {func.__name__} executed in {end - start:.5f} seconds")
-        return result
-    return wrapper
\ No newline at end of file
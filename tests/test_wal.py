@@ -0,0 +1,124 @@
+import os
+import threading
+import time
+from src.main_core import Core
+from src.storage import LogStorage
+from src.wal import WriteAheadLog
+
+
+def _crash(db):
+    """
+    Simulates a crash: the table files lose everything that was not checkpointed, the log is kept.
+    """
+    db.wal.file.close()
+    db.storage.reader.close()
+    with open(db.storage.path("users"), 'r+b') as file:
+        file.truncate(0)
+
+
+def test_writes_are_replayed_after_a_crash(tmp_path):
+    db = Core(str(tmp_path), wal=True, compaction_interval=None)
+    db.insert_many("users", [{"name": f"user {i}", "age": i} for i in range(10)])
+    db.update("users", '"id" == 1', {"name": "John Doe"})
+    db.delete("users", '"id" == 2')
+    _crash(db)
+
+    db = Core(str(tmp_path), wal=True)
+    results = db.select("users", '"id" >= 1')
+    assert [obj["id"] for obj in results] == [1] + list(range(3, 11))
+    assert results[0]["name"] == "John Doe"
+    db.close()
+
+
+def test_replay_is_idempotent(tmp_path):
+    db = Core(str(tmp_path), wal=True, compaction_interval=None)
+    db.insert("users", {"name": "John Doe"})
+    db.update("users", '"id" == 1', {"name": "John Smith"})
+    db.wal.file.close()  # Crash after the table files were written
+
+    for _ in range(2):
+        db = Core(str(tmp_path), wal=True, compaction_interval=None)
+    assert db.select("users", '"id" == 1') == [{"name": "John Smith", "id": 1}]
+    db.close()
+
+
+def test_checkpoint_empties_the_log(tmp_path):
+    db = Core(str(tmp_path), wal=True, compaction_interval=None)
+    db.insert_many("users", [{"name": f"user {i}"} for i in range(3)])
+    db.delete("users", '"id" == 1')
+    db.checkpoint()
+
+    assert db.wal.replay() == []
+    db.wal.file.close()
+    db = Core(str(tmp_path), wal=True)
+    assert [obj["id"] for obj in db.select("users", '"id" >= 1')] == [2, 3]
+    db.close()
+
+
+def _slow_fsync(monkeypatch):
+    fsync = os.fsync
+    monkeypatch.setattr(os, "fsync", lambda fd: time.sleep(0.002) or fsync(fd))  # Gives the other writers time to queue up
+
+
+def _run(threads):
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def test_concurrent_commits_share_fsyncs(tmp_path, monkeypatch):
+    _slow_fsync(monkeypatch)
+    wal = WriteAheadLog(str(tmp_path / "wal.log"))
+
+    def write(worker):
+        for i in range(50):
+            wal.commit({"table": "users", "op": "put", "records": [{"id": worker * 100 + i}]})
+
+    _run([threading.Thread(target=write, args=(worker,)) for worker in range(8)])
+
+    assert len(wal.replay()) == 400
+    assert wal.durable == 400 and wal.syncs < 200
+    wal.close()
+
+
+def test_writers_of_one_table_share_fsyncs(tmp_path, monkeypatch):
+    _slow_fsync(monkeypatch)
+    db = Core(str(tmp_path), wal=True, compaction_interval=None)
+
+    def write(worker):
+        for i in range(50):
+            db.insert("users", {"worker": worker, "i": i})
+
+    _run([threading.Thread(target=write, args=(worker,)) for worker in range(8)])
+
+    assert len(db.select("users", '"id" >= 1')) == 400
+    assert db.wal.syncs < 200  # The table lock is not held while a writer waits for its fsync
+    db.close()
+
+
+def test_torn_entry_is_ignored(tmp_path):
+    wal = WriteAheadLog(str(tmp_path / "wal.log"))
+    wal.commit({"table": "users", "op": "put", "records": [{"id": 1}]})
+    wal.file.write(b'{"table": "users", "op": "pu')
+    wal.file.flush()
+
+    assert wal.replay() == [{"table": "users", "op": "put", "records": [{"id": 1}]}]
+    wal.close()
+
+
+def test_recovery_syncs_the_replayed_tables(tmp_path):
+    db = Core(str(tmp_path), wal=True, compaction_interval=None)
+    db.insert("users", {"name": "John Doe"})
+    _crash(db)
+
+    synced = []
+    sync = LogStorage.sync
+    LogStorage.sync = lambda storage, table_name: synced.append(table_name) or sync(storage, table_name)
+    try:
+        db = Core(str(tmp_path), wal=True)
+    finally:
+        LogStorage.sync = sync
+    assert synced == ["users"]  # Before the log was emptied
+    assert db.wal.replay() == []
+    db.close()
@@ -0,0 +1,43 @@
+import asyncio
+import pytest
+from main import NoSQLDatabase
+from src.wire_client import WireClient, WireClientPool
+from src.wire_server import WireServer
+
+
+def _serve(tmp_path, scenario):
+    async def run():
+        db = NoSQLDatabase(str(tmp_path))
+        server = WireServer(db, port=0)
+        await server.start()
+        try:
+            return await scenario(server)
+        finally:
+            await server.close()
+            db.core.close()
+    return asyncio.run(run())
+
+
+def test_commands_over_the_wire(tmp_path):
+    async def scenario(server):
+        async with WireClient(port=server.port) as client:
+            assert await client.execute("insert users {\"name\": \"John Doe\", \"age\": 30}") is None
+            await client.execute('update users set {"age": 31} where "id" == 1')
+            assert await client.execute('select users where "age" > 30') == [{"name": "John Doe", "age": 31, "id": 1}]
+            with pytest.raises(ValueError, match="does not exist"):
+                await client.execute('select orders where "id" == 1')
+            assert await client.execute('select users where "id" == 1') == [{"name": "John Doe", "age": 31, "id": 1}]
+    _serve(tmp_path, scenario)
+
+
+def test_pipelined_requests_are_answered_in_order(tmp_path):
+    async def scenario(server):
+        async with WireClient(port=server.port) as client:
+            queries = [f'insert users {{"n": {i}}}' for i in range(100)] + ['select users where "n" >= 50']
+            results = await client.execute_many(queries)  # All sent before the first response arrives
+            assert [obj["n"] for obj in results[-1]] == list(range(50, 100))
+
+        async with WireClientPool(port=server.port, size=3) as pool:
+            results = await pool.execute_many([f'select users where "n" == {i}' for i in range(30)])
+            assert [result[0]["n"] for result in results] == list(range(30))
+    _serve(tmp_path, scenario)